@@ -0,0 +1,183 @@
+import asyncio
+import serial
+import time
+from typing import Any, Callable, Optional, Tuple, Union
+from .main import *
+from .main import _uint16
+
+
+def _synchronize(port: serial.Serial, deadline: float) -> None:
+    # The handshake of PMDAxisInterface, run on the port in blocking mode
+    interface = PMDAxisInterface()
+    interface._mc = port
+    interface._synchronize(time.monotonic() + deadline)
+
+
+class PMDAsyncSerialTransport:
+    # Non-blocking serial port driven by the event loop: incoming bytes are collected by a reader callback on the
+    # port's file descriptor, so waiting for a response never blocks the loop. Requires a selector event loop
+    # (the default everywhere except Windows). port is a port name or an open serial.Serial.
+    def __init__(self, port: Union[str, serial.Serial], baudrate: int = 115200):
+        self._loop = asyncio.get_running_loop()
+        self._mc = serial.Serial(port, baudrate) if isinstance(port, str) else port
+        self._buffer = bytearray()
+        self._waiter = None
+        self._wanted = 0
+        self._attach()
+
+    def _attach(self) -> None:
+        self._mc.timeout = 0
+        self._mc.write_timeout = None
+        self._buffer.clear()
+        self._loop.add_reader(self._mc.fileno(), self._on_readable)
+
+    async def synchronize(self, deadline: float) -> None:
+        # Brings the stream into frame with the handshake of PMDAxisInterface, which runs on an executor thread
+        # while the port is detached from the event loop; PMDCommunicationError if that fails within deadline
+        # seconds.
+        self._loop.remove_reader(self._mc.fileno())
+        try:
+            await self._loop.run_in_executor(None, _synchronize, self._mc, deadline)
+        finally:
+            self._attach()
+
+    def discard(self) -> None:
+        # Drops bytes that arrived outside an exchange, such as the rest of a response that timed out.
+        self._buffer.clear()
+
+    def _on_readable(self) -> None:
+        self._buffer += self._mc.read(max(self._mc.in_waiting, 1))
+        if self._waiter is not None and not self._waiter.done() and len(self._buffer) >= self._wanted:
+            self._waiter.set_result(None)
+
+    def write(self, data: bytes) -> None:
+        self._mc.write(data)
+
+    async def read(self, length: int, timeout: float) -> bytes:
+        if len(self._buffer) < length:
+            self._waiter = self._loop.create_future()
+            self._wanted = length
+            try:
+                await asyncio.wait_for(self._waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._waiter = None
+        data = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        return data
+
+    def close(self) -> None:
+        self._loop.remove_reader(self._mc.fileno())
+        self._mc.close()
+
+
+class AsyncPMDAxisInterface(PMDCommandSet):
+    # Coroutine version of PMDAxisInterface, e.g. position = await pmd.GetActualPosition(AXIS1). Commands from any
+    # number of coroutines go through one request queue, which a single worker task drains in order, so there is
+    # never more than one exchange on the wire.
+    #
+    # After a response times out or fails its checksum the stream is brought back into frame, as during setup,
+    # before the next command goes out; resync_deadline bounds that handshake.
+    def __init__(self, timeout: float = 0.1, resync_deadline: float = 0.5):
+        self.timeout = timeout
+        self.resync_deadline = resync_deadline
+        self._transport = None
+        self._queue = None
+        self._worker = None
+
+    async def _run(self) -> None:
+        in_frame = True
+        result = None
+        try:
+            while True:
+                packet, length, result, settle_time = await self._queue.get()
+                if result.cancelled():
+                    continue
+                try:
+                    if not in_frame:
+                        await self._transport.synchronize(self.resync_deadline)
+                        in_frame = True
+                    self._transport.discard()
+                    self._transport.write(packet)
+                    response = await self._transport.read(length, self.timeout)
+                    PMDAxisInterface._verify_response(response)
+                    if response[0] == 0 and len(response) < length:
+                        raise PMDTimeoutError('timeout waiting for motion controller to respond')
+                except PMDCommunicationError as e:
+                    in_frame = False
+                    if not result.done():
+                        result.set_exception(e)
+                except Exception as e:
+                    if not result.done():
+                        result.set_exception(e)
+                else:
+                    if not result.done():
+                        result.set_result(response)
+                if settle_time:
+                    await asyncio.sleep(settle_time)
+        except asyncio.CancelledError:
+            if result is not None and not result.done():
+                result.set_exception(PMDCommunicationError('interface was closed'))
+            raise
+
+    def _submit(self, command: PMDCommand, axis: int = 0, *arguments: int, settle_time: float = 0) -> asyncio.Future:
+        if self._transport is None:
+            raise PMDCommunicationError('interface is not open')
+        packet = command.build(axis, *arguments)
+        result = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((packet, command.response_length, result, settle_time))
+        return result
+
+    @staticmethod
+    def _check_response(command: PMDCommand, response: bytes) -> bytes:
+        if response[0] != 0:
+            raise PMDCommandError(command.name, response[0])
+        return response
+
+    async def _transact(
+        self, command: PMDCommand, axis: int = 0, *arguments: int, decode: Optional[Callable[[bytes], Any]] = None
+    ) -> Any:
+        response = self._check_response(command, await self._submit(command, axis, *arguments))
+        return decode(response) if decode is not None else None
+
+    async def SetupAxisInterface_Serial(self, port: str, baudrate: int, deadline: float = 1.0) -> None:
+        # Same handshake and deadline as PMDAxisInterface.SetupAxisInterface; the port is closed if it fails.
+        transport = PMDAsyncSerialTransport(serial.Serial(port, baudrate), baudrate)
+        try:
+            await transport.synchronize(deadline)
+        except BaseException:
+            transport.close()
+            raise
+        self._transport = transport
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.ensure_future(self._run())
+
+    async def CloseAxisInterface(self) -> None:
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            result = self._queue.get_nowait()[2]
+            if not result.done():
+                result.set_exception(PMDCommunicationError('interface was closed'))
+        self._transport.close()
+        self._transport = None
+        self._worker = None
+
+    @staticmethod
+    def GetPYMotionVersion() -> Tuple[int, int]:
+        return PMDAxisInterface.GetPYMotionVersion()
+
+    async def Reset(self) -> None:
+        # queue GetInstructionError right behind the reset so that nothing else can clear the register in between
+        reset, instruction_error = await asyncio.gather(
+            self._submit(PMD_COMMAND_RESET, settle_time=0.4),  # wait 400ms for chip to reset
+            self._submit(PMD_COMMAND_GETINSTRUCTIONERROR),
+        )
+        self._check_response(PMD_COMMAND_RESET, reset)
+        error_code = _uint16(self._check_response(PMD_COMMAND_GETINSTRUCTIONERROR, instruction_error))
+        if error_code != PMD_ERROR_RESET:
+            raise PMDCommandError("Reset", error_code)
@@ -0,0 +1,165 @@
+import time
+from typing import Optional
+from .main import *
+
+
+class PMDAxisHandle:
+    # One axis of an interface together with what was last known about it, so that code driving many axes does not
+    # have to keep that state in dictionaries of its own:
+    #
+    #   x = PMDAxisHandle(pmd, AXIS1).refresh()
+    #   x.move_to(10000, velocity, acceleration).wait()
+    #   print(x.actual_position, x.activity_status)
+    #
+    # Every operation is one batch, so a move is a single pipelined exchange; with a PMDRegisterShadow that elides
+    # writes the profile registers that already hold the requested values are not even sent. Values are register
+    # values as in PMDAxisInterface (see PMDProfilePlanner for physical units). The cached state is what the handle
+    # itself last wrote or read; refresh() catches up with changes made by any other means.
+    __slots__ = (
+        'interface', 'axis', 'profile_mode', 'position', 'velocity', 'acceleration', 'jerk', 'actual_position',
+        'activity_status', 'event_status', 'refreshed',
+    )
+
+    def __init__(self, interface: PMDCommandSet, axis: PMDAxis):
+        self.interface = interface
+        self.axis = axis
+        self.profile_mode = None  # PMDProfileMode
+        self.position = None  # target of the last move
+        self.velocity = None
+        self.acceleration = None
+        self.jerk = None
+        self.actual_position = None
+        self.activity_status = None  # PMDActivityStatus
+        self.event_status = None  # PMDEventStatus
+        self.refreshed = None  # time.monotonic() of the last read of the status registers
+
+    def __repr__(self) -> str:
+        return f'PMDAxisHandle({self.axis.name}, position={self.position}, actual_position={self.actual_position}, ' \
+               f'activity_status={self.activity_status!r})'
+
+    @property
+    def in_motion(self) -> Optional[bool]:
+        return None if self.activity_status is None else self.activity_status.in_motion
+
+    def refresh(self, profile: bool = True) -> 'PMDAxisHandle':
+        # Reads the status registers and, unless profile is False, the profile registers, in one batch.
+        axis = self.axis
+        with self.interface.batch() as batch:
+            actual_position = batch.GetActualPosition(axis)
+            activity_status = batch.GetActivityStatus(axis)
+            event_status = batch.GetEventStatus(axis)
+            if profile:
+                profile_mode = batch.GetProfileMode(axis)
+                position = batch.GetPosition(axis)
+                velocity = batch.GetVelocity(axis)
+                acceleration = batch.GetAcceleration(axis)
+                jerk = batch.GetJerk(axis)
+        self._status(actual_position.result(), activity_status.result(), event_status.result())
+        if profile:
+            self.profile_mode = profile_mode.result()
+            self.position = position.result()
+            self.velocity = velocity.result()
+            self.acceleration = acceleration.result()
+            self.jerk = jerk.result()
+        return self
+
+    def _status(
+        self, actual_position: int, activity_status: PMDActivityStatus, event_status: Optional[PMDEventStatus] = None
+    ) -> None:
+        self.actual_position = actual_position
+        self.activity_status = activity_status
+        if event_status is not None:
+            self.event_status = event_status
+        self.refreshed = time.monotonic()
+
+    def move_to(
+        self,
+        position: int,
+        velocity: Optional[int] = None,
+        acceleration: Optional[int] = None,
+        jerk: Optional[int] = None,
+    ) -> 'PMDAxisHandle':
+        # Starts a trapezoidal move, or an S-curve one when jerk is given. Profile values left out keep what the axis
+        # already holds.
+        mode = PMDProfileMode.S_CURVE if jerk is not None else PMDProfileMode.TRAPEZOIDAL
+        axis = self.axis
+        with self.interface.batch() as batch:
+            batch.SetProfileMode(axis, mode)
+            batch.SetPosition(axis, position)
+            if velocity is not None:
+                batch.SetVelocity(axis, velocity)
+            if acceleration is not None:
+                batch.SetAcceleration(axis, acceleration)
+            if jerk is not None:
+                batch.SetJerk(axis, jerk)
+            batch.Update(axis)
+        self.profile_mode = mode
+        self.position = position
+        if velocity is not None:
+            self.velocity = velocity
+        if acceleration is not None:
+            self.acceleration = acceleration
+        if jerk is not None:
+            self.jerk = jerk
+        return self
+
+    def move_by(
+        self,
+        distance: int,
+        velocity: Optional[int] = None,
+        acceleration: Optional[int] = None,
+        jerk: Optional[int] = None,
+    ) -> 'PMDAxisHandle':
+        # Moves distance counts on from the target of the last move.
+        if self.position is None:
+            self.position = self.interface.GetPosition(self.axis)
+        return self.move_to(self.position + distance, velocity, acceleration, jerk)
+
+    def jog(self, velocity: int, acceleration: Optional[int] = None) -> 'PMDAxisHandle':
+        # Runs at velocity, whose sign gives the direction, until stopped or jogged at another velocity.
+        axis = self.axis
+        with self.interface.batch() as batch:
+            batch.SetProfileMode(axis, PMDProfileMode.VELOCITY_CONTOURING)
+            batch.SetVelocity(axis, velocity)
+            if acceleration is not None:
+                batch.SetAcceleration(axis, acceleration)
+            batch.Update(axis)
+        self.profile_mode = PMDProfileMode.VELOCITY_CONTOURING
+        self.velocity = velocity
+        if acceleration is not None:
+            self.acceleration = acceleration
+        return self
+
+    def stop(self, abrupt: bool = False) -> 'PMDAxisHandle':
+        # Decelerates to a stop at the current acceleration, or with abrupt=True stops at once.
+        mode = PMDStopMode.ABRUPT_STOP if abrupt else PMDStopMode.SMOOTH_STOP
+        with self.interface.batch() as batch:
+            batch.SetStopMode(self.axis, mode)
+            batch.Update(self.axis)
+        return self
+
+    def home(self, position: int = 0) -> 'PMDAxisHandle':
+        # Declares where the axis stands to be position, without moving it.
+        axis = self.axis
+        with self.interface.batch() as batch:
+            batch.SetActualPosition(axis, position)
+            batch.SetPosition(axis, position)
+            activity_status = batch.GetActivityStatus(axis)
+        self.position = position
+        self._status(position, activity_status.result())
+        return self
+
+    def wait(self, timeout: Optional[float] = None, poll_interval: float = 0.01) -> 'PMDAxisHandle':
+        # Waits for the axis to stop moving; TimeoutError after timeout seconds.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        axis = self.axis
+        while True:
+            with self.interface.batch() as batch:
+                actual_position = batch.GetActualPosition(axis)
+                activity_status = batch.GetActivityStatus(axis)
+            self._status(actual_position.result(), activity_status.result())
+            if not self.activity_status.in_motion:
+                return self
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f'{axis.name} still in motion after {timeout} seconds')
+            time.sleep(poll_interval)
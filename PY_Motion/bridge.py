@@ -0,0 +1,394 @@
+import os
+import queue
+import socket
+import struct
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, List, Optional, Tuple, Union
+from .main import *
+from .main import _PMDRegisterPlan
+
+# Every message is a header followed by a payload. A request carries a command packet exactly as it goes to the
+# motion controller; its reply carries the response exactly as it came back, or the kind of failure.
+#
+#   request  request id (uint32), packet length (uint8), packet
+#   reply    request id (uint32), kind (uint8), payload length (uint8), payload
+#
+# Requests on one connection may be pipelined; replies carry the id of their request and arrive in order per client.
+_REQUEST = struct.Struct('>IB')
+_REPLY = struct.Struct('>IBB')
+_RESPONSE = 0  # payload is the response
+_COMMAND_ERROR = 1  # payload is the error code the motion controller returned
+_TIMEOUT = 2  # payload is the message of the PMDTimeoutError
+_CHECKSUM = 3  # payload is the message of the PMDChecksumError
+_COMMUNICATION_ERROR = 4  # payload is the message of any other PMDCommunicationError or of a bad request
+
+
+def _address_family(address: Union[str, Tuple[str, int]]) -> int:
+    return socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+
+
+def _receive(connection: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return bytes(data)
+
+
+def _reply(request_id: int, kind: int, payload: bytes) -> bytes:
+    return _REPLY.pack(request_id, kind, len(payload)) + payload
+
+
+def _error_reply(request_id: int, error: Exception) -> bytes:
+    if isinstance(error, PMDCommandError):
+        return _reply(request_id, _COMMAND_ERROR, bytes((error.error_code,)))
+    kind = _TIMEOUT if isinstance(error, PMDTimeoutError) else _CHECKSUM if isinstance(error, PMDChecksumError) else \
+        _COMMUNICATION_ERROR
+    return _reply(request_id, kind, str(error).encode()[:255])
+
+
+class _PMDBridgeConnection:
+    def __init__(self, connection: socket.socket):
+        self.connection = connection
+        self.lock = threading.Lock()
+
+    def send(self, data: bytes) -> None:
+        with self.lock:
+            try:
+                self.connection.sendall(data)
+            except OSError:
+                pass  # the client is gone; its reader notices
+
+
+class PMDBridgeServer:
+    # Shares one PMDAxisInterface, and with it one serial port, between any number of local processes over a TCP
+    # (address is a (host, port) tuple) or Unix (address is a path) socket:
+    #
+    #   with PMDBridgeServer(pmd, '/run/pymotion.sock'):
+    #       ...  # clients use PMDBridgeClient('/run/pymotion.sock')
+    #
+    # Requests from all clients are queued and sent to the motion controller in pipelined batches of up to
+    # max_batch commands. Identical reads waiting in the same batch are merged into one exchange, unless a
+    # command that is not a read was queued between them.
+    def __init__(self, interface: PMDAxisInterface, address: Union[str, Tuple[str, int]], max_batch: int = 64):
+        self.interface = interface
+        self.address = address
+        self.max_batch = max_batch
+        self.requests = 0
+        self.merged = 0  # requests answered by another request's exchange
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._stopping = threading.Event()
+        self._socket = None
+        self._threads = []
+        self._connections = set()
+
+    def __enter__(self) -> 'PMDBridgeServer':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        if self._socket is not None:
+            return
+        self._stopping.clear()
+        listener = socket.socket(_address_family(self.address), socket.SOCK_STREAM)
+        if isinstance(self.address, str):
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+        else:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(self.address)
+        listener.listen()
+        self.address = listener.getsockname()  # the port actually bound if 0 was asked for
+        self._socket = listener
+        self._threads = [
+            threading.Thread(target=self._accept, name='PMDBridgeServer-accept', daemon=True),
+            threading.Thread(target=self._dispatch, name='PMDBridgeServer-dispatch', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self) -> None:
+        if self._socket is None:
+            return
+        self._stopping.set()
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+        for connection in list(self._connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for thread in self._threads:
+            thread.join()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+        self._socket = None
+        self._threads = []
+
+    def _accept(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                return
+            if connection.family != socket.AF_UNIX:
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._connections.add(connection)
+            threading.Thread(
+                target=self._serve, args=(connection,), name='PMDBridgeServer-client', daemon=True
+            ).start()
+
+    def _serve(self, connection: socket.socket) -> None:
+        client = _PMDBridgeConnection(connection)
+        try:
+            while True:
+                request_id, length = _REQUEST.unpack(_receive(connection, _REQUEST.size))
+                packet = _receive(connection, length)
+                command = PMD_COMMANDS.get(packet[3]) if length >= 4 else None
+                if command is None or length != command.packet.size or sum(packet) & 0xFF:
+                    client.send(_reply(request_id, _COMMUNICATION_ERROR, b'malformed request'))
+                    continue
+                self._queue.put((client, request_id, command, packet))
+        except (EOFError, OSError):
+            pass
+        finally:
+            self._connections.discard(connection)
+            connection.close()
+
+    def _dispatch(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                requests = [self._queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            while len(requests) < self.max_batch:
+                try:
+                    requests.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.requests += len(requests)
+            self.batches += 1
+            self._execute(requests)
+
+    def _execute(self, requests: List[Tuple[_PMDBridgeConnection, int, PMDCommand, bytes]]) -> None:
+        exchanges = []  # (command, packet, [(client, request id)]) in the order they go to the motion controller
+        reads = {}  # packet -> exchange, for the current run of reads
+        for client, request_id, command, packet in requests:
+            if command.opcode == PMD_COMMAND_RESET.opcode:
+                # Reset waits for the chip to come back up, so it is performed on its own
+                self._run(exchanges)
+                exchanges, reads = [], {}
+                try:
+                    self.interface.Reset()
+                    reply = _reply(request_id, _RESPONSE, b'\x00\x00')
+                except (PMDCommunicationError, PMDCommandError) as e:
+                    reply = _error_reply(request_id, e)
+                client.send(reply)
+                continue
+            if command.opcode not in PMD_READ_ONLY_COMMANDS:
+                reads = {}
+            elif packet in reads:
+                reads[packet][2].append((client, request_id))
+                self.merged += 1
+                continue
+            exchange = (command, packet, [(client, request_id)])
+            exchanges.append(exchange)
+            if command.opcode in PMD_READ_ONLY_COMMANDS:
+                reads[packet] = exchange
+        self._run(exchanges)
+
+    def _run(self, exchanges: List[Tuple[PMDCommand, bytes, List[Tuple[_PMDBridgeConnection, int]]]]) -> None:
+        if not exchanges:
+            return
+        batch = self.interface.batch()
+        futures = []
+        for command, packet, _ in exchanges:
+            axis, _, *arguments = command.packet.unpack(packet)
+            futures.append(batch._transact(command, axis, *arguments, decode=bytes))
+        try:
+            batch.execute()
+        except Exception:
+            pass  # every future holds its own outcome
+        replies = {}
+        for (_, _, waiters), future in zip(exchanges, futures):
+            error = future.exception()
+            for client, request_id in waiters:
+                reply = _error_reply(request_id, error) if error is not None else \
+                    _reply(request_id, _RESPONSE, future.result())
+                replies.setdefault(client, []).append(reply)
+        for client, data in replies.items():
+            client.send(b''.join(data))
+
+
+class PMDBridgeClient(PMDCommandSet):
+    # PMDAxisInterface look-alike that performs its commands through a PMDBridgeServer. Commands from any number of
+    # threads are pipelined on one connection; batch() sends its commands back to back without waiting in between.
+    def __init__(self, address: Union[str, Tuple[str, int]], timeout: float = 5.0):
+        self.address = address
+        self.timeout = timeout  # seconds to wait for a reply
+        self.lock = threading.RLock()
+        self._register_plans = {}
+        self._pending = {}  # request id -> Future of (kind, payload)
+        self._next_id = 0
+        self._send_lock = threading.Lock()
+        self._socket = socket.socket(_address_family(address), socket.SOCK_STREAM)
+        self._socket.connect(address)
+        if self._socket.family != socket.AF_UNIX:
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = threading.Thread(target=self._read, name='PMDBridgeClient', daemon=True)
+        self._reader.start()
+
+    def __enter__(self) -> 'PMDBridgeClient':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.CloseAxisInterface()
+
+    def CloseAxisInterface(self) -> None:
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+        self._reader.join()
+
+    GetPYMotionVersion = staticmethod(PMDAxisInterface.GetPYMotionVersion)
+
+    def _read(self) -> None:
+        try:
+            while True:
+                request_id, kind, length = _REPLY.unpack(_receive(self._socket, _REPLY.size))
+                payload = _receive(self._socket, length)
+                future = self._pending.pop(request_id, None)
+                if future is not None:
+                    future.set_result((kind, payload))
+        except (EOFError, OSError):
+            pass
+        with self._send_lock:
+            pending, self._pending = self._pending, {}
+            self._socket.close()
+        for future in pending.values():
+            future.set_exception(PMDCommunicationError('connection to the bridge server was lost'))
+
+    def _submit(self, packets: List[bytes]) -> List[Future]:
+        # Sends the packets in one write; a Future of (kind, payload) per packet.
+        futures = []
+        data = bytearray()
+        with self._send_lock:
+            if self._socket.fileno() < 0:
+                raise PMDCommunicationError('connection to the bridge server was lost')
+            for packet in packets:
+                request_id = self._next_id
+                self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+                future = self._pending[request_id] = Future()
+                futures.append(future)
+                data += _REQUEST.pack(request_id, len(packet))
+                data += packet
+            try:
+                self._socket.sendall(data)
+            except OSError as e:
+                raise PMDCommunicationError('connection to the bridge server was lost') from e
+        return futures
+
+    def _response(self, command: PMDCommand, future: Future) -> bytes:
+        try:
+            kind, payload = future.result(self.timeout)
+        except FutureTimeoutError:
+            raise PMDTimeoutError('timeout waiting for the bridge server to respond') from None
+        if kind == _RESPONSE:
+            return payload
+        if kind == _COMMAND_ERROR:
+            raise PMDCommandError(command.name, payload[0])
+        error = {_TIMEOUT: PMDTimeoutError, _CHECKSUM: PMDChecksumError}.get(kind, PMDCommunicationError)
+        raise error(payload.decode())
+
+    def _transact(
+        self, command: PMDCommand, axis: int = 0, *arguments: int, decode: Optional[Callable[[bytes], Any]] = None
+    ) -> Any:
+        future, = self._submit([command.build(axis, *arguments)])
+        response = self._response(command, future)
+        return decode(response) if decode is not None else None
+
+    def Reset(self) -> None:
+        # the server performs the whole reset sequence of PMDAxisInterface.Reset
+        return self._transact(PMD_COMMAND_RESET)
+
+    def batch(self) -> 'PMDBridgeBatch':
+        return PMDBridgeBatch(self)
+
+    def _execute_plan(self, plan: _PMDRegisterPlan) -> bytes:
+        packets = [plan.packets[offset:offset + command.packet.size] for command, offset, _, _ in plan.pending]
+        futures = self._submit(packets)
+        responses = [self._response(command, future) for (command, _, _, _), future in zip(plan.pending, futures)]
+        return b''.join(responses)
+
+    # The multi-axis register and bulk buffer helpers of PMDAxisInterface, which only rely on _execute_plan
+    get_registers = PMDAxisInterface.get_registers
+    _get_register = PMDAxisInterface._get_register
+    get_actual_positions = PMDAxisInterface.get_actual_positions
+    get_positions = PMDAxisInterface.get_positions
+    get_position_errors = PMDAxisInterface.get_position_errors
+    get_velocities = PMDAxisInterface.get_velocities
+    get_activity_statuses = PMDAxisInterface.get_activity_statuses
+    get_event_statuses = PMDAxisInterface.get_event_statuses
+    get_signal_statuses = PMDAxisInterface.get_signal_statuses
+    set_registers = PMDAxisInterface.set_registers
+    set_positions = PMDAxisInterface.set_positions
+    set_velocities = PMDAxisInterface.set_velocities
+    write_buffer = PMDAxisInterface.write_buffer
+    read_buffer = PMDAxisInterface.read_buffer
+    _register_plan = PMDAxisInterface._register_plan
+    _buffer_plan = staticmethod(PMDAxisInterface._buffer_plan)
+    _cache_plan = PMDAxisInterface._cache_plan
+    _read_registers = PMDAxisInterface._read_registers
+
+
+class PMDBridgeBatch(PMDCommandSet):
+    # PMDCommandBatch counterpart of PMDBridgeClient: queued commands return Futures and go out back to back when
+    # the batch executes.
+    def __init__(self, client: PMDBridgeClient):
+        self._client = client
+        self._pending = []  # (command, packet, decode, Future)
+
+    def __enter__(self) -> 'PMDBridgeBatch':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is None:
+            self.execute()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _transact(
+        self, command: PMDCommand, axis: int = 0, *arguments: int, decode: Optional[Callable[[bytes], Any]] = None
+    ) -> Future:
+        result = Future()
+        self._pending.append((command, command.build(axis, *arguments), decode, result))
+        return result
+
+    def execute(self) -> None:
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        futures = self._client._submit([packet for _, packet, _, _ in pending])
+        error = None
+        for (command, _, decode, result), future in zip(pending, futures):
+            try:
+                response = self._client._response(command, future)
+                result.set_result(decode(response) if decode is not None else None)
+            except Exception as e:
+                result.set_exception(e)
+                error = error or e
+        if error is not None:
+            raise error
@@ -0,0 +1,54 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, ContextManager
+
+
+class PMDReadCoalescer:
+    # Lets threads that make the same read at the same time share one exchange with the motion controller. A read
+    # in PMD_READ_ONLY_COMMANDS that finds an identical read still waiting for the line waits for that read's
+    # response instead of sending its own; once a read has gone out, a new identical read queues up again. Every
+    # caller therefore gets a response that was read after it asked.
+    #
+    # window is how long, in seconds, a read waits before queueing for the line so that more identical reads can
+    # join it; the default only joins reads that are queued anyway.
+    def __init__(self, window: float = 0.0):
+        self.window = window
+        self.requests = 0
+        self.coalesced = 0  # reads answered by another read's exchange
+        self.coalesced_by_command = {}
+        self._lock = threading.Lock()
+        self._waiting = {}  # packet -> Future of the response to the read that has not gone out yet
+
+    @property
+    def transactions(self) -> int:
+        return self.requests - self.coalesced
+
+    @property
+    def hit_rate(self) -> float:
+        return self.coalesced / self.requests if self.requests else 0.0
+
+    def perform(self, name: str, packet: bytes, line: ContextManager, exchange: Callable[[], bytes]) -> bytes:
+        # Returns the response to packet, calling exchange while holding line unless an identical read is waiting.
+        with self._lock:
+            self.requests += 1
+            future = self._waiting.get(packet)
+            if future is not None:
+                self.coalesced += 1
+                self.coalesced_by_command[name] = self.coalesced_by_command.get(name, 0) + 1
+            else:
+                self._waiting[packet] = Future()
+        if future is not None:
+            return future.result()
+        if self.window > 0:
+            time.sleep(self.window)
+        with line:
+            with self._lock:
+                future = self._waiting.pop(packet)
+            try:
+                response = exchange()
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+        future.set_result(response)
+        return response
@@ -1,63 +1,205 @@
+import struct
+from functools import lru_cache
+from typing import NamedTuple, Tuple
 from .error_codes import *
 
-# commands without arguments
-PMD_COMMAND_GETVERSION = bytes(b'\x00\x71\x00\x8F')
-PMD_COMMAND_NOOPERATION = bytes(b'\x00\x00\x00\x00')
-PMD_COMMAND_RESET = bytes(b'\x00\xC7\x00\x39')
-PMD_COMMAND_GETINSTRUCTIONERROR = bytes(b'\x00\x5B\x00\xA5')
-PMD_COMMAND_GETSAMPLETIME = bytes(b'\x00\xC4\x00\x3C')
-
-# commands with arguments
-PMD_COMMAND_GETENCODERSOURCE = bytearray(b'\x00\x00\x00\xDB')
-PMD_COMMAND_SETENCODERSOURCE = bytearray(b'\x00\x00\x00\xDA\x00\x00')
-PMD_COMMAND_GETENCODERTOSTEPRATIO = bytearray(b'\x00\x00\x00\xDF')
-PMD_COMMAND_SETENCODERTOSTEPRATIO = bytearray(b'\x00\x00\x00\xDE\x00\x00\x00\x00')
-PMD_COMMAND_GETACTUALPOSITIONUNITS = bytearray(b'\x00\x00\x00\xBF')
-PMD_COMMAND_SETACTUALPOSITIONUNITS = bytearray(b'\x00\x00\x00\xBE\x00\x00')
-PMD_COMMAND_GETSIGNALSENSE = bytearray(b'\x00\x00\x00\xA3')
-PMD_COMMAND_SETSIGNALSENSE = bytearray(b'\x00\x00\x00\xA2\x00\x00')
-PMD_COMMAND_GETPOSITIONERRORLIMIT = bytearray(b'\x00\x00\x00\x98')
-PMD_COMMAND_SETPOSITIONERRORLIMIT = bytearray(b'\x00\x00\x00\x97\x00\x00\x00\x00')
-PMD_COMMAND_GETEVENTACTION = bytearray(b'\x00\x00\x00\x49\x00\x00')
-PMD_COMMAND_SETEVENTACTION = bytearray(b'\x00\x00\x00\x48\x00\x00\x00\x00')
-PMD_COMMAND_GETPROFILEMODE = bytearray(b'\x00\x00\x00\xA1')
-PMD_COMMAND_SETPROFILEMODE = bytearray(b'\x00\x00\x00\xA0\x00\x00')
-PMD_COMMAND_GETCAPTURESOURCE = bytearray(b'\x00\x00\x00\xD9')
-PMD_COMMAND_SETCAPTURESOURCE = bytearray(b'\x00\x00\x00\xD8\x00\x00')
-PMD_COMMAND_GETSTOPMODE = bytearray(b'\x00\x00\x00\xD1')
-PMD_COMMAND_SETSTOPMODE = bytearray(b'\x00\x00\x00\xD0\x00\x00')
-PMD_COMMAND_GETBREAKPOINT = bytearray(b'\x00\x00\x00\xD5\x00\x00')
-PMD_COMMAND_SETBREAKPOINT = bytearray(b'\x00\x00\x00\xD4\x00\x00\x00\x00')
-PMD_COMMAND_GETBREAKPOINTVALUE = bytearray(b'\x00\x00\x00\xD7\x00\x00')
-PMD_COMMAND_SETBREAKPOINTVALUE = bytearray(b'\x00\x00\x00\xD6\x00\x00\x00\x00\x00\x00')
-PMD_COMMAND_GETVELOCITY = bytearray(b'\x00\x00\x00\x4B')
-PMD_COMMAND_SETVELOCITY = bytearray(b'\x00\x00\x00\x11\x00\x00\x00\x00')
-PMD_COMMAND_GETACCELERATION = bytearray(b'\x00\x00\x00\x4C')
-PMD_COMMAND_SETACCELERATION = bytearray(b'\x00\x00\x00\x90\x00\x00\x00\x00')
-PMD_COMMAND_GETJERK = bytearray(b'\x00\x00\x00\x58')
-PMD_COMMAND_SETJERK = bytearray(b'\x00\x00\x00\x13\x00\x00\x00\x00')
-PMD_COMMAND_GETACTUALPOSITION = bytearray(b'\x00\x00\x00\x37')
-PMD_COMMAND_ADJUSTACTUALPOSITION = bytearray(b'\x00\x00\x00\xF5\x00\x00\x00\x00')
-PMD_COMMAND_SETACTUALPOSITION = bytearray(b'\x00\x00\x00\x4D\x00\x00\x00\x00')
-PMD_COMMAND_GETPOSITION = bytearray(b'\x00\x00\x00\x4A')
-PMD_COMMAND_SETPOSITION = bytearray(b'\x00\x00\x00\x10\x00\x00\x00\x00')
-PMD_COMMAND_GETPOSITIONERROR = bytearray(b'\x00\x00\x00\x99')
-PMD_COMMAND_CLEARPOSITIONERROR = bytearray(b'\x00\x00\x00\x47')
-PMD_COMMAND_UPDATE = bytearray(b'\x00\x00\x00\x1A')
-PMD_COMMAND_MULTIUPDATE = bytearray(b'\x00\x00\x00\x5B\x00\x00')
-PMD_COMMAND_GETACTIVITYSTATUS = bytearray(b'\x00\x00\x00\xA6')
-PMD_COMMAND_GETSIGNALSTATUS = bytearray(b'\x00\x00\x00\xA4')
-PMD_COMMAND_GETEVENTSTATUS = bytearray(b'\x00\x00\x00\x31')
-PMD_COMMAND_RESETEVENTSTATUS = bytearray(b'\x00\x00\x00\x34\x00\x00')
-PMD_COMMAND_GETCAPTUREVALUE = bytearray(b'\x00\x00\x00\x36')
-PMD_COMMAND_GETOPERATINGMODE = bytearray(b'\x00\x00\x00\x66')
-PMD_COMMAND_SETOPERATINGMODE = bytearray(b'\x00\x00\x00\x65\x00\x00')
-PMD_COMMAND_RESTOREOPERATINGMODE = bytearray(b'\x00\x00\x00\x2E')
-PMD_COMMAND_READIO = bytearray(b'\x00\x00\x00\x83\x00\x00')
-PMD_COMMAND_WRITEIO = bytearray(b'\x00\x00\x00\x82\x00\x00\x00\x00')
+# Every command packet is an address byte, a checksum byte, the axis number and the opcode, followed by zero or more
+# big-endian argument words. The checksum makes the 8-bit sum of the whole packet zero.
+PMD_PACKET_HEADER = '>xxBB'
+PMD_PACKET_CACHE_SIZE = 1024  # most recently built packets kept by PMDCommand.build
+
+
+class PMDCommand(NamedTuple):
+    name: str
+    opcode: int
+    packet: struct.Struct
+    response_length: int
+
+    def pack_into(self, buffer: bytearray, offset: int, axis: int, *arguments: int) -> int:
+        self.packet.pack_into(buffer, offset, axis, self.opcode, *arguments)
+        end = offset + self.packet.size
+        # the address and checksum bytes are packed as zero, so only the axis, opcode and argument bytes are summed
+        if end - offset > 4:
+            buffer[offset + 1] = -(axis + self.opcode + sum(buffer[offset + 4:end])) & 0xFF
+        else:
+            buffer[offset + 1] = -(axis + self.opcode) & 0xFF
+        return end
+
+    def build(self, axis: int, *arguments: int) -> bytes:
+        # The complete packet. Packets are immutable and recently built ones are cached, so a command that is sent
+        # over and over, such as a status poll, costs a dictionary lookup.
+        return _build_packet(self.opcode, axis, arguments)
+
+
+def _command(name: str, opcode: int, arguments: str = '', response_length: int = 2) -> PMDCommand:
+    return PMDCommand(name, opcode, struct.Struct(PMD_PACKET_HEADER + arguments), response_length)
+
+
+PMD_COMMAND_GETVERSION = _command('GetVersion', 0x8F, '', 6)
+PMD_COMMAND_NOOPERATION = _command('NoOperation', 0x00)
+PMD_COMMAND_RESET = _command('Reset', 0x39)
+PMD_COMMAND_GETINSTRUCTIONERROR = _command('GetInstructionError', 0xA5, '', 4)
+PMD_COMMAND_GETSAMPLETIME = _command('GetSampleTime', 0x3C, '', 6)
+PMD_COMMAND_GETENCODERSOURCE = _command('GetEncoderSource', 0xDB, '', 4)
+PMD_COMMAND_SETENCODERSOURCE = _command('SetEncoderSource', 0xDA, 'H')
+PMD_COMMAND_GETENCODERTOSTEPRATIO = _command('GetEncoderToStepRatio', 0xDF, '', 6)
+PMD_COMMAND_SETENCODERTOSTEPRATIO = _command('SetEncoderToStepRatio', 0xDE, 'HH')
+PMD_COMMAND_GETACTUALPOSITIONUNITS = _command('GetActualPositionUnits', 0xBF, '', 4)
+PMD_COMMAND_SETACTUALPOSITIONUNITS = _command('SetActualPositionUnits', 0xBE, 'H')
+PMD_COMMAND_GETSIGNALSENSE = _command('GetSignalSense', 0xA3, '', 4)
+PMD_COMMAND_SETSIGNALSENSE = _command('SetSignalSense', 0xA2, 'H')
+PMD_COMMAND_GETPOSITIONERRORLIMIT = _command('GetPositionErrorLimit', 0x98, '', 6)
+PMD_COMMAND_SETPOSITIONERRORLIMIT = _command('SetPositionErrorLimit', 0x97, 'I')
+PMD_COMMAND_GETEVENTACTION = _command('GetEventAction', 0x49, 'H', 4)
+PMD_COMMAND_SETEVENTACTION = _command('SetEventAction', 0x48, 'HH')
+PMD_COMMAND_GETPROFILEMODE = _command('GetProfileMode', 0xA1, '', 4)
+PMD_COMMAND_SETPROFILEMODE = _command('SetProfileMode', 0xA0, 'H')
+PMD_COMMAND_GETCAPTURESOURCE = _command('GetCaptureSource', 0xD9, '', 4)
+PMD_COMMAND_SETCAPTURESOURCE = _command('SetCaptureSource', 0xD8, 'H')
+PMD_COMMAND_GETSTOPMODE = _command('GetStopMode', 0xD1, '', 4)
+PMD_COMMAND_SETSTOPMODE = _command('SetStopMode', 0xD0, 'H')
+PMD_COMMAND_GETBREAKPOINT = _command('GetBreakpoint', 0xD5, 'H', 4)
+PMD_COMMAND_SETBREAKPOINT = _command('SetBreakpoint', 0xD4, 'HBB')
+PMD_COMMAND_GETBREAKPOINTVALUE = _command('GetBreakpointValue', 0xD7, 'H', 6)
+PMD_COMMAND_SETBREAKPOINTVALUE = _command('SetBreakpointValue', 0xD6, 'HI')
+PMD_COMMAND_GETVELOCITY = _command('GetVelocity', 0x4B, '', 6)
+PMD_COMMAND_SETVELOCITY = _command('SetVelocity', 0x11, 'i')
+PMD_COMMAND_GETACCELERATION = _command('GetAcceleration', 0x4C, '', 6)
+PMD_COMMAND_SETACCELERATION = _command('SetAcceleration', 0x90, 'I')
+PMD_COMMAND_GETJERK = _command('GetJerk', 0x58, '', 6)
+PMD_COMMAND_SETJERK = _command('SetJerk', 0x13, 'I')
+PMD_COMMAND_GETACTUALPOSITION = _command('GetActualPosition', 0x37, '', 6)
+PMD_COMMAND_ADJUSTACTUALPOSITION = _command('AdjustActualPosition', 0xF5, 'i')
+PMD_COMMAND_SETACTUALPOSITION = _command('SetActualPosition', 0x4D, 'i')
+PMD_COMMAND_GETPOSITION = _command('GetPosition', 0x4A, '', 6)
+PMD_COMMAND_SETPOSITION = _command('SetPosition', 0x10, 'i')
+PMD_COMMAND_GETPOSITIONERROR = _command('GetPositionError', 0x99, '', 6)
+PMD_COMMAND_GETCOMMANDEDPOSITION = _command('GetCommandedPosition', 0x1D, '', 6)
+PMD_COMMAND_GETCOMMANDEDVELOCITY = _command('GetCommandedVelocity', 0x1E, '', 6)
+PMD_COMMAND_CLEARPOSITIONERROR = _command('ClearPositionError', 0x47)
+PMD_COMMAND_UPDATE = _command('Update', 0x1A)
+PMD_COMMAND_MULTIUPDATE = _command('MultiUpdate', 0x5B, 'H')
+PMD_COMMAND_GETACTIVITYSTATUS = _command('GetActivityStatus', 0xA6, '', 4)
+PMD_COMMAND_GETSIGNALSTATUS = _command('GetSignalStatus', 0xA4, '', 4)
+PMD_COMMAND_GETEVENTSTATUS = _command('GetEventStatus', 0x31, '', 4)
+PMD_COMMAND_RESETEVENTSTATUS = _command('ResetEventStatus', 0x34, 'H')
+PMD_COMMAND_GETCAPTUREVALUE = _command('GetCaptureValue', 0x36, '', 6)
+PMD_COMMAND_GETOPERATINGMODE = _command('GetOperatingMode', 0x66, '', 4)
+PMD_COMMAND_SETOPERATINGMODE = _command('SetOperatingMode', 0x65, 'H')
+PMD_COMMAND_RESTOREOPERATINGMODE = _command('RestoreOperatingMode', 0x2E)
+PMD_COMMAND_READIO = _command('ReadIO', 0x83, 'H', 4)
+PMD_COMMAND_WRITEIO = _command('WriteIO', 0x82, 'HH')
+PMD_COMMAND_SETBUFFERSTART = _command('SetBufferStart', 0xC0, 'HI')
+PMD_COMMAND_GETBUFFERSTART = _command('GetBufferStart', 0xC1, 'H', 6)
+PMD_COMMAND_SETBUFFERLENGTH = _command('SetBufferLength', 0xC2, 'HI')
+PMD_COMMAND_GETBUFFERLENGTH = _command('GetBufferLength', 0xC3, 'H', 6)
+PMD_COMMAND_SETBUFFERREADINDEX = _command('SetBufferReadIndex', 0xC6, 'HI')
+PMD_COMMAND_GETBUFFERREADINDEX = _command('GetBufferReadIndex', 0xC7, 'H', 6)
+PMD_COMMAND_SETBUFFERWRITEINDEX = _command('SetBufferWriteIndex', 0xC4, 'HI')
+PMD_COMMAND_GETBUFFERWRITEINDEX = _command('GetBufferWriteIndex', 0xC5, 'H', 6)
+PMD_COMMAND_READBUFFER = _command('ReadBuffer', 0xC9, 'H', 6)
+PMD_COMMAND_WRITEBUFFER = _command('WriteBuffer', 0xC8, 'Hi')
+PMD_COMMAND_SETTRACEMODE = _command('SetTraceMode', 0xB0, 'H')
+PMD_COMMAND_GETTRACEMODE = _command('GetTraceMode', 0xB1, '', 4)
+PMD_COMMAND_SETTRACESTART = _command('SetTraceStart', 0xB2, 'H')
+PMD_COMMAND_GETTRACESTART = _command('GetTraceStart', 0xB3, '', 4)
+PMD_COMMAND_SETTRACESTOP = _command('SetTraceStop', 0xB4, 'H')
+PMD_COMMAND_GETTRACESTOP = _command('GetTraceStop', 0xB5, '', 4)
+PMD_COMMAND_SETTRACEVARIABLE = _command('SetTraceVariable', 0xB6, 'HH')
+PMD_COMMAND_GETTRACEVARIABLE = _command('GetTraceVariable', 0xB7, 'H', 4)
+PMD_COMMAND_SETTRACEPERIOD = _command('SetTracePeriod', 0xB8, 'H')
+PMD_COMMAND_GETTRACEPERIOD = _command('GetTracePeriod', 0xB9, '', 4)
+PMD_COMMAND_GETTRACESTATUS = _command('GetTraceStatus', 0xBA, '', 4)
+PMD_COMMAND_GETTRACECOUNT = _command('GetTraceCount', 0xBB, '', 6)
+
+PMD_COMMANDS = {command.opcode: command for command in list(globals().values()) if isinstance(command, PMDCommand)}
+PMD_MAX_PACKET_LENGTH = max(command.packet.size for command in PMD_COMMANDS.values())
+
+
+@lru_cache(maxsize=PMD_PACKET_CACHE_SIZE)
+def _build_packet(opcode: int, axis: int, arguments: Tuple[int, ...]) -> bytes:
+    command = PMD_COMMANDS[opcode]
+    packet = bytearray(command.packet.size)
+    command.pack_into(packet, 0, axis, *arguments)
+    return bytes(packet)
+
+# Set commands whose value reads back unchanged through the matching Get command until it is set again. The Set
+# packet carries the Get packet's arguments followed by exactly the data words of the Get response. SetStopMode is
+# left out: Update and MultiUpdate carry out the stop and reset the stop mode to NO_STOP.
+PMD_SHADOWED_COMMANDS = {
+    set_command.opcode: get_command for set_command, get_command in (
+        (PMD_COMMAND_SETENCODERSOURCE, PMD_COMMAND_GETENCODERSOURCE),
+        (PMD_COMMAND_SETENCODERTOSTEPRATIO, PMD_COMMAND_GETENCODERTOSTEPRATIO),
+        (PMD_COMMAND_SETACTUALPOSITIONUNITS, PMD_COMMAND_GETACTUALPOSITIONUNITS),
+        (PMD_COMMAND_SETSIGNALSENSE, PMD_COMMAND_GETSIGNALSENSE),
+        (PMD_COMMAND_SETPOSITIONERRORLIMIT, PMD_COMMAND_GETPOSITIONERRORLIMIT),
+        (PMD_COMMAND_SETEVENTACTION, PMD_COMMAND_GETEVENTACTION),
+        (PMD_COMMAND_SETPROFILEMODE, PMD_COMMAND_GETPROFILEMODE),
+        (PMD_COMMAND_SETCAPTURESOURCE, PMD_COMMAND_GETCAPTURESOURCE),
+        (PMD_COMMAND_SETBREAKPOINTVALUE, PMD_COMMAND_GETBREAKPOINTVALUE),
+        (PMD_COMMAND_SETVELOCITY, PMD_COMMAND_GETVELOCITY),
+        (PMD_COMMAND_SETACCELERATION, PMD_COMMAND_GETACCELERATION),
+        (PMD_COMMAND_SETJERK, PMD_COMMAND_GETJERK),
+        (PMD_COMMAND_SETPOSITION, PMD_COMMAND_GETPOSITION),
+    )
+}
+
+# Shadowed Set commands that may be skipped when they would write the value the register already holds
+PMD_ELIDABLE_COMMANDS = frozenset(PMD_SHADOWED_COMMANDS)
 
 
 class PMDCommandError(Exception):
     def __init__(self, command: str, error_code: int):
         self.command = command
+        self.error_code = error_code
         self.message = GetErrorMessage(error_code)
+
+# Commands that leave the motion controller in the same state however many times they are executed, and may therefore
+# be sent again when it is unknown whether a response was lost. Left out are commands that act relative to the current
+# state (AdjustActualPosition, Update, MultiUpdate, RestoreOperatingMode, Reset, ReadBuffer, WriteBuffer), clear or
+# re-arm something as a side effect (GetInstructionError, GetCaptureValue, ResetEventStatus, ClearPositionError,
+# SetBreakpoint, SetTraceStart, SetTraceStop), redefine the position reference (SetActualPosition) or drive outputs
+# (WriteIO).
+PMD_IDEMPOTENT_COMMANDS = frozenset(PMD_SHADOWED_COMMANDS) | frozenset(
+    command.opcode for command in PMD_SHADOWED_COMMANDS.values()
+) | frozenset(command.opcode for command in (
+    PMD_COMMAND_GETVERSION,
+    PMD_COMMAND_NOOPERATION,
+    PMD_COMMAND_GETSAMPLETIME,
+    PMD_COMMAND_GETBREAKPOINT,
+    PMD_COMMAND_GETACTUALPOSITION,
+    PMD_COMMAND_GETPOSITIONERROR,
+    PMD_COMMAND_GETCOMMANDEDPOSITION,
+    PMD_COMMAND_GETCOMMANDEDVELOCITY,
+    PMD_COMMAND_GETACTIVITYSTATUS,
+    PMD_COMMAND_GETSIGNALSTATUS,
+    PMD_COMMAND_GETEVENTSTATUS,
+    PMD_COMMAND_GETSTOPMODE,
+    PMD_COMMAND_SETSTOPMODE,
+    PMD_COMMAND_GETOPERATINGMODE,
+    PMD_COMMAND_SETOPERATINGMODE,
+    PMD_COMMAND_READIO,
+    PMD_COMMAND_SETBUFFERSTART,
+    PMD_COMMAND_GETBUFFERSTART,
+    PMD_COMMAND_SETBUFFERLENGTH,
+    PMD_COMMAND_GETBUFFERLENGTH,
+    PMD_COMMAND_SETBUFFERREADINDEX,
+    PMD_COMMAND_GETBUFFERREADINDEX,
+    PMD_COMMAND_SETBUFFERWRITEINDEX,
+    PMD_COMMAND_GETBUFFERWRITEINDEX,
+    PMD_COMMAND_SETTRACEMODE,
+    PMD_COMMAND_GETTRACEMODE,
+    PMD_COMMAND_GETTRACESTART,
+    PMD_COMMAND_GETTRACESTOP,
+    PMD_COMMAND_SETTRACEVARIABLE,
+    PMD_COMMAND_GETTRACEVARIABLE,
+    PMD_COMMAND_SETTRACEPERIOD,
+    PMD_COMMAND_GETTRACEPERIOD,
+    PMD_COMMAND_GETTRACESTATUS,
+    PMD_COMMAND_GETTRACECOUNT,
+))
+
+# Idempotent commands that only read, so that identical ones made at the same time can share one exchange
+PMD_READ_ONLY_COMMANDS = frozenset(
+    opcode for opcode in PMD_IDEMPOTENT_COMMANDS if PMD_COMMANDS[opcode].name.startswith(('Get', 'Read'))
+)
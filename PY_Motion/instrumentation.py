@@ -0,0 +1,197 @@
+import os
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, NamedTuple, Optional, Sequence, Tuple
+from .error_codes import *
+
+# Upper bounds in seconds of the latency histogram buckets; the last bucket is unbounded.
+PMD_LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5)
+_BUCKET_BOUNDS = PMD_LATENCY_BUCKETS + (float('inf'),)
+
+
+# Histograms over PMD_LATENCY_BUCKETS, shared by the command statistics and the scheduler's queue wait statistics
+def _histogram() -> list:
+    return [0] * len(_BUCKET_BOUNDS)  # per bucket, not cumulative
+
+
+def _histogram_add(histogram: list, seconds: float) -> None:
+    histogram[bisect_left(PMD_LATENCY_BUCKETS, seconds)] += 1
+
+
+def _histogram_quantile(histogram: Sequence[int], quantile: float) -> float:
+    # Upper bound of the bucket holding the quantile; inf if it falls in the unbounded bucket.
+    rank = quantile * sum(histogram)
+    seen = 0
+    for bound, count in zip(_BUCKET_BOUNDS, histogram):
+        seen += count
+        if seen >= rank and seen > 0:
+            return bound
+    return 0.0
+
+
+def _copy_stats(stats, copy):
+    # Copies every slot of stats onto copy, with lists and dicts copied so that copy does not change with stats.
+    for attribute in type(stats).__slots__:
+        value = getattr(stats, attribute)
+        setattr(copy, attribute, value.copy() if isinstance(value, (list, dict)) else value)
+    return copy
+
+
+class PMDCommandRecord(NamedTuple):
+    name: str
+    opcode: int
+    axis: int
+    bytes_sent: int
+    bytes_received: int
+    latency: float  # seconds from writing the packet to holding the verified response
+    error_code: int = PMD_NOERROR  # status returned by the motion controller
+    communication_error: Optional[str] = None  # 'timeout' or 'checksum' when no usable response arrived
+    batch_size: int = 1  # commands sent in the same write; latency is then the round trip of the whole batch
+
+
+class PMDInstrumentationSink:
+    # Receives a PMDCommandRecord for every exchange with the motion controller once it is set as the instrumentation
+    # of a PMDAxisInterface. Commands answered by the register shadow never reach the wire and are not recorded.
+    # record() is called from whichever thread issued the command, after the interface lock has been released.
+    def record(self, record: PMDCommandRecord) -> None:
+        raise NotImplementedError
+
+
+class PMDInstrumentation(PMDInstrumentationSink):
+    # Passes every record on to several sinks.
+    def __init__(self, *sinks: PMDInstrumentationSink):
+        self.sinks = list(sinks)
+
+    def record(self, record: PMDCommandRecord) -> None:
+        for sink in self.sinks:
+            sink.record(record)
+
+
+class PMDCallbackSink(PMDInstrumentationSink):
+    def __init__(self, callback: Callable[[PMDCommandRecord], None]):
+        self.callback = callback
+
+    def record(self, record: PMDCommandRecord) -> None:
+        self.callback(record)
+
+
+class PMDOpcodeStats:
+    __slots__ = (
+        'name', 'calls', 'bytes_sent', 'bytes_received', 'latency_sum', 'latency_buckets', 'timeouts',
+        'checksum_failures', 'error_codes',
+    )
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = _histogram()
+        self.timeouts = 0
+        self.checksum_failures = 0
+        self.error_codes = {}  # error code -> count
+
+    @property
+    def mean_latency(self) -> float:
+        return self.latency_sum / self.calls if self.calls else 0.0
+
+    def latency_quantile(self, quantile: float) -> float:
+        return _histogram_quantile(self.latency_buckets, quantile)
+
+
+class PMDCommandStats(PMDInstrumentationSink):
+    # In-memory per-opcode totals and latency histograms, e.g.
+    #
+    #   stats = PMDCommandStats()
+    #   pmd.instrumentation = stats
+    #   ...
+    #   print(stats.opcodes[PMD_COMMAND_GETACTUALPOSITION.opcode].latency_quantile(0.99))
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.opcodes = {}  # opcode -> PMDOpcodeStats
+
+    def record(self, record: PMDCommandRecord) -> None:
+        with self.lock:
+            stats = self.opcodes.get(record.opcode)
+            if stats is None:
+                stats = self.opcodes[record.opcode] = PMDOpcodeStats(record.name)
+            stats.calls += 1
+            stats.bytes_sent += record.bytes_sent
+            stats.bytes_received += record.bytes_received
+            stats.latency_sum += record.latency
+            _histogram_add(stats.latency_buckets, record.latency)
+            if record.communication_error == 'timeout':
+                stats.timeouts += 1
+            elif record.communication_error == 'checksum':
+                stats.checksum_failures += 1
+            elif record.error_code != PMD_NOERROR:
+                stats.error_codes[record.error_code] = stats.error_codes.get(record.error_code, 0) + 1
+
+    def snapshot(self) -> Dict[int, PMDOpcodeStats]:
+        # Consistent copy of the per-opcode statistics.
+        with self.lock:
+            return {opcode: _copy_stats(stats, PMDOpcodeStats(stats.name)) for opcode, stats in self.opcodes.items()}
+
+    def reset(self) -> None:
+        with self.lock:
+            self.opcodes = {}
+
+
+class PMDPrometheusSink(PMDCommandStats):
+    # PMDCommandStats that renders itself in the Prometheus text exposition format, either for an HTTP handler to
+    # return or, with write_textfile, for the node exporter's textfile collector.
+    def __init__(self, prefix: str = 'pymotion', labels: Optional[Dict[str, str]] = None):
+        super().__init__()
+        self.prefix = prefix
+        self.labels = dict(labels or {})
+
+    def _labels(self, **labels: str) -> str:
+        pairs = ','.join(f'{key}="{value}"' for key, value in {**self.labels, **labels}.items())
+        return '{' + pairs + '}' if pairs else ''
+
+    def render(self) -> str:
+        opcodes = sorted(self.snapshot().values(), key=lambda stats: stats.name)
+        prefix = self.prefix
+        lines = []
+
+        def metric(name: str, kind: str, description: str, samples: Tuple[Tuple[str, str, float], ...]) -> None:
+            lines.append(f'# HELP {prefix}_{name} {description}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+            for suffix, labels, value in samples:
+                lines.append(f'{prefix}_{name}{suffix}{labels} {value}')
+
+        for name, attribute, description in (
+            ('commands_total', 'calls', 'Commands exchanged with the motion controller.'),
+            ('bytes_sent_total', 'bytes_sent', 'Bytes written to the motion controller.'),
+            ('bytes_received_total', 'bytes_received', 'Bytes read from the motion controller.'),
+            ('timeouts_total', 'timeouts', 'Commands whose response did not arrive in time.'),
+            ('checksum_failures_total', 'checksum_failures', 'Responses that failed the checksum.'),
+        ):
+            metric(name, 'counter', description, tuple(
+                ('', self._labels(command=stats.name), getattr(stats, attribute)) for stats in opcodes
+            ))
+
+        metric('command_errors_total', 'counter', 'Commands rejected by the motion controller, by error code.', tuple(
+            ('', self._labels(command=stats.name, code=str(code), error=errorMessage.get(code, 'Unknown')), count)
+            for stats in opcodes for code, count in sorted(stats.error_codes.items())
+        ))
+
+        samples = []
+        for stats in opcodes:
+            cumulative = 0
+            for bound, count in zip(_BUCKET_BOUNDS, stats.latency_buckets):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                samples.append(('_bucket', self._labels(command=stats.name, le=le), cumulative))
+            samples.append(('_sum', self._labels(command=stats.name), stats.latency_sum))
+            samples.append(('_count', self._labels(command=stats.name), stats.calls))
+        metric('command_latency_seconds', 'histogram', 'Round trip time of commands.', tuple(samples))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str) -> None:
+        # Replaces the file atomically so that the collector never reads a partial file.
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as f:
+            f.write(self.render())
+        os.replace(temporary, path)
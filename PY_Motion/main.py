@@ -1,10 +1,24 @@
-import inspect
 import serial
+import struct
 import threading
 import time
-from typing import Tuple
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import (
+    Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+)
+from .coalescer import *
 from .commands import *
+from .instrumentation import *
 from .pmd_types import *
+from .scheduler import *
+from .shadow import *
+from .transport import *
+
+try:
+    import numpy
+except ImportError:  # optional; the multi-axis register calls return array('i') without it
+    numpy = None
 
 PYMOTION_MAJOR_VERSION = 5
 PYMOTION_MINOR_VERSION = 0
@@ -14,415 +28,961 @@ class PMDCommunicationError(Exception):
     pass
 
 
-class PMDAxisInterface:
-    def __init__(self):
-        self._mc = None  # motion controller
-        self.lock = threading.Lock()
+class PMDTimeoutError(PMDCommunicationError):
+    pass
 
-    def _write_command_with_arguments(self, command: bytearray) -> None:
-        command[1] = 0
-        command[1] = ((sum(command) ^ 0xFF) + 1) & 0xFF
-        self._mc.write(command)
 
-    def _read_response(self, length: int) -> bytes:
-        response = self._mc.read(length)
-        if len(response) < 2:
-            raise PMDCommunicationError('timeout waiting for motion controller to respond')
-        if (sum(response) & 0xFF) != 0:
-            raise PMDCommunicationError('transmission error detected in motion controller response')
-        if response[0] != 0:
-            caller = inspect.currentframe().f_back.f_code.co_name
-            raise PMDCommandError(caller, response[0])
-        return response
+class PMDChecksumError(PMDCommunicationError):
+    pass
 
-    def SetupAxisInterface_Serial(self, port: str, baudrate: int) -> None:
-        self._mc = serial.Serial(port, baudrate, timeout=0.001)
-        zero = bytes([0x00])
-        response = bytearray()
-        synch_attempts = 100
-        while len(response) == 0 and synch_attempts > 0:
-            self._mc.write(zero)
-            response = self._mc.read(2)
-            synch_attempts -= 1
-        if synch_attempts == 0:
-            raise PMDCommunicationError('Unable to communicate with motion processor')
-        self._mc.timeout = 0.1
 
-    def CloseAxisInterface(self) -> None:
-        self._mc.close()
-        self._mc = None
-        self.lock = None
+class PMDRetryPolicy(NamedTuple):
+    # How PMDAxisInterface recovers from a response that timed out or failed its checksum: the stream is brought back
+    # into frame within resync_deadline seconds, and a command in PMD_IDEMPOTENT_COMMANDS is sent again up to
+    # `attempts` more times, waiting backoff, 2 * backoff, ... (at most max_backoff) seconds before each retry.
+    attempts: int = 3
+    backoff: float = 0.005
+    max_backoff: float = 0.1
+    resync_deadline: float = 0.5
 
-    @staticmethod
-    def GetPYMotionVersion() -> Tuple[int, int]:
-        return PYMOTION_MAJOR_VERSION, PYMOTION_MINOR_VERSION
+    def delay(self, attempt: int) -> float:
+        return min(self.backoff * 2 ** attempt, self.max_backoff)
+
+
+def _communication_error(error: Optional[PMDCommunicationError]) -> Optional[str]:
+    if error is None:
+        return None
+    return 'timeout' if isinstance(error, PMDTimeoutError) else 'checksum'
+
+
+# Layouts of the response data words, after the status and checksum bytes. Decoding unpacks straight from the
+# response without slicing it.
+_UINT16 = struct.Struct('>xxH')
+_UINT32 = struct.Struct('>xxI')
+_INT32 = struct.Struct('>xxi')
+_UINT16_PAIR = struct.Struct('>xxHH')
+
+
+def _uint16(response: bytes) -> int:
+    return _UINT16.unpack_from(response)[0]
+
+
+def _uint32(response: bytes) -> int:
+    return _UINT32.unpack_from(response)[0]
+
+
+def _int32(response: bytes) -> int:
+    return _INT32.unpack_from(response)[0]
+
+
+def _encoder_to_step_ratio(response: bytes) -> Tuple[int, int]:
+    return _UINT16_PAIR.unpack_from(response)
+
+
+def _breakpoint(response: bytes) -> Tuple[PMDAxis, PMDAction, PMDTrigger]:
+    source = PMDAxis(response[3] & 0x0F)
+    action = PMDAction(response[3] >> 4)
+    trigger = PMDTrigger(response[2])
+    return source, action, trigger
+
+
+# Get commands that can be read into a register array, with the struct format of their response
+_REGISTER_FORMATS = {
+    PMD_COMMAND_GETACTUALPOSITION.opcode: 'xxi',
+    PMD_COMMAND_GETPOSITION.opcode: 'xxi',
+    PMD_COMMAND_GETPOSITIONERROR.opcode: 'xxi',
+    PMD_COMMAND_GETCOMMANDEDPOSITION.opcode: 'xxi',
+    PMD_COMMAND_GETCOMMANDEDVELOCITY.opcode: 'xxi',
+    PMD_COMMAND_GETVELOCITY.opcode: 'xxi',
+    PMD_COMMAND_GETACCELERATION.opcode: 'xxi',
+    PMD_COMMAND_GETJERK.opcode: 'xxi',
+    PMD_COMMAND_GETCAPTUREVALUE.opcode: 'xxi',
+    PMD_COMMAND_GETACTIVITYSTATUS.opcode: 'xxH',
+    PMD_COMMAND_GETEVENTSTATUS.opcode: 'xxH',
+    PMD_COMMAND_GETSIGNALSTATUS.opcode: 'xxH',
+    PMD_COMMAND_GETOPERATINGMODE.opcode: 'xxH',
+}
+
+
+# Buffer words moved per pipelined write by write_buffer and read_buffer
+PMD_BUFFER_CHUNK = 512
+
+
+class _PMDRegisterPlan(NamedTuple):
+    # pipelined commands whose responses are decoded together
+    packets: bytes
+    pending: list  # (command, offset, None, None) per packet, as in PMDCommandBatch
+    lengths: List[int]
+    frames: Tuple[Tuple[int, int], ...]  # (offset, length) of every response
+    response: struct.Struct
+    shape: Tuple[int, int]
+
+
+def _trace_trigger(axis: PMDAxis, condition: PMDTraceCondition, bit: int, state: PMDTraceState) -> int:
+    return state.value << 12 | bit << 8 | condition.value << 4 | axis.value
+
+
+def _decode_trace_trigger(response: bytes) -> Tuple[PMDAxis, PMDTraceCondition, int, PMDTraceState]:
+    trigger = _uint16(response)
+    axis = PMDAxis(trigger & 0x0F)
+    condition = PMDTraceCondition(trigger >> 4 & 0x0F)
+    state = PMDTraceState(trigger >> 12)
+    return axis, condition, trigger >> 8 & 0x0F, state
+
+
+class PMDCommandSet:
+    # Every command is a single packet/response exchange performed by _transact, which subclasses implement either
+    # as an immediate round-trip (PMDAxisInterface) or by deferring it (PMDCommandBatch).
+    def _transact(
+        self, command: PMDCommand, axis: int = 0, *arguments: int, decode: Optional[Callable[[bytes], Any]] = None
+    ) -> Any:
+        raise NotImplementedError
 
     def GetVersion(self) -> PMDVersion:
-        self._mc.write(PMD_COMMAND_GETVERSION)
-        response = self._read_response(6)
-        return PMDVersion(response[2:6])
+        return self._transact(PMD_COMMAND_GETVERSION, decode=lambda response: PMDVersion(_uint32(response)))
 
     def NoOperation(self) -> None:
-        self._mc.write(PMD_COMMAND_NOOPERATION)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_NOOPERATION)
 
     def GetInstructionError(self) -> int:
-        self._mc.write(PMD_COMMAND_GETINSTRUCTIONERROR)
-        response = self._read_response(4)
-        return int.from_bytes(response[2:4], byteorder='big')
-
-    def Reset(self) -> None:
-        self._mc.write(PMD_COMMAND_RESET)
-        self._read_response(2)
-        time.sleep(0.4)  # wait 400ms for chip to reset
-
-        # After the reset, the chip's InstructionError register should contain PMD_ERROR_RESET.
-        # Calling GetInstructionError will reset the register to PMD_ERROR_NONE
-        error_code = self.GetInstructionError()
-        if error_code != PMD_ERROR_RESET:
-            raise PMDCommandError("Reset", error_code)
+        return self._transact(PMD_COMMAND_GETINSTRUCTIONERROR, decode=_uint16)
 
     def GetSampleTime(self) -> int:
-        self._mc.write(PMD_COMMAND_GETSAMPLETIME)
-        response = self._read_response(6)
-        return int.from_bytes(response[2:6], byteorder='big')
+        return self._transact(PMD_COMMAND_GETSAMPLETIME, decode=_uint32)
 
     def GetEncoderSource(self, axis: PMDAxis) -> PMDEncoderSource:
-        command = PMD_COMMAND_GETENCODERSOURCE
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(4)
-        return PMDEncoderSource(response[3])
+        return self._transact(
+            PMD_COMMAND_GETENCODERSOURCE, axis.value, decode=lambda response: PMDEncoderSource(response[3])
+        )
 
     def SetEncoderSource(self, axis: PMDAxis, source: PMDEncoderSource) -> None:
-        command = PMD_COMMAND_SETENCODERSOURCE
-        command[2] = axis.value
-        command[5] = source.value
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETENCODERSOURCE, axis.value, source.value)
 
     def GetEncoderToStepRatio(self, axis: PMDAxis) -> Tuple[int, int]:
-        command = PMD_COMMAND_GETENCODERTOSTEPRATIO
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(6)
-        counts = int.from_bytes(response[2:4], byteorder='big')
-        steps = int.from_bytes(response[4:6], byteorder='big')
-        return counts, steps
+        return self._transact(PMD_COMMAND_GETENCODERTOSTEPRATIO, axis.value, decode=_encoder_to_step_ratio)
 
     def SetEncoderToStepRatio(self, axis: PMDAxis, counts: int, steps: int) -> None:
-        command = PMD_COMMAND_SETENCODERTOSTEPRATIO
-        command[2] = axis.value
-        command[4:6] = counts.to_bytes(2, byteorder='big')
-        command[6:8] = steps.to_bytes(2, byteorder='big')
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETENCODERTOSTEPRATIO, axis.value, counts, steps)
 
     def GetActualPositionUnits(self, axis: PMDAxis) -> PMDPositionUnits:
-        command = PMD_COMMAND_GETACTUALPOSITIONUNITS
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(4)
-        return PMDPositionUnits(response[3])
+        return self._transact(
+            PMD_COMMAND_GETACTUALPOSITIONUNITS, axis.value, decode=lambda response: PMDPositionUnits(response[3])
+        )
 
     def SetActualPositionUnits(self, axis: PMDAxis, units: PMDPositionUnits) -> None:
-        command = PMD_COMMAND_SETACTUALPOSITIONUNITS
-        command[2] = axis.value
-        command[5] = units.value
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETACTUALPOSITIONUNITS, axis.value, units.value)
 
     def GetSignalSense(self, axis: PMDAxis) -> PMDSignalSense:
-        command = PMD_COMMAND_GETSIGNALSENSE
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(4)
-        return PMDSignalSense(int.from_bytes(response[2:4], byteorder='big'))
+        return self._transact(
+            PMD_COMMAND_GETSIGNALSENSE, axis.value, decode=lambda response: PMDSignalSense(_uint16(response))
+        )
 
     def SetSignalSense(self, axis: PMDAxis, sense: PMDSignalSense) -> None:
-        command = PMD_COMMAND_SETSIGNALSENSE
-        command[2] = axis.value
-        command[4:6] = sense.value.to_bytes(2, byteorder='big')
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETSIGNALSENSE, axis.value, sense.value)
 
     def GetPositionErrorLimit(self, axis: PMDAxis) -> int:
-        command = PMD_COMMAND_GETPOSITIONERRORLIMIT
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(6)
-        return int.from_bytes(response[2:6], byteorder='big')
+        return self._transact(PMD_COMMAND_GETPOSITIONERRORLIMIT, axis.value, decode=_uint32)
 
     def SetPositionErrorLimit(self, axis: PMDAxis, limit: int) -> None:
-        command = PMD_COMMAND_SETPOSITIONERRORLIMIT
-        command[2] = axis.value
-        command[4:8] = limit.to_bytes(4, byteorder='big')
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETPOSITIONERRORLIMIT, axis.value, limit)
 
     def GetEventAction(self, axis: PMDAxis, event: PMDEvent) -> PMDAction:
-        command = PMD_COMMAND_GETEVENTACTION
-        command[2] = axis.value
-        command[5] = event.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(4)
-        return PMDAction(int.from_bytes(response[2:4], byteorder='big'))
+        return self._transact(
+            PMD_COMMAND_GETEVENTACTION, axis.value, event.value, decode=lambda response: PMDAction(_uint16(response))
+        )
 
     def SetEventAction(self, axis: PMDAxis, event: PMDEvent, action: PMDAction) -> None:
-        command = PMD_COMMAND_SETEVENTACTION
-        command[2] = axis.value
-        command[5] = event.value
-        command[7] = action.value
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETEVENTACTION, axis.value, event.value, action.value)
 
     def GetProfileMode(self, axis: PMDAxis) -> PMDProfileMode:
-        command = PMD_COMMAND_GETPROFILEMODE
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(4)
-        return PMDProfileMode(response[3])
+        return self._transact(
+            PMD_COMMAND_GETPROFILEMODE, axis.value, decode=lambda response: PMDProfileMode(response[3])
+        )
 
     def SetProfileMode(self, axis: PMDAxis, mode: PMDProfileMode) -> None:
-        command = PMD_COMMAND_SETPROFILEMODE
-        command[2] = axis.value
-        command[5] = mode.value
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETPROFILEMODE, axis.value, mode.value)
 
     def GetCaptureSource(self, axis: PMDAxis) -> PMDCaptureSource:
-        command = PMD_COMMAND_GETCAPTURESOURCE
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(4)
-        return PMDCaptureSource(response[3])
+        return self._transact(
+            PMD_COMMAND_GETCAPTURESOURCE, axis.value, decode=lambda response: PMDCaptureSource(response[3])
+        )
 
     def SetCaptureSource(self, axis: PMDAxis, source: PMDCaptureSource) -> None:
-        command = PMD_COMMAND_SETCAPTURESOURCE
-        command[2] = axis.value
-        command[5] = source.value
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETCAPTURESOURCE, axis.value, source.value)
 
     def GetStopMode(self, axis: PMDAxis) -> PMDStopMode:
-        command = PMD_COMMAND_GETSTOPMODE
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(4)
-        return PMDStopMode(response[3])
+        return self._transact(PMD_COMMAND_GETSTOPMODE, axis.value, decode=lambda response: PMDStopMode(response[3]))
 
     def SetStopMode(self, axis: PMDAxis, mode: PMDStopMode) -> None:
-        command = PMD_COMMAND_SETSTOPMODE
-        command[2] = axis.value
-        command[5] = mode.value
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETSTOPMODE, axis.value, mode.value)
 
     def GetBreakpoint(self, axis: PMDAxis, breakpt: PMDBreakpoint) -> Tuple[PMDAxis, PMDAction, PMDTrigger]:
-        command = PMD_COMMAND_GETBREAKPOINT
-        command[2] = axis.value
-        command[5] = breakpt.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(4)
-        source = PMDAxis(response[3] & 0x0F)
-        action = PMDAction(response[3] >> 4)
-        trigger = PMDTrigger(response[2])
-        return source, action, trigger
+        return self._transact(PMD_COMMAND_GETBREAKPOINT, axis.value, breakpt.value, decode=_breakpoint)
 
     def SetBreakpoint(
         self, axis: PMDAxis, breakpt: PMDBreakpoint, source: PMDAxis, action: PMDAction, trigger: PMDTrigger
     ) -> None:
-        command = PMD_COMMAND_SETBREAKPOINT
-        command[2] = axis.value
-        command[5] = breakpt.value
-        command[6] = trigger.value
-        command[7] = action.value << 4 | source.value
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(
+            PMD_COMMAND_SETBREAKPOINT, axis.value, breakpt.value, trigger.value, action.value << 4 | source.value
+        )
 
     def GetBreakpointValue(self, axis: PMDAxis, breakpt: PMDBreakpoint) -> int:
-        command = PMD_COMMAND_GETBREAKPOINTVALUE
-        command[2] = axis.value
-        command[5] = breakpt.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(6)
-        return int.from_bytes(response[2:6], byteorder='big')
+        return self._transact(PMD_COMMAND_GETBREAKPOINTVALUE, axis.value, breakpt.value, decode=_uint32)
 
     def SetBreakpointValue(self, axis: PMDAxis, breakpt: PMDBreakpoint, value: int) -> None:
-        command = PMD_COMMAND_SETBREAKPOINTVALUE
-        command[2] = axis.value
-        command[5] = breakpt.value
-        command[6:10] = value.to_bytes(4, byteorder='big')
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETBREAKPOINTVALUE, axis.value, breakpt.value, value)
 
     def GetVelocity(self, axis: PMDAxis) -> int:
-        command = PMD_COMMAND_GETVELOCITY
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(6)
-        return int.from_bytes(response[2:6], byteorder='big', signed=True)
+        return self._transact(PMD_COMMAND_GETVELOCITY, axis.value, decode=_int32)
 
     def SetVelocity(self, axis: PMDAxis, velocity: int) -> None:
-        command = PMD_COMMAND_SETVELOCITY
-        command[2] = axis.value
-        command[4:8] = velocity.to_bytes(4, byteorder='big', signed=True)
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETVELOCITY, axis.value, velocity)
 
     def GetAcceleration(self, axis: PMDAxis) -> int:
-        command = PMD_COMMAND_GETACCELERATION
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(6)
-        return int.from_bytes(response[2:6], byteorder='big')
+        return self._transact(PMD_COMMAND_GETACCELERATION, axis.value, decode=_uint32)
 
     def SetAcceleration(self, axis: PMDAxis, acceleration: int) -> None:
-        command = PMD_COMMAND_SETACCELERATION
-        command[2] = axis.value
-        command[4:8] = acceleration.to_bytes(4, byteorder='big')
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETACCELERATION, axis.value, acceleration)
 
     def GetJerk(self, axis: PMDAxis) -> int:
-        command = PMD_COMMAND_GETJERK
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(6)
-        return int.from_bytes(response[2:6], byteorder='big')
+        return self._transact(PMD_COMMAND_GETJERK, axis.value, decode=_uint32)
 
     def SetJerk(self, axis: PMDAxis, jerk: int) -> None:
-        command = PMD_COMMAND_SETJERK
-        command[2] = axis.value
-        command[4:8] = jerk.to_bytes(4, byteorder='big')
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETJERK, axis.value, jerk)
 
     def GetActualPosition(self, axis: PMDAxis) -> int:
-        command = PMD_COMMAND_GETACTUALPOSITION
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(6)
-        return int.from_bytes(response[2:6], byteorder='big', signed=True)
+        return self._transact(PMD_COMMAND_GETACTUALPOSITION, axis.value, decode=_int32)
 
     def AdjustActualPosition(self, axis: PMDAxis, position: int) -> None:
-        command = PMD_COMMAND_ADJUSTACTUALPOSITION
-        command[2] = axis.value
-        command[4:8] = position.to_bytes(4, byteorder='big', signed=True)
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_ADJUSTACTUALPOSITION, axis.value, position)
 
     def SetActualPosition(self, axis: PMDAxis, position: int) -> None:
-        command = PMD_COMMAND_SETACTUALPOSITION
-        command[2] = axis.value
-        command[4:8] = position.to_bytes(4, byteorder='big', signed=True)
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETACTUALPOSITION, axis.value, position)
 
     def GetPosition(self, axis: PMDAxis) -> int:
-        command = PMD_COMMAND_GETPOSITION
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(6)
-        return int.from_bytes(response[2:6], byteorder='big', signed=True)
+        return self._transact(PMD_COMMAND_GETPOSITION, axis.value, decode=_int32)
 
     def SetPosition(self, axis: PMDAxis, position: int) -> None:
-        command = PMD_COMMAND_SETPOSITION
-        command[2] = axis.value
-        command[4:8] = position.to_bytes(4, byteorder='big', signed=True)
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETPOSITION, axis.value, position)
 
     def GetPositionError(self, axis: PMDAxis) -> int:
-        command = PMD_COMMAND_GETPOSITIONERROR
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(6)
-        return int.from_bytes(response[2:6], byteorder='big', signed=True)
+        return self._transact(PMD_COMMAND_GETPOSITIONERROR, axis.value, decode=_int32)
 
     def ClearPositionError(self, axis: PMDAxis) -> None:
-        command = PMD_COMMAND_CLEARPOSITIONERROR
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_CLEARPOSITIONERROR, axis.value)
+
+    def GetCommandedPosition(self, axis: PMDAxis) -> int:
+        return self._transact(PMD_COMMAND_GETCOMMANDEDPOSITION, axis.value, decode=_int32)
+
+    def GetCommandedVelocity(self, axis: PMDAxis) -> int:
+        return self._transact(PMD_COMMAND_GETCOMMANDEDVELOCITY, axis.value, decode=_int32)
 
     def Update(self, axis: PMDAxis) -> None:
-        command = PMD_COMMAND_UPDATE
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_UPDATE, axis.value)
 
     def MultiUpdate(self, axes: PMDAxisMask) -> None:
-        command = PMD_COMMAND_MULTIUPDATE
-        command[5] = axes.value
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_MULTIUPDATE, 0, axes.value)
 
     def GetActivityStatus(self, axis: PMDAxis) -> PMDActivityStatus:
-        command = PMD_COMMAND_GETACTIVITYSTATUS
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(4)
-        return PMDActivityStatus(response[2:4])
+        return self._transact(
+            PMD_COMMAND_GETACTIVITYSTATUS, axis.value, decode=lambda response: PMDActivityStatus(_uint16(response))
+        )
 
     def GetSignalStatus(self, axis: PMDAxis) -> PMDSignalStatus:
-        command = PMD_COMMAND_GETSIGNALSTATUS
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(4)
-        return PMDSignalStatus(int.from_bytes(response[2:4], byteorder='big'))
+        return self._transact(
+            PMD_COMMAND_GETSIGNALSTATUS, axis.value, decode=lambda response: PMDSignalStatus(_uint16(response))
+        )
 
     def GetEventStatus(self, axis: PMDAxis) -> PMDEventStatus:
-        command = PMD_COMMAND_GETEVENTSTATUS
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(4)
-        return PMDEventStatus(int.from_bytes(response[2:4], byteorder='big'))
+        return self._transact(
+            PMD_COMMAND_GETEVENTSTATUS, axis.value, decode=lambda response: PMDEventStatus(_uint16(response))
+        )
 
     def ResetEventStatus(self, axis: PMDAxis, mask: PMDEventStatus) -> None:
-        command = PMD_COMMAND_RESETEVENTSTATUS
-        command[2] = axis.value
-        command[4:6] = mask.value.to_bytes(2, byteorder='big')
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_RESETEVENTSTATUS, axis.value, mask.value)
 
     def GetCaptureValue(self, axis: PMDAxis) -> int:
-        command = PMD_COMMAND_GETCAPTUREVALUE
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(6)
-        return int.from_bytes(response[2:6], byteorder='big', signed=True)
+        return self._transact(PMD_COMMAND_GETCAPTUREVALUE, axis.value, decode=_int32)
 
     def GetOperatingMode(self, axis: PMDAxis) -> PMDOperatingMode:
-        command = PMD_COMMAND_GETOPERATINGMODE
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        response = self._read_response(4)
-        return PMDOperatingMode(response[3])
+        return self._transact(
+            PMD_COMMAND_GETOPERATINGMODE, axis.value, decode=lambda response: PMDOperatingMode(response[3])
+        )
 
     def SetOperatingMode(self, axis: PMDAxis, mode: PMDOperatingMode) -> None:
-        command = PMD_COMMAND_SETOPERATINGMODE
-        command[2] = axis.value
-        command[5] = mode.value
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_SETOPERATINGMODE, axis.value, mode.value)
 
     def RestoreOperatingMode(self, axis: PMDAxis) -> None:
-        command = PMD_COMMAND_RESTOREOPERATINGMODE
-        command[2] = axis.value
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_RESTOREOPERATINGMODE, axis.value)
 
     def ReadIO(self, address: int) -> int:
-        command = PMD_COMMAND_READIO
-        command[5] = address
-        self._write_command_with_arguments(command)
-        response = self._read_response(4)
-        return int.from_bytes(response[2:4], byteorder='big')
+        return self._transact(PMD_COMMAND_READIO, 0, address, decode=_uint16)
 
     def WriteIO(self, address: int, data: int) -> None:
-        command = PMD_COMMAND_WRITEIO
-        command[5] = address
-        command[6:8] = int.to_bytes(data, 2, byteorder='big')
-        self._write_command_with_arguments(command)
-        self._read_response(2)
+        return self._transact(PMD_COMMAND_WRITEIO, 0, address, data)
+
+    def SetBufferStart(self, buffer_id: int, address: int) -> None:
+        return self._transact(PMD_COMMAND_SETBUFFERSTART, 0, buffer_id, address)
+
+    def GetBufferStart(self, buffer_id: int) -> int:
+        return self._transact(PMD_COMMAND_GETBUFFERSTART, 0, buffer_id, decode=_uint32)
+
+    def SetBufferLength(self, buffer_id: int, length: int) -> None:
+        return self._transact(PMD_COMMAND_SETBUFFERLENGTH, 0, buffer_id, length)
+
+    def GetBufferLength(self, buffer_id: int) -> int:
+        return self._transact(PMD_COMMAND_GETBUFFERLENGTH, 0, buffer_id, decode=_uint32)
+
+    def SetBufferReadIndex(self, buffer_id: int, index: int) -> None:
+        return self._transact(PMD_COMMAND_SETBUFFERREADINDEX, 0, buffer_id, index)
+
+    def GetBufferReadIndex(self, buffer_id: int) -> int:
+        return self._transact(PMD_COMMAND_GETBUFFERREADINDEX, 0, buffer_id, decode=_uint32)
+
+    def SetBufferWriteIndex(self, buffer_id: int, index: int) -> None:
+        return self._transact(PMD_COMMAND_SETBUFFERWRITEINDEX, 0, buffer_id, index)
+
+    def GetBufferWriteIndex(self, buffer_id: int) -> int:
+        return self._transact(PMD_COMMAND_GETBUFFERWRITEINDEX, 0, buffer_id, decode=_uint32)
+
+    def ReadBuffer(self, buffer_id: int) -> int:
+        return self._transact(PMD_COMMAND_READBUFFER, 0, buffer_id, decode=_int32)
+
+    def WriteBuffer(self, buffer_id: int, data: int) -> None:
+        return self._transact(PMD_COMMAND_WRITEBUFFER, 0, buffer_id, data)
+
+    def SetTraceMode(self, mode: PMDTraceMode) -> None:
+        return self._transact(PMD_COMMAND_SETTRACEMODE, 0, mode.value)
+
+    def GetTraceMode(self) -> PMDTraceMode:
+        return self._transact(PMD_COMMAND_GETTRACEMODE, decode=lambda response: PMDTraceMode(_uint16(response)))
+
+    def SetTraceStart(
+        self, axis: PMDAxis, condition: PMDTraceCondition, bit: int = 0, state: PMDTraceState = PMDTraceState.LOW
+    ) -> None:
+        return self._transact(PMD_COMMAND_SETTRACESTART, 0, _trace_trigger(axis, condition, bit, state))
+
+    def GetTraceStart(self) -> Tuple[PMDAxis, PMDTraceCondition, int, PMDTraceState]:
+        return self._transact(PMD_COMMAND_GETTRACESTART, decode=_decode_trace_trigger)
+
+    def SetTraceStop(
+        self, axis: PMDAxis, condition: PMDTraceCondition, bit: int = 0, state: PMDTraceState = PMDTraceState.LOW
+    ) -> None:
+        return self._transact(PMD_COMMAND_SETTRACESTOP, 0, _trace_trigger(axis, condition, bit, state))
+
+    def GetTraceStop(self) -> Tuple[PMDAxis, PMDTraceCondition, int, PMDTraceState]:
+        return self._transact(PMD_COMMAND_GETTRACESTOP, decode=_decode_trace_trigger)
+
+    def SetTraceVariable(self, variable_number: int, axis: PMDAxis, variable: PMDTraceVariable) -> None:
+        return self._transact(PMD_COMMAND_SETTRACEVARIABLE, 0, variable_number, variable.value << 8 | axis.value)
+
+    def GetTraceVariable(self, variable_number: int) -> Tuple[PMDAxis, PMDTraceVariable]:
+        return self._transact(
+            PMD_COMMAND_GETTRACEVARIABLE, 0, variable_number,
+            decode=lambda response: (PMDAxis(response[3] & 0x0F), PMDTraceVariable(response[2])),
+        )
+
+    def SetTracePeriod(self, period: int) -> None:
+        return self._transact(PMD_COMMAND_SETTRACEPERIOD, 0, period)
+
+    def GetTracePeriod(self) -> int:
+        return self._transact(PMD_COMMAND_GETTRACEPERIOD, decode=_uint16)
+
+    def GetTraceStatus(self) -> PMDTraceStatus:
+        return self._transact(PMD_COMMAND_GETTRACESTATUS, decode=lambda response: PMDTraceStatus(_uint16(response)))
+
+    def GetTraceCount(self) -> int:
+        return self._transact(PMD_COMMAND_GETTRACECOUNT, decode=_uint32)
+
+
+class PMDAxisInterface(PMDCommandSet):
+    def __init__(self):
+        self._mc = None  # motion controller
+        self.lock = threading.RLock()  # or a PMDCommandScheduler
+        self.shadow = None  # optional PMDRegisterShadow
+        self.instrumentation = None  # optional PMDInstrumentationSink
+        self.retry_policy = None  # optional PMDRetryPolicy
+        self.coalescer = None  # optional PMDReadCoalescer
+        self._register_plans = {}
+
+    @staticmethod
+    def _verify_response(response: bytes) -> None:
+        if len(response) < 2:
+            raise PMDTimeoutError('timeout waiting for motion controller to respond')
+        if (sum(response) & 0xFF) != 0:
+            raise PMDChecksumError('transmission error detected in motion controller response')
+
+    def _read(self, expected: int) -> bytearray:
+        data = bytearray()
+        while len(data) < expected:
+            chunk = self._mc.read(expected - len(data))
+            if len(chunk) == 0:
+                break
+            data += chunk
+        return data
+
+    def _read_responses(self, lengths: List[int]) -> Iterator[bytes]:
+        # Responses to pipelined commands arrive back to back, so read them in bulk and split them afterwards.
+        return self._split_responses(self._read(sum(lengths)), lengths)
+
+    @classmethod
+    def _split_responses(cls, data: bytes, lengths: List[int]) -> Iterator[bytes]:
+        # A command that fails returns only the status and checksum bytes, which moves every later frame boundary.
+        offset = 0
+        for length in lengths:
+            if offset < len(data) and data[offset] != 0:
+                length = 2
+            response = bytes(data[offset:offset + length])
+            if len(response) < length:
+                raise PMDTimeoutError('timeout waiting for motion controller to respond')
+            cls._verify_response(response)
+            offset += length
+            yield response
+
+    def _transact(
+        self, command: PMDCommand, axis: int = 0, *arguments: int, decode: Optional[Callable[[bytes], Any]] = None
+    ) -> Any:
+        packet = command.build(axis, *arguments)
+        coalescer = self.coalescer
+        if coalescer is not None and command.opcode in PMD_READ_ONLY_COMMANDS:
+            response = coalescer.perform(
+                command.name, packet, self._slot((command,)), lambda: self._perform(command, axis, packet)
+            )
+        else:
+            response = self._perform(command, axis, packet)
+        if response[0] != 0:
+            raise PMDCommandError(command.name, response[0])
+        return decode(response) if decode is not None else None
+
+    def _perform(self, command: PMDCommand, axis: int, packet: bytes) -> bytes:
+        # Returns the response to packet, from the shadow or the motion controller; PMDCommandError is left to the
+        # caller.
+        instrumentation = self.instrumentation
+        records = [] if instrumentation is not None else None
+        error = None
+        with self._slot((command,)):
+            shadow = self.shadow
+            response = shadow.lookup(command, packet) if shadow is not None else None
+            if response is None:
+                try:
+                    response = self._exchange(command, axis, packet, records)
+                except PMDCommunicationError as e:
+                    error = e
+                    if self.retry_policy is not None:
+                        response, error = self._recover(command, axis, packet, records, e)
+                if shadow is not None and error is None:
+                    shadow.update(command, packet, response)
+        if records:
+            for record in records:
+                instrumentation.record(record)
+        if error is not None:
+            raise error
+        return response
+
+    def _slot(self, commands: Iterable[PMDCommand]) -> ContextManager:
+        # The lock, taken at the priority of the most urgent of commands when it is a PMDCommandScheduler
+        lock = self.lock
+        if isinstance(lock, PMDCommandScheduler):
+            return lock.slot(min(command_priority(command) for command in commands))
+        return lock
+
+    def _exchange(
+        self, command: PMDCommand, axis: int, packet: bytes, records: Optional[List[PMDCommandRecord]]
+    ) -> bytes:
+        # Sends packet and returns the verified response; a record of the exchange is appended to records unless it
+        # is None.
+        start = time.perf_counter() if records is not None else 0.0
+        self._mc.write(packet)
+        response = self._mc.read(command.response_length)
+        try:
+            self._verify_response(response)
+            if response[0] == 0 and len(response) < command.response_length:
+                raise PMDTimeoutError('timeout waiting for motion controller to respond')
+        except PMDCommunicationError as e:
+            if records is not None:
+                records.append(PMDCommandRecord(
+                    command.name, command.opcode, axis, len(packet), len(response), time.perf_counter() - start,
+                    PMD_NOERROR, _communication_error(e),
+                ))
+            raise
+        if records is not None:
+            records.append(PMDCommandRecord(
+                command.name, command.opcode, axis, len(packet), len(response), time.perf_counter() - start, response[0]
+            ))
+        return response
+
+    def _recover(
+        self, command: PMDCommand, axis: int, packet: bytes, records: Optional[List[PMDCommandRecord]],
+        error: PMDCommunicationError,
+    ) -> Tuple[Optional[bytes], Optional[PMDCommunicationError]]:
+        # Called with the lock held after an exchange failed. Whether or not the motion controller executed the
+        # command is unknown, so only idempotent commands are sent again; the stream is resynchronized either way.
+        policy = self.retry_policy
+        for attempt in range(policy.attempts + 1):
+            try:
+                self._resynchronize()
+            except PMDCommunicationError:
+                return None, error
+            if attempt == policy.attempts or command.opcode not in PMD_IDEMPOTENT_COMMANDS:
+                return None, error
+            time.sleep(policy.delay(attempt))
+            try:
+                return self._exchange(command, axis, packet, records), None
+            except PMDCommunicationError as e:
+                error = e
+        return None, error
+
+    def _resynchronize(self) -> None:
+        # Discards the rest of a failed exchange, including bytes still on their way, and brings the stream back
+        # into frame.
+        timeout = self._mc.timeout
+        deadline = time.monotonic() + self.retry_policy.resync_deadline
+        try:
+            self._mc.timeout = 0.002
+            while len(self._mc.read(PMD_MAX_PACKET_LENGTH)) > 0 and time.monotonic() < deadline:
+                pass
+            self._synchronize(deadline)
+        finally:
+            self._mc.timeout = timeout
+
+    def SetupAxisInterface_Serial(self, port: str, baudrate: int, deadline: float = 1.0) -> None:
+        self.SetupAxisInterface(serial.Serial(port, baudrate, timeout=0.001), deadline)
+
+    def SetupAxisInterface(self, transport: PMDTransport, deadline: float = 1.0) -> None:
+        # Gives up, closing the transport, if the motion processor has not been brought into frame and has not
+        # answered NoOperation and GetVersion within deadline seconds.
+        self._mc = transport
+        try:
+            self._synchronize(time.monotonic() + deadline)
+        except BaseException:
+            self._mc = None
+            transport.close()
+            raise
+        transport.timeout = 0.1
+
+    def _synchronize(self, deadline: float) -> None:
+        # The motion processor may hold part of a packet from an earlier session. Zero bytes complete any packet
+        # within PMD_MAX_PACKET_LENGTH bytes, and the first byte of a response marks the packet boundary; four zero
+        # bytes on their own are a valid NoOperation packet. The wait for each response starts at a few byte times
+        # of the line and doubles whenever a full packet's worth of zeros goes unanswered.
+        mc = self._mc
+        zero = bytes([0x00])
+        baudrate = getattr(mc, 'baudrate', None)
+        byte_timeout = 0.001 + (30 / baudrate if baudrate else 0.0)
+        mc.reset_input_buffer()
+        while True:
+            for _ in range(PMD_MAX_PACKET_LENGTH):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PMDCommunicationError('Unable to communicate with motion processor')
+                mc.timeout = min(byte_timeout, remaining)
+                mc.write(zero)
+                if len(mc.read(1)) > 0:
+                    break
+            else:
+                byte_timeout = min(2 * byte_timeout, 0.1)
+                continue
+            while len(mc.read(PMD_MAX_PACKET_LENGTH)) > 0:  # rest of the response, until the line is quiet
+                if time.monotonic() >= deadline:  # or never, on a noisy line
+                    raise PMDCommunicationError('Unable to communicate with motion processor')
+            mc.timeout = min(max(10 * byte_timeout, 0.01), max(deadline - time.monotonic(), 0.001))
+            try:
+                for command in (PMD_COMMAND_NOOPERATION, PMD_COMMAND_GETVERSION):
+                    response = self._exchange(command, 0, command.build(0), None)
+                    if response[0] != 0:
+                        raise PMDCommandError(command.name, response[0])
+                PMDVersion(_uint32(response)).family  # ValueError unless the answer comes from a known product family
+            except (PMDCommunicationError, PMDCommandError, ValueError):
+                mc.reset_input_buffer()
+                continue
+            return
+
+    def CloseAxisInterface(self) -> None:
+        with self.lock:
+            self._mc.close()
+            self._mc = None
+        self.lock = None
+
+    @staticmethod
+    def GetPYMotionVersion() -> Tuple[int, int]:
+        return PYMOTION_MAJOR_VERSION, PYMOTION_MINOR_VERSION
+
+    def Reset(self) -> None:
+        with self._slot((PMD_COMMAND_RESET,)):
+            self._transact(PMD_COMMAND_RESET)
+            time.sleep(0.4)  # wait 400ms for chip to reset
+
+            # After the reset, the chip's InstructionError register should contain PMD_ERROR_RESET.
+            # Calling GetInstructionError will reset the register to PMD_ERROR_NONE
+            error_code = self.GetInstructionError()
+        if error_code != PMD_ERROR_RESET:
+            raise PMDCommandError("Reset", error_code)
+
+    def batch(self) -> 'PMDCommandBatch':
+        return PMDCommandBatch(self)
+
+    def refresh_shadow(self, axes: Iterable[PMDAxis] = PMDAxis) -> None:
+        # Reloads every shadowed register of axes from the motion controller in one batch.
+        with self.lock, self.batch() as batch:
+            for axis in axes:
+                self.shadow.invalidate(axis)
+                batch.GetEncoderSource(axis)
+                batch.GetEncoderToStepRatio(axis)
+                batch.GetActualPositionUnits(axis)
+                batch.GetSignalSense(axis)
+                batch.GetPositionErrorLimit(axis)
+                for event in (PMDEvent.POSITIVE_LIMIT, PMDEvent.NEGATIVE_LIMIT, PMDEvent.MOTION_ERROR):
+                    batch.GetEventAction(axis, event)
+                batch.GetProfileMode(axis)
+                batch.GetCaptureSource(axis)
+                for breakpt in PMDBreakpoint:
+                    batch.GetBreakpointValue(axis, breakpt)
+                batch.GetVelocity(axis)
+                batch.GetAcceleration(axis)
+                batch.GetJerk(axis)
+                batch.GetPosition(axis)
+
+    # Multi-axis register access. Reads pipeline every packet in one write and decode every response in one pass;
+    # the result is axis-major, e.g. get_registers([AXIS1, AXIS2], [GETACTUALPOSITION, GETPOSITIONERROR]) returns
+    # [AXIS1 actual position, AXIS1 position error, AXIS2 actual position, AXIS2 position error] as a flat
+    # array('i'), or as a 2 x 2 int32 array when numpy is installed. Reads always go to the motion controller;
+    # the register shadow is updated but not consulted.
+    def get_registers(
+        self, axes: Iterable[PMDAxis] = PMDAxis, commands: Iterable[PMDCommand] = (PMD_COMMAND_GETACTUALPOSITION,)
+    ) -> Sequence[int]:
+        values, plan = self._read_registers(axes, commands)
+        return numpy.frombuffer(values, numpy.intc).reshape(plan.shape) if numpy is not None else values
+
+    def _get_register(self, axes: Iterable[PMDAxis], command: PMDCommand) -> Sequence[int]:
+        values, _ = self._read_registers(axes, (command,))
+        return numpy.frombuffer(values, numpy.intc) if numpy is not None else values
+
+    def get_actual_positions(self, axes: Iterable[PMDAxis] = PMDAxis) -> Sequence[int]:
+        return self._get_register(axes, PMD_COMMAND_GETACTUALPOSITION)
+
+    def get_positions(self, axes: Iterable[PMDAxis] = PMDAxis) -> Sequence[int]:
+        return self._get_register(axes, PMD_COMMAND_GETPOSITION)
+
+    def get_position_errors(self, axes: Iterable[PMDAxis] = PMDAxis) -> Sequence[int]:
+        return self._get_register(axes, PMD_COMMAND_GETPOSITIONERROR)
+
+    def get_velocities(self, axes: Iterable[PMDAxis] = PMDAxis) -> Sequence[int]:
+        return self._get_register(axes, PMD_COMMAND_GETVELOCITY)
+
+    def get_activity_statuses(self, axes: Iterable[PMDAxis] = PMDAxis) -> Sequence[int]:
+        return self._get_register(axes, PMD_COMMAND_GETACTIVITYSTATUS)
+
+    def get_event_statuses(self, axes: Iterable[PMDAxis] = PMDAxis) -> Sequence[int]:
+        return self._get_register(axes, PMD_COMMAND_GETEVENTSTATUS)
+
+    def get_signal_statuses(self, axes: Iterable[PMDAxis] = PMDAxis) -> Sequence[int]:
+        return self._get_register(axes, PMD_COMMAND_GETSIGNALSTATUS)
+
+    def set_registers(self, command: PMDCommand, values: Mapping[PMDAxis, int]) -> None:
+        # Sends a single-argument Set command to every axis in values in one pipelined batch.
+        with self.batch() as batch:
+            for axis, value in values.items():
+                batch._transact(command, axis.value, value)
+
+    def set_positions(self, values: Mapping[PMDAxis, int]) -> None:
+        self.set_registers(PMD_COMMAND_SETPOSITION, values)
+
+    def set_velocities(self, values: Mapping[PMDAxis, int]) -> None:
+        self.set_registers(PMD_COMMAND_SETVELOCITY, values)
+
+    def _register_plan(self, axes: Tuple[PMDAxis, ...], commands: Tuple[PMDCommand, ...]) -> _PMDRegisterPlan:
+        # The packets and response layout of a register read only depend on its axes and commands, so they are
+        # built once and kept for the next read.
+        key = (axes, commands)
+        plan = self._register_plans.get(key)
+        if plan is not None:
+            return plan
+        for command in commands:
+            if command.opcode not in _REGISTER_FORMATS:
+                raise ValueError(f'{command.name} cannot be read into a register array')
+        packets = bytearray()
+        pending, frames, formats = [], [], ['>']
+        response_offset = 0
+        for axis in axes:
+            for command in commands:
+                offset = len(packets)
+                packets.extend(bytes(command.packet.size))
+                command.pack_into(packets, offset, axis.value)
+                pending.append((command, offset, None, None))
+                frames.append((response_offset, command.response_length))
+                formats.append(_REGISTER_FORMATS[command.opcode])
+                response_offset += command.response_length
+        plan = _PMDRegisterPlan(
+            bytes(packets), pending, [command.response_length for command, _, _, _ in pending], tuple(frames),
+            struct.Struct(''.join(formats)), (len(axes), len(commands)),
+        )
+        self._cache_plan(key, plan)
+        return plan
+
+    @staticmethod
+    def _valid_frames(data: bytes, plan: _PMDRegisterPlan) -> bool:
+        if len(data) != plan.response.size:
+            return False
+        for offset, length in plan.frames:
+            if data[offset] != 0 or sum(data[offset:offset + length]) & 0xFF:
+                return False
+        return True
+
+    # Bulk buffer access. Every word is its own WriteBuffer or ReadBuffer command, which moves the buffer's write or
+    # read index on by one; the commands are pipelined PMD_BUFFER_CHUNK at a time so that a table moves at close to
+    # line rate. index, when given, is set first; values of read_buffer are returned like those of get_registers.
+    def write_buffer(self, buffer_id: int, values: Iterable[int], index: Optional[int] = None) -> None:
+        if index is not None:
+            self.SetBufferWriteIndex(buffer_id, index)
+        command = PMD_COMMAND_WRITEBUFFER
+        size = command.packet.size
+        values = iter(values)
+        while True:
+            chunk = [int(value) for _, value in zip(range(PMD_BUFFER_CHUNK), values)]
+            if not chunk:
+                return
+            packets = bytearray(size * len(chunk))
+            for offset, value in zip(range(0, len(packets), size), chunk):
+                command.pack_into(packets, offset, 0, buffer_id, value)
+            self._execute_plan(self._buffer_plan(command, bytes(packets), len(chunk), 'xx'))
+
+    def read_buffer(self, buffer_id: int, count: int, index: Optional[int] = None) -> Sequence[int]:
+        if index is not None:
+            self.SetBufferReadIndex(buffer_id, index)
+        values = array('i')
+        for offset in range(0, count, PMD_BUFFER_CHUNK):
+            length = min(PMD_BUFFER_CHUNK, count - offset)
+            plan = self._register_plans.get((PMD_COMMAND_READBUFFER, buffer_id, length))
+            if plan is None:
+                packet = bytearray(PMD_COMMAND_READBUFFER.packet.size)
+                PMD_COMMAND_READBUFFER.pack_into(packet, 0, 0, buffer_id)
+                plan = self._buffer_plan(PMD_COMMAND_READBUFFER, bytes(packet) * length, length, 'xxi')
+                self._cache_plan((PMD_COMMAND_READBUFFER, buffer_id, length), plan)
+            values.extend(plan.response.unpack_from(self._execute_plan(plan)))
+        return numpy.frombuffer(values, numpy.intc) if numpy is not None else values
+
+    @staticmethod
+    def _buffer_plan(command: PMDCommand, packets: bytes, count: int, response_format: str) -> _PMDRegisterPlan:
+        size = command.packet.size
+        length = command.response_length
+        return _PMDRegisterPlan(
+            packets, [(command, offset, None, None) for offset in range(0, count * size, size)], [length] * count,
+            tuple((offset, length) for offset in range(0, count * length, length)),
+            struct.Struct('>' + response_format * count), (count, 1),
+        )
+
+    def _cache_plan(self, key: tuple, plan: _PMDRegisterPlan) -> None:
+        if len(self._register_plans) >= 64:
+            self._register_plans.clear()
+        self._register_plans[key] = plan
+
+    def _read_registers(
+        self, axes: Iterable[PMDAxis], commands: Iterable[PMDCommand]
+    ) -> Tuple[array, _PMDRegisterPlan]:
+        plan = self._register_plan(tuple(axes), tuple(commands))
+        return array('i', plan.response.unpack_from(self._execute_plan(plan))), plan
+
+    def _execute_plan(self, plan: _PMDRegisterPlan) -> bytes:
+        # Sends every packet of the plan in one write and returns the concatenated responses, which are only
+        # returned if every command succeeded.
+        instrumentation = self.instrumentation
+        records = [] if instrumentation is not None else None
+        error = None
+        with self._slot(command for command, _, _, _ in plan.pending):
+            if records is None and self.retry_policy is None:
+                self._mc.write(plan.packets)
+                data = self._read(plan.response.size)
+                responses = None
+                if not self._valid_frames(data, plan):
+                    responses = list(PMDCommandBatch._collect(
+                        self._split_responses(data, plan.lengths), len(plan.pending)
+                    ))
+            else:
+                # the batch's exchange keeps the records and applies the retry policy
+                batch = PMDCommandBatch(self)
+                responses = batch._exchange(plan.packets, plan.packets, plan.pending, records)
+                if self.retry_policy is not None:
+                    batch._recover(plan.packets, plan.pending, responses, records)
+            if responses is not None:
+                for (command, _, _, _), response in zip(plan.pending, responses):
+                    if isinstance(response, Exception):
+                        error = response
+                    elif response[0] != 0:
+                        error = PMDCommandError(command.name, response[0])
+                    if error is not None:
+                        break
+                else:
+                    data = b''.join(responses)
+            shadow = self.shadow
+            if shadow is not None and error is None:
+                for (command, offset, _, _), (start, length) in zip(plan.pending, plan.frames):
+                    if command.opcode in PMD_SHADOWED_GET_OPCODES:
+                        packet = plan.packets[offset:offset + command.packet.size]
+                        shadow.update(command, packet, data[start:start + length])
+        if records:
+            for record in records:
+                instrumentation.record(record)
+        if error is not None:
+            raise error
+        return data
+
+
+class PMDCommandBatch(PMDCommandSet):
+    # Queues commands instead of performing them. Each queued command returns a Future that is resolved when the
+    # batch executes: all packets go out in a single write and the responses come back in a single bulk read.
+    #
+    #   with pmd.batch() as b:
+    #       b.SetPosition(AXIS1, 1000)
+    #       b.SetVelocity(AXIS1, velocity)
+    #       b.Update(AXIS1)
+    #       position = b.GetActualPosition(AXIS2)
+    #   print(position.result())
+    #
+    # A batch belongs to the thread that fills it; executing it holds the interface lock for the whole exchange.
+    def __init__(self, interface: PMDAxisInterface):
+        self._interface = interface
+        self._packets = bytearray()
+        self._pending = []
+
+    def __enter__(self) -> 'PMDCommandBatch':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is None:
+            self.execute()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _transact(
+        self, command: PMDCommand, axis: int = 0, *arguments: int, decode: Optional[Callable[[bytes], Any]] = None
+    ) -> Future:
+        offset = len(self._packets)
+        self._packets += command.build(axis, *arguments)
+        result = Future()
+        shadow = self._interface.shadow
+        if shadow is not None:
+            packet = self._packets[offset:]
+            response = shadow.lookup(command, packet)
+            if response is not None:
+                del self._packets[offset:]
+                result.set_result(decode(response) if decode is not None else None)
+                return result
+            shadow.forget(command, packet)
+        self._pending.append((command, offset, decode, result))
+        return result
+
+    def execute(self) -> None:
+        if not self._pending:
+            return
+        packets, pending = self._packets, self._pending
+        self._packets, self._pending = bytearray(), []
+
+        shadow = self._interface.shadow
+        instrumentation = self._interface.instrumentation
+        records = [] if instrumentation is not None else None
+        with self._interface._slot(command for command, _, _, _ in pending):
+            responses = self._exchange(packets, packets, pending, records)
+            if self._interface.retry_policy is not None:
+                self._recover(packets, pending, responses, records)
+        if records:
+            for record in records:
+                instrumentation.record(record)
+        error = None
+        for (command, offset, decode, result), response in zip(pending, responses):
+            try:
+                if isinstance(response, Exception):
+                    raise response
+                if shadow is not None:
+                    shadow.update(command, packets[offset:offset + command.packet.size], response)
+                if response[0] != 0:
+                    raise PMDCommandError(command.name, response[0])
+                result.set_result(decode(response) if decode is not None else None)
+            except Exception as e:
+                result.set_exception(e)
+                error = error or e
+        if error is not None:
+            raise error
+
+    def _exchange(
+        self, data: bytes, packets: bytes, pending: list, records: Optional[List[PMDCommandRecord]]
+    ) -> List[Any]:
+        # Writes data, the packets of pending, and returns a response or PMDCommunicationError for each of them.
+        # Records of the exchange are appended to records unless it is None.
+        start = time.perf_counter() if records is not None else 0.0
+        self._interface._mc.write(data)
+        responses = list(self._read_responses(pending))
+        if records is not None:
+            latency = time.perf_counter() - start
+            for (command, offset, _, _), response in zip(pending, responses):
+                failed = isinstance(response, Exception)
+                records.append(PMDCommandRecord(
+                    command.name, command.opcode, packets[offset + 2], command.packet.size,
+                    0 if failed else len(response), latency, PMD_NOERROR if failed else response[0],
+                    _communication_error(response if failed else None), len(pending),
+                ))
+        return responses
+
+    def _recover(
+        self, packets: bytes, pending: list, responses: List[Any], records: Optional[List[PMDCommandRecord]]
+    ) -> None:
+        # Called with the interface lock held. Once the stream is out of frame every command from the first failure
+        # on has failed; they are sent again after resynchronizing, but only if all of them are idempotent.
+        interface = self._interface
+        policy = interface.retry_policy
+        for attempt in range(policy.attempts + 1):
+            failed = next((index for index, response in enumerate(responses) if isinstance(response, Exception)), None)
+            if failed is None:
+                return
+            try:
+                interface._resynchronize()
+            except PMDCommunicationError:
+                return
+            retry = pending[failed:]
+            if attempt == policy.attempts:
+                return
+            if any(command.opcode not in PMD_IDEMPOTENT_COMMANDS for command, _, _, _ in retry):
+                return
+            time.sleep(policy.delay(attempt))
+            data = b''.join(packets[offset:offset + command.packet.size] for command, offset, _, _ in retry)
+            responses[failed:] = self._exchange(data, packets, retry, records)
+
+    def _read_responses(self, pending: list) -> Iterator[Any]:
+        lengths = [command.response_length for command, _, _, _ in pending]
+        return self._collect(self._interface._read_responses(lengths), len(pending))
+
+    @staticmethod
+    def _collect(responses: Iterator[bytes], count: int) -> Iterator[Any]:
+        for index in range(count):
+            try:
+                yield next(responses)
+            except PMDCommunicationError as e:
+                # the stream is out of frame from here on, so every remaining command shares the error
+                for _ in range(index, count):
+                    yield e
+                return
+
+
+def setup_serial_interfaces(
+    ports: Iterable[str], baudrate: int, deadline: float = 1.0, max_workers: Optional[int] = None
+) -> Tuple[Dict[str, PMDAxisInterface], Dict[str, Exception]]:
+    # Brings up a PMDAxisInterface on every port at once and returns the connected interfaces and the errors of the
+    # ports that failed, both keyed by port, so that a fleet restart takes about one deadline instead of one per port.
+    ports = list(ports)
+    interfaces, errors = {}, {}
+    if not ports:
+        return interfaces, errors
+
+    def connect(port: str) -> PMDAxisInterface:
+        interface = PMDAxisInterface()
+        interface.SetupAxisInterface_Serial(port, baudrate, deadline)
+        return interface
+
+    with ThreadPoolExecutor(max_workers or len(ports)) as executor:
+        futures = {port: executor.submit(connect, port) for port in ports}
+    for port, future in futures.items():
+        try:
+            interfaces[port] = future.result()
+        except Exception as e:
+            errors[port] = e
+    return interfaces, errors
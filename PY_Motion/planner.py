@@ -0,0 +1,343 @@
+import math
+import time
+from typing import List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+from .main import *
+from .poller import PMDStatusPoller, PMDStatusRegister
+
+try:
+    import numpy
+except ImportError:  # optional; plan_moves plans one move at a time without it
+    numpy = None
+
+# Scale of the profile registers: velocity and acceleration are in 1/2^16 counts per cycle (squared), jerk in 1/2^32
+# counts per cycle cubed.
+_VELOCITY_SCALE = 1 << 16
+_ACCELERATION_SCALE = 1 << 16
+_JERK_SCALE = 1 << 32
+
+_INT32 = (-(1 << 31), (1 << 31) - 1)
+_UINT32 = (0, (1 << 32) - 1)
+
+
+class PMDProfile(NamedTuple):
+    # Register values of a point-to-point move, as sent by SetProfileMode, SetPosition, SetVelocity, SetAcceleration
+    # and SetJerk, with the predicted duration of the move.
+    axis: PMDAxis
+    mode: PMDProfileMode
+    position: int
+    velocity: int
+    acceleration: int
+    jerk: int
+    duration: float  # seconds from Update to the end of the move, starting at rest from the commanded position
+
+
+def _register(name: str, value: float, scale: float, limits: Tuple[int, int]) -> int:
+    register = int(round(value * scale))
+    if not limits[0] <= register <= limits[1]:
+        raise ValueError(f'{name} {value} is out of range')
+    if register == 0 and value != 0:
+        raise ValueError(f'{name} {value} is below the resolution of the motion controller')
+    return register
+
+
+def _registers(name: str, values: 'numpy.ndarray', scale: float, limits: Tuple[int, int]) -> 'numpy.ndarray':
+    registers = numpy.rint(values * scale).astype(numpy.int64)
+    if numpy.any((registers < limits[0]) | (registers > limits[1])):
+        raise ValueError(f'{name} is out of range')
+    if numpy.any((registers == 0) & (values != 0)):
+        raise ValueError(f'{name} is below the resolution of the motion controller')
+    return registers
+
+
+def _cycles(distance: int, velocity: int, acceleration: int, jerk: int) -> float:
+    # Cycles needed to travel distance counts from rest to rest. The trapezoidal profile (jerk 0) accelerates to the
+    # maximum velocity, cruises and decelerates; the S-curve profile additionally ramps the acceleration at the jerk
+    # rate. Either may end before reaching the maximum velocity (or acceleration) on a short move.
+    if distance == 0:
+        return 0.0
+    v = velocity / _VELOCITY_SCALE
+    a = acceleration / _ACCELERATION_SCALE
+    if v <= 0 or a <= 0:
+        return math.inf
+    if jerk == 0:
+        if distance >= v * v / a:
+            return distance / v + v / a
+        return 2 * math.sqrt(distance / a)
+    j = jerk / _JERK_SCALE
+    ramp = a / j  # cycles to reach the maximum acceleration
+    if v <= a * ramp:
+        accelerating = 2 * math.sqrt(v / j)
+    else:
+        accelerating = ramp + v / a
+    if v * accelerating <= distance:
+        return 2 * accelerating + (distance - v * accelerating) / v
+    peak = (distance * math.sqrt(j) / 2) ** (2 / 3)  # peak velocity without a constant acceleration phase
+    if peak <= a * ramp:
+        return 4 * math.sqrt(peak / j)
+    peak = a * (math.sqrt(ramp * ramp + 4 * distance / a) - ramp) / 2
+    return 2 * (ramp + peak / a)
+
+
+def _cycles_vector(
+    distance: 'numpy.ndarray', velocity: 'numpy.ndarray', acceleration: 'numpy.ndarray', jerk: 'numpy.ndarray'
+) -> 'numpy.ndarray':
+    # _cycles for arrays of moves
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        v = velocity / _VELOCITY_SCALE
+        a = acceleration / _ACCELERATION_SCALE
+        j = jerk / _JERK_SCALE
+        trapezoidal = numpy.where(
+            distance >= v * v / a, distance / v + v / a, 2 * numpy.sqrt(distance / a)
+        )
+        ramp = a / j
+        accelerating = numpy.where(v <= a * ramp, 2 * numpy.sqrt(v / j), ramp + v / a)
+        peak = (distance * numpy.sqrt(j) / 2) ** (2 / 3)
+        peak_constant = a * (numpy.sqrt(ramp * ramp + 4 * distance / a) - ramp) / 2
+        s_curve = numpy.where(
+            v * accelerating <= distance,
+            2 * accelerating + (distance - v * accelerating) / v,
+            numpy.where(peak <= a * ramp, 4 * numpy.sqrt(peak / j), 2 * (ramp + peak_constant / a)),
+        )
+        cycles = numpy.where(jerk == 0, trapezoidal, s_curve)
+    cycles = numpy.where((v <= 0) | (a <= 0), numpy.inf, cycles)
+    return numpy.where(distance == 0, 0.0, cycles)
+
+
+class PMDProfilePlanner:
+    # Turns moves given in physical units (counts or steps, per second, per second squared and per second cubed) into
+    # profile register values for the sample time of one motion controller, predicts how long they take and loads
+    # them in a single pipelined batch:
+    #
+    #   planner = PMDProfilePlanner(pmd)
+    #   profile = planner.plan(AXIS1, 10000, velocity=2000.0, acceleration=8000.0)
+    #   planner.load([profile], update=True)
+    #   time.sleep(profile.duration)
+    #
+    # plan_moves plans many moves at once, with vectorized arithmetic when numpy is installed.
+    def __init__(self, interface: PMDAxisInterface):
+        self.interface = interface
+        self._sample_time = None
+
+    @property
+    def sample_time(self) -> float:
+        # seconds per cycle, read from the motion controller once
+        if self._sample_time is None:
+            self._sample_time = self.interface.GetSampleTime() / 1e6
+        return self._sample_time
+
+    def refresh(self) -> None:
+        self._sample_time = None
+
+    def velocity(self, counts_per_second: float) -> int:
+        return _register('velocity', counts_per_second, self.sample_time * _VELOCITY_SCALE, _INT32)
+
+    def acceleration(self, counts_per_second2: float) -> int:
+        return _register('acceleration', counts_per_second2, self.sample_time ** 2 * _ACCELERATION_SCALE, _UINT32)
+
+    def jerk(self, counts_per_second3: float) -> int:
+        return _register('jerk', counts_per_second3, self.sample_time ** 3 * _JERK_SCALE, _UINT32)
+
+    def duration(self, distance: int, velocity: int, acceleration: int, jerk: int = 0) -> float:
+        # seconds for a move of distance counts with the given register values
+        return _cycles(abs(distance), velocity, acceleration, jerk) * self.sample_time
+
+    def plan(
+        self,
+        axis: PMDAxis,
+        position: int,
+        velocity: float,
+        acceleration: float,
+        jerk: Optional[float] = None,
+        start: Optional[int] = None,
+    ) -> PMDProfile:
+        # A trapezoidal move, or an S-curve move if jerk is given. start is the commanded position the move begins
+        # from, read from the motion controller if None; it only affects the predicted duration.
+        if start is None:
+            start = self.interface.GetCommandedPosition(axis)
+        velocity = self.velocity(velocity)
+        acceleration = self.acceleration(acceleration)
+        jerk = self.jerk(jerk) if jerk is not None else 0
+        mode = PMDProfileMode.S_CURVE if jerk else PMDProfileMode.TRAPEZOIDAL
+        duration = self.duration(position - start, velocity, acceleration, jerk)
+        return PMDProfile(axis, mode, position, velocity, acceleration, jerk, duration)
+
+    def plan_moves(
+        self,
+        axes: Sequence[PMDAxis],
+        positions: Sequence[int],
+        velocities: Sequence[float],
+        accelerations: Sequence[float],
+        jerks: Optional[Sequence[float]] = None,
+        starts: Optional[Sequence[int]] = None,
+    ) -> List[PMDProfile]:
+        # plan for every element of the sequences; the start positions are read in one pipelined request if None
+        axes = tuple(axes)
+        if starts is None:
+            starts = self.interface.get_registers(axes, (PMD_COMMAND_GETCOMMANDEDPOSITION,))
+        if numpy is None:
+            jerks = jerks if jerks is not None else [None] * len(axes)
+            return [
+                self.plan(*move)
+                for move in zip(axes, positions, velocities, accelerations, jerks, (int(start) for start in starts))
+            ]
+        sample_time = self.sample_time
+        positions = numpy.asarray(positions, numpy.int64)
+        velocities = _registers('velocity', numpy.asarray(velocities, float), sample_time * _VELOCITY_SCALE, _INT32)
+        accelerations = _registers(
+            'acceleration', numpy.asarray(accelerations, float), sample_time ** 2 * _ACCELERATION_SCALE, _UINT32
+        )
+        if jerks is None:
+            jerks = numpy.zeros(len(axes), numpy.int64)
+        else:
+            jerks = _registers('jerk', numpy.asarray(jerks, float), sample_time ** 3 * _JERK_SCALE, _UINT32)
+        distances = numpy.abs(positions - numpy.asarray(starts, numpy.int64).reshape(-1))
+        durations = _cycles_vector(distances, velocities, accelerations, jerks) * sample_time
+        return [
+            PMDProfile(
+                axis, PMDProfileMode.S_CURVE if jerk else PMDProfileMode.TRAPEZOIDAL, position, velocity,
+                acceleration, jerk, duration,
+            )
+            for axis, position, velocity, acceleration, jerk, duration in zip(
+                axes, positions.tolist(), velocities.tolist(), accelerations.tolist(), jerks.tolist(),
+                durations.tolist(),
+            )
+        ]
+
+    @staticmethod
+    def queue(batch: PMDCommandBatch, profiles: Sequence[PMDProfile], update: bool = False) -> None:
+        # Adds the commands that load the profiles (and, if update is True, start each of them) to batch.
+        for profile in profiles:
+            batch.SetProfileMode(profile.axis, profile.mode)
+            batch.SetPosition(profile.axis, profile.position)
+            batch.SetVelocity(profile.axis, profile.velocity)
+            batch.SetAcceleration(profile.axis, profile.acceleration)
+            if profile.mode is PMDProfileMode.S_CURVE:
+                batch.SetJerk(profile.axis, profile.jerk)
+            if update:
+                batch.Update(profile.axis)
+
+    def load(self, profiles: Sequence[PMDProfile], update: bool = False) -> None:
+        with self.interface.batch() as batch:
+            self.queue(batch, profiles, update)
+
+
+class PMDCoordinatedMove:
+    # Point-to-point move of several axes of one motion controller that start together: the profiles of all axes are
+    # loaded in one pipelined batch that ends in a MultiUpdate.
+    #
+    #   move = PMDCoordinatedMove(planner, {AXIS1: 10000, AXIS2: -2500}, velocity=2000.0, acceleration=8000.0)
+    #   move.start(poller).wait(timeout=10.0)
+    #
+    # velocity, acceleration and jerk are limits in physical units, either for all axes or per axis. With
+    # synchronize=True every axis follows the same profile shape scaled to its distance, so that all of them arrive
+    # at the same time; each limit is then the smallest one that keeps every axis within its own limits. The moving
+    # axes must then either all have a jerk limit or none, since a trapezoidal and an S-curve profile cannot be
+    # scaled into one another.
+    def __init__(
+        self,
+        planner: PMDProfilePlanner,
+        targets: Mapping[PMDAxis, int],
+        velocity: Union[float, Mapping[PMDAxis, float]],
+        acceleration: Union[float, Mapping[PMDAxis, float]],
+        jerk: Union[None, float, Mapping[PMDAxis, float]] = None,
+        synchronize: bool = False,
+        starts: Optional[Mapping[PMDAxis, int]] = None,
+    ):
+        self.planner = planner
+        axes = tuple(targets)
+
+        def limits(value: Union[None, float, Mapping[PMDAxis, float]]) -> Optional[List[float]]:
+            if value is None or not isinstance(value, Mapping):
+                return None if value is None else [value] * len(axes)
+            return [value[axis] for axis in axes]
+
+        if starts is None:
+            values = planner.interface.get_registers(axes, (PMD_COMMAND_GETCOMMANDEDPOSITION,))
+            self.starts = dict(zip(axes, (int(value) for value in (
+                values.reshape(-1) if numpy is not None else values
+            ))))
+        else:
+            self.starts = {axis: starts[axis] for axis in axes}
+        profiles = planner.plan_moves(
+            axes, [targets[axis] for axis in axes], limits(velocity), limits(acceleration), limits(jerk),
+            [self.starts[axis] for axis in axes],
+        )
+        self.profiles = self._synchronized(profiles) if synchronize else profiles
+        self.mask = PMDAxisMask(sum(1 << axis.value for axis in axes))
+
+    def _synchronized(self, profiles: List[PMDProfile]) -> List[PMDProfile]:
+        # The limits per count of distance shared by all moving axes, scaled back up to each axis' distance.
+        distances = [abs(profile.position - self.starts[profile.axis]) for profile in profiles]
+        moving = [(profile, distance) for profile, distance in zip(profiles, distances) if distance]
+        if not moving:
+            return profiles
+        if len({profile.mode for profile, _ in moving}) > 1:
+            raise ValueError('synchronized axes need a jerk limit on every moving axis or on none of them')
+        velocity = min(profile.velocity / distance for profile, distance in moving)
+        acceleration = min(profile.acceleration / distance for profile, distance in moving)
+        jerk = min(profile.jerk / distance for profile, distance in moving)
+        synchronized = []
+        for profile, distance in zip(profiles, distances):
+            if distance:
+                registers = (
+                    max(int(round(velocity * distance)), 1), max(int(round(acceleration * distance)), 1),
+                    max(int(round(jerk * distance)), 1) if profile.jerk else 0,
+                )
+                profile = profile._replace(
+                    velocity=registers[0], acceleration=registers[1], jerk=registers[2],
+                    duration=self.planner.duration(distance, *registers),
+                )
+            synchronized.append(profile)
+        return synchronized
+
+    @property
+    def axes(self) -> Tuple[PMDAxis, ...]:
+        return tuple(profile.axis for profile in self.profiles)
+
+    @property
+    def duration(self) -> float:
+        # predicted seconds until the last axis arrives
+        return max((profile.duration for profile in self.profiles), default=0.0)
+
+    def start(self, poller: Optional[PMDStatusPoller] = None) -> 'PMDMoveHandle':
+        # Loads every profile and starts all axes with one MultiUpdate, in a single pipelined batch. Completion is
+        # waited for through poller if given, otherwise by reading the activity status of all axes at once.
+        with self.planner.interface.batch() as batch:
+            self.planner.queue(batch, self.profiles)
+            batch.MultiUpdate(self.mask)
+        return PMDMoveHandle(self, poller, time.monotonic())
+
+
+class PMDMoveHandle:
+    def __init__(self, move: PMDCoordinatedMove, poller: Optional[PMDStatusPoller], started: float):
+        self.move = move
+        self.poller = poller
+        self.started = started
+
+    @property
+    def expected_end(self) -> float:
+        # time.monotonic() at which the move is predicted to end
+        return self.started + self.move.duration
+
+    def done(self) -> bool:
+        if self.poller is not None:
+            snapshot = self.poller.snapshot()
+            return snapshot.timestamp >= self.started and not any(
+                snapshot.get(axis, PMDStatusRegister.ACTIVITY_STATUS).in_motion for axis in self.move.axes
+            )
+        statuses = self.move.planner.interface.get_activity_statuses(self.move.axes)
+        return not any(PMDActivityStatus(int(status)).in_motion for status in statuses)
+
+    def wait(self, timeout: Optional[float] = None, poll_interval: float = 0.01) -> None:
+        # Blocks until every axis of the move has stopped; TimeoutError after timeout seconds.
+        if self.poller is not None:
+            self.poller.wait_for_motion_complete(self.move.axes, timeout)
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = self.expected_end - time.monotonic()  # nothing to poll for until the move should be over
+        if delay > 0:
+            time.sleep(delay if deadline is None else min(delay, max(deadline - time.monotonic(), 0)))
+        while not self.done():
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f'move not complete within {timeout}s')
+            time.sleep(poll_interval)
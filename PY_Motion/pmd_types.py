@@ -1,4 +1,5 @@
 from enum import Enum, Flag
+from typing import Union
 
 
 class PMDAction(Enum):
@@ -12,52 +13,60 @@ class PMDAction(Enum):
 
 
 class PMDActivityStatus:
-    def __init__(self, status: bytes):
-        self._status = status
+    # Value of the 16-bit activity status register, constructed from the register value or its big-endian bytes.
+    __slots__ = ('value',)
+
+    def __init__(self, status: Union[int, bytes]):
+        self.value = status if isinstance(status, int) else int.from_bytes(status, byteorder='big')
+
+    def __eq__(self, other):
+        return isinstance(other, PMDActivityStatus) and other.value == self.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        return f'PMDActivityStatus(0x{self.value:04X})'
 
     @property
     def at_max_velocity(self):
-        return self._status[1] & 0x02 != 0
+        return self.value & 0x0002 != 0
 
     @property
     def tracking(self):
-        return self._status[1] & 0x04 != 0
+        return self.value & 0x0004 != 0
 
     @property
     def profile_mode(self):
-        return (self._status[1] >> 3) & 0x07
+        return (self.value >> 3) & 0x07
 
     @property
     def axis_settled(self):
-        return self._status[1] & 0x80 != 0
+        return self.value & 0x0080 != 0
 
     @property
     def motor_on(self):
-        return self._status[0] & 0x01 != 0
+        return self.value & 0x0100 != 0
 
     @property
     def position_capture(self):
-        return self._status[0] & 0x02 != 0
+        return self.value & 0x0200 != 0
 
     @property
     def in_motion(self):
-        return self._status[0] & 0x04 != 0
+        return self.value & 0x0400 != 0
 
     @property
     def in_positive_limit(self):
-        return self._status[0] & 0x08 != 0
+        return self.value & 0x0800 != 0
 
     @property
     def in_negative_limit(self):
-        return self._status[0] & 0x10 != 0
+        return self.value & 0x1000 != 0
 
     @property
     def profile_segment(self):
-        return self._status[0] >> 5 & 0x07
-
-    @property
-    def value(self):
-        return int.from_bytes(self._status, byteorder='big')
+        return self.value >> 13 & 0x07
 
 
 class PMDAxis(Enum):
@@ -206,6 +215,50 @@ class PMDStopMode(Enum):
     SMOOTH_STOP = 2
 
 
+class PMDTraceCondition(Enum):
+    IMMEDIATE = 0
+    UPDATE = 1
+    EVENT_STATUS = 2
+    ACTIVITY_STATUS = 3
+    SIGNAL_STATUS = 4
+    DRIVE_STATUS = 7
+
+
+class PMDTraceMode(Enum):
+    ONE_TIME = 0
+    ROLLING_BUFFER = 1
+
+
+class PMDTraceState(Enum):
+    LOW = 0
+    HIGH = 1
+
+
+class PMDTraceStatus(Flag):
+    NONE = 0x0000
+    MODE = 0x0001
+    ACTIVE = 0x0002
+    WRAP = 0x0004
+
+
+class PMDTraceVariable(Enum):
+    NONE = 0
+    POSITION_ERROR = 1
+    COMMANDED_POSITION = 2
+    COMMANDED_VELOCITY = 3
+    COMMANDED_ACCELERATION = 4
+    ACTUAL_POSITION = 5
+    ACTUAL_VELOCITY = 6
+    ACTIVE_MOTOR_COMMAND = 7
+    CHIP_TIME = 8
+    CAPTURE_VALUE = 9
+    INTEGRAL = 10
+    DERIVATIVE = 11
+    EVENT_STATUS = 12
+    ACTIVITY_STATUS = 13
+    SIGNAL_STATUS = 14
+
+
 class PMDTrigger(Enum):
     NONE = 0
     GT_OR_EQ_COMMANDED_POSITION = 1
@@ -222,33 +275,46 @@ class PMDTrigger(Enum):
 
 
 class PMDVersion:
-    def __init__(self, version: bytes):
-        self._version = version
+    # The 32-bit GetVersion register: family and motor type, axes and chips, customization code, firmware version.
+    # Constructed from the register value; the big-endian register bytes are still accepted.
+    __slots__ = ('value',)
+
+    def __init__(self, version: Union[int, bytes]):
+        self.value = version if isinstance(version, int) else int.from_bytes(version, byteorder='big')
+
+    def __eq__(self, other):
+        return isinstance(other, PMDVersion) and other.value == self.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        return f'PMDVersion(0x{self.value:08X})'
 
     @property
     def family(self):
-        return PMDProductFamily(self._version[0] >> 4)
+        return PMDProductFamily(self.value >> 28)
 
     @property
     def motor_type(self):
-        return PMDMotorType(self._version[0] & 0x0F)
+        return PMDMotorType(self.value >> 24 & 0x0F)
 
     @property
     def number_of_axes(self):
-        return self._version[1] >> 4
+        return self.value >> 20 & 0x0F
 
     @property
     def chip_count(self):
-        return self._version[1] & 0x03
+        return self.value >> 16 & 0x03
 
     @property
     def custom(self):
-        return self._version[2]
+        return self.value >> 8 & 0xFF
 
     @property
     def major(self):
-        return self._version[3] >> 4
+        return self.value >> 4 & 0x0F
 
     @property
     def minor(self):
-        return self._version[3] & 0x0F
+        return self.value & 0x0F
@@ -0,0 +1,315 @@
+import asyncio
+import threading
+import time
+from enum import Enum
+from types import MappingProxyType
+from typing import Any, Callable, Iterable, Mapping, NamedTuple, Optional, Union
+from .main import *
+
+
+class PMDStatusRegister(Enum):
+    ACTIVITY_STATUS = 'GetActivityStatus'
+    EVENT_STATUS = 'GetEventStatus'
+    SIGNAL_STATUS = 'GetSignalStatus'
+    ACTUAL_POSITION = 'GetActualPosition'
+    POSITION = 'GetPosition'
+    POSITION_ERROR = 'GetPositionError'
+    VELOCITY = 'GetVelocity'
+
+
+PMD_DEFAULT_STATUS_REGISTERS = (
+    PMDStatusRegister.ACTIVITY_STATUS,
+    PMDStatusRegister.EVENT_STATUS,
+    PMDStatusRegister.SIGNAL_STATUS,
+    PMDStatusRegister.ACTUAL_POSITION,
+)
+
+
+class PMDStatusSnapshot(NamedTuple):
+    timestamp: float  # time.monotonic() just before the sample was requested
+    values: Mapping[PMDAxis, Mapping[PMDStatusRegister, Any]]
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.timestamp
+
+    @property
+    def in_motion(self) -> bool:
+        return any(
+            registers[PMDStatusRegister.ACTIVITY_STATUS].in_motion
+            for registers in self.values.values() if PMDStatusRegister.ACTIVITY_STATUS in registers
+        )
+
+    def get(self, axis: PMDAxis, register: PMDStatusRegister) -> Any:
+        return self.values[axis][register]
+
+
+PMDCondition = Union[PMDEventStatus, Callable[[Any], bool]]
+
+
+class PMDStatusPoller:
+    # Samples a fixed set of status registers on a set of axes from a background thread, reading all of them in one
+    # pipelined batch per cycle, and publishes each sample as an immutable PMDStatusSnapshot. Any number of readers
+    # can then use the latest snapshot without touching the serial line.
+    #
+    # The poll interval adapts to the motion state when ACTIVITY_STATUS is sampled: every `interval` seconds while
+    # any axis is in motion or anyone is waiting in wait_for, every `idle_interval` seconds otherwise. After failed
+    # polls the interval backs off exponentially, up to `max_backoff` seconds. Any other exception ends the polling
+    # thread; it is kept as `failure` and raised by snapshot(), get() and the wait_for methods until start() is
+    # called again.
+    def __init__(
+        self,
+        interface: PMDAxisInterface,
+        axes: Iterable[PMDAxis] = PMDAxis,
+        registers: Iterable[PMDStatusRegister] = PMD_DEFAULT_STATUS_REGISTERS,
+        interval: float = 0.02,
+        idle_interval: float = 0.2,
+        max_backoff: float = 5.0,
+    ):
+        self.interface = interface
+        self.axes = tuple(axes)
+        self.registers = tuple(registers)
+        self.interval = interval
+        self.idle_interval = idle_interval
+        self.max_backoff = max_backoff
+        self.last_error = None
+        self.failure = None
+        self._snapshot = None
+        self._failures = 0
+        self._waiters = 0  # threads and coroutines in wait_for
+        self._async_waiters = []  # (loop, Future) resolved by the next sample
+        self._published = threading.Condition()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def __enter__(self) -> 'PMDStatusPoller':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopping.clear()
+        self.failure = None
+        self._thread = threading.Thread(target=self._run, name='PMDStatusPoller', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _publish(self, snapshot: Optional[PMDStatusSnapshot], error: Optional[Exception] = None) -> None:
+        with self._published:
+            if snapshot is not None:
+                self._snapshot = snapshot
+            self.last_error = error
+            self._published.notify_all()
+            async_waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in async_waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:
+                pass  # the loop was closed while its coroutine waited; nobody is left to wake
+
+    def poll(self) -> PMDStatusSnapshot:
+        timestamp = time.monotonic()
+        with self.interface.batch() as batch:
+            results = {
+                axis: {register: getattr(batch, register.value)(axis) for register in self.registers}
+                for axis in self.axes
+            }
+        snapshot = PMDStatusSnapshot(
+            timestamp,
+            MappingProxyType({
+                axis: MappingProxyType({register: result.result() for register, result in registers.items()})
+                for axis, registers in results.items()
+            }),
+        )
+        self._publish(snapshot)
+        return snapshot
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.clear()
+            try:
+                snapshot = self.poll()
+            except (PMDCommunicationError, PMDCommandError) as e:
+                self._publish(None, e)
+                self._failures += 1
+                interval = min(self.idle_interval * 2 ** self._failures, self.max_backoff)
+            except Exception as e:
+                self.failure = e
+                self._publish(None, e)
+                return
+            else:
+                self._failures = 0
+                moving = snapshot.in_motion or PMDStatusRegister.ACTIVITY_STATUS not in self.registers
+                interval = self.interval if moving or self._waiters else self.idle_interval
+            self._wake.wait(interval)
+
+    def snapshot(self, max_age: Optional[float] = None, timeout: float = 1.0) -> PMDStatusSnapshot:
+        # Returns the latest snapshot. If it is older than max_age, the poller is woken early and the call waits up to
+        # timeout seconds for a fresh one.
+        self._check()
+        snapshot = self._snapshot
+        if snapshot is not None and (max_age is None or snapshot.age <= max_age):
+            return snapshot
+        if not self.running:
+            return self.poll()
+        deadline = time.monotonic() + timeout
+        with self._published:
+            while True:
+                self._check()
+                snapshot = self._snapshot
+                if snapshot is not None and (max_age is None or snapshot.age <= max_age):
+                    return snapshot
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    if self.last_error is not None:
+                        raise self.last_error
+                    raise PMDCommunicationError('timeout waiting for a status sample')
+                self._wake.set()
+                self._published.wait(remaining)
+
+    def _check(self) -> None:
+        if self.failure is not None:
+            raise self.failure
+
+    def get(self, axis: PMDAxis, register: PMDStatusRegister, max_age: Optional[float] = None) -> Any:
+        return self.snapshot(max_age).get(axis, register)
+
+    def _condition(
+        self, axes: Union[PMDAxis, Iterable[PMDAxis]], condition: PMDCondition, register: Optional[PMDStatusRegister]
+    ) -> Callable[[PMDStatusSnapshot], Iterable[bool]]:
+        axes = (axes,) if isinstance(axes, PMDAxis) else tuple(axes)
+        if isinstance(condition, PMDEventStatus):
+            mask = condition
+            register = register or PMDStatusRegister.EVENT_STATUS
+            condition = lambda status: status & mask == mask
+        register = register or PMDStatusRegister.ACTIVITY_STATUS
+        if register not in self.registers:
+            raise ValueError(f'{register} is not sampled by this poller')
+        return lambda snapshot: (condition(snapshot.get(axis, register)) for axis in axes)
+
+    def wait_for(
+        self,
+        axes: Union[PMDAxis, Iterable[PMDAxis]],
+        condition: PMDCondition,
+        timeout: Optional[float] = None,
+        register: Optional[PMDStatusRegister] = None,
+        require_all: bool = True,
+    ) -> PMDStatusSnapshot:
+        # Blocks until condition holds on all (or with require_all=False, any) of axes, judged only on samples
+        # requested after the call. condition is either a PMDEventStatus mask whose bits must all be set, or a
+        # predicate applied to each axis' value of register (ACTIVITY_STATUS unless given). The waiters share the
+        # poller's samples and never touch the serial line themselves.
+        if not self.running:
+            self._check()
+            raise RuntimeError('status poller is not running')
+        results = self._condition(axes, condition, register)
+        combine = all if require_all else any
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        with self._published:
+            self._waiters += 1
+            self._wake.set()
+            try:
+                while True:
+                    self._check()
+                    snapshot = self._snapshot
+                    if snapshot is not None and snapshot.timestamp >= start and combine(results(snapshot)):
+                        return snapshot
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f'condition not met within {timeout}s') from self.last_error
+                    self._published.wait(remaining)
+            finally:
+                self._waiters -= 1
+
+    async def wait_for_async(
+        self,
+        axes: Union[PMDAxis, Iterable[PMDAxis]],
+        condition: PMDCondition,
+        timeout: Optional[float] = None,
+        register: Optional[PMDStatusRegister] = None,
+        require_all: bool = True,
+    ) -> PMDStatusSnapshot:
+        # Coroutine version of wait_for; the event loop is woken by the poller thread on every new sample.
+        if not self.running:
+            self._check()
+            raise RuntimeError('status poller is not running')
+        results = self._condition(axes, condition, register)
+        combine = all if require_all else any
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        entry = None
+        with self._published:
+            self._waiters += 1
+        self._wake.set()
+        try:
+            while True:
+                with self._published:
+                    self._check()
+                    snapshot = self._snapshot
+                    if snapshot is not None and snapshot.timestamp >= start and combine(results(snapshot)):
+                        return snapshot
+                    if entry is None or entry[1].done():
+                        entry = (loop, loop.create_future())
+                        self._async_waiters.append(entry)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f'condition not met within {timeout}s') from self.last_error
+                try:
+                    await asyncio.wait_for(asyncio.shield(entry[1]), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._published:
+                self._waiters -= 1
+                if entry in self._async_waiters:
+                    self._async_waiters.remove(entry)
+
+    def wait_for_motion_complete(
+        self, axes: Union[PMDAxis, Iterable[PMDAxis]], timeout: Optional[float] = None
+    ) -> PMDStatusSnapshot:
+        return self.wait_for(axes, lambda status: not status.in_motion, timeout)
+
+    async def wait_for_motion_complete_async(
+        self, axes: Union[PMDAxis, Iterable[PMDAxis]], timeout: Optional[float] = None
+    ) -> PMDStatusSnapshot:
+        return await self.wait_for_async(axes, lambda status: not status.in_motion, timeout)
+
+    def wait_for_event(
+        self,
+        axes: Union[PMDAxis, Iterable[PMDAxis]],
+        event: PMDEventStatus,
+        timeout: Optional[float] = None,
+        require_all: bool = True,
+    ) -> PMDStatusSnapshot:
+        return self.wait_for(axes, event, timeout, require_all=require_all)
+
+    async def wait_for_event_async(
+        self,
+        axes: Union[PMDAxis, Iterable[PMDAxis]],
+        event: PMDEventStatus,
+        timeout: Optional[float] = None,
+        require_all: bool = True,
+    ) -> PMDStatusSnapshot:
+        return await self.wait_for_async(axes, event, timeout, require_all=require_all)
+
+
+def _resolve(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
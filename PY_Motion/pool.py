@@ -0,0 +1,294 @@
+import multiprocessing
+import multiprocessing.connection
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+from .main import *
+
+
+def _arguments(arguments: Any) -> Tuple[Any, ...]:
+    return arguments if isinstance(arguments, tuple) else (arguments,)
+
+
+def _check_method(method: str) -> None:
+    if method.startswith('_') or not callable(getattr(PMDAxisInterface, method, None)):
+        raise ValueError(f'PMDAxisInterface has no method {method!r}')
+
+
+def _invoke(interface: PMDAxisInterface, method: str, calls: Sequence[Tuple[Any, ...]]) -> List[Any]:
+    # Performs method once per argument tuple, pipelined in one batch when there is more than one call and method is
+    # a motion controller command. Other methods, such as get_registers or write_buffer, are called one by one.
+    if len(calls) == 1 or not hasattr(PMDCommandSet, method):
+        return [getattr(interface, method)(*arguments) for arguments in calls]
+    with interface.batch() as batch:
+        futures = [getattr(batch, method)(*arguments) for arguments in calls]
+    return [future.result() for future in futures]
+
+
+def _serve(port: str, baudrate: int, deadline: float, connection: multiprocessing.connection.Connection) -> None:
+    # Body of a controller process: owns the interface and performs the calls sent over connection until it is
+    # closed or sent None.
+    interface = PMDAxisInterface()
+    try:
+        interface.SetupAxisInterface_Serial(port, baudrate, deadline)
+    except Exception as e:
+        connection.send((False, e))
+        return
+    connection.send((True, None))
+    try:
+        while True:
+            try:
+                request = connection.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            try:
+                connection.send((True, _invoke(interface, *request)))
+            except Exception as e:
+                connection.send((False, e))
+    finally:
+        interface.CloseAxisInterface()
+
+
+class PMDControllerHealth(NamedTuple):
+    name: str
+    connected: bool
+    calls: int
+    failures: int  # calls that failed to communicate with the motion controller
+    consecutive_failures: int
+    last_error: Optional[Exception]  # last communication or connection error
+    last_latency: float  # seconds taken by the last call
+
+    @property
+    def healthy(self) -> bool:
+        return self.connected and self.consecutive_failures == 0
+
+
+class PMDPoolResult(NamedTuple):
+    values: Dict[str, Any]  # controller -> result, for the controllers that succeeded
+    errors: Dict[str, Exception]  # controller -> error, for the controllers that failed or are not connected
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+class _PMDController:
+    # One controller of a pool. Every call runs on the controller's own worker thread, which either uses the
+    # interface directly or, in process mode, forwards the call to the process that owns it.
+    def __init__(self, name: str, port: Union[str, PMDTransport], baudrate: int, deadline: float, process: bool):
+        self.name = name
+        self.port = port
+        self.baudrate = baudrate
+        self.deadline = deadline
+        self.process = process
+        self.interface = None
+        self._connection = None
+        self._child = None
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error = None
+        self.last_latency = 0.0
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix=f'PMDController-{name}')
+
+    @property
+    def connected(self) -> bool:
+        return self.interface is not None or self._connection is not None
+
+    def connect(self) -> None:
+        if self.connected:
+            return
+        if not self.process:
+            interface = PMDAxisInterface()
+            if isinstance(self.port, str):
+                interface.SetupAxisInterface_Serial(self.port, self.baudrate, self.deadline)
+            else:
+                interface.SetupAxisInterface(self.port, self.deadline)
+            self.interface = interface
+            return
+        connection, child_connection = multiprocessing.Pipe()
+        child = multiprocessing.Process(
+            target=_serve, args=(self.port, self.baudrate, self.deadline, child_connection),
+            name=f'PMDController-{self.name}', daemon=True,
+        )
+        child.start()
+        child_connection.close()
+        try:
+            connected, error = connection.recv()
+        except EOFError:
+            connected, error = False, PMDCommunicationError(f'controller process for {self.port} exited')
+        if not connected:
+            connection.close()
+            child.join()
+            raise error
+        self._connection, self._child = connection, child
+
+    def invoke(self, method: str, calls: Sequence[Tuple[Any, ...]]) -> List[Any]:
+        if not self.connected:
+            raise PMDCommunicationError(f'{self.name} is not connected')
+        start = time.perf_counter()
+        try:
+            if self._connection is None:
+                results = _invoke(self.interface, method, calls)
+            else:
+                try:
+                    self._connection.send((method, calls))
+                    succeeded, results = self._connection.recv()
+                except (EOFError, OSError) as e:
+                    self._disconnect()
+                    raise PMDCommunicationError(f'controller process for {self.name} is gone') from e
+                if not succeeded:
+                    raise results
+        except PMDCommunicationError as e:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = e
+            raise
+        except Exception:
+            self.consecutive_failures = 0  # rejected by the motion controller, which is therefore reachable
+            raise
+        finally:
+            self.calls += 1
+            self.last_latency = time.perf_counter() - start
+        self.consecutive_failures = 0
+        return results
+
+    def health(self) -> PMDControllerHealth:
+        return PMDControllerHealth(
+            self.name, self.connected, self.calls, self.failures, self.consecutive_failures, self.last_error,
+            self.last_latency,
+        )
+
+    def _disconnect(self) -> None:
+        if self.interface is not None:
+            self.interface.CloseAxisInterface()
+            self.interface = None
+        if self._connection is not None:
+            try:
+                self._connection.send(None)
+            except OSError:
+                pass
+            self._connection.close()
+            self._child.join()
+            self._connection = self._child = None
+
+    def close(self) -> None:
+        self.executor.submit(self._disconnect).result()
+        self.executor.shutdown()
+
+
+class PMDControllerPool:
+    # Owns the interfaces of many motion controllers, one per port, and runs the same command on all of them at
+    # once, so that a sweep of the whole fleet takes about as long as the slowest controller's round trip:
+    #
+    #   with PMDControllerPool(['/dev/ttyUSB0', '/dev/ttyUSB1'], 115200) as pool:
+    #       positions = pool.map('GetActualPosition', [AXIS1, AXIS2])
+    #       for port, (axis1, axis2) in positions.values.items():
+    #           ...
+    #
+    # Each controller gets a worker thread of its own, which is enough as the serial I/O does not hold the GIL.
+    # With processes=True each controller is instead driven by a process of its own, which opens the port itself;
+    # the arguments and results of calls must then be picklable. ports maps controller names to ports (or, in thread
+    # mode, to PMDTransports); a list of ports uses the ports as names.
+    def __init__(
+        self,
+        ports: Union[Iterable[str], Mapping[str, Union[str, PMDTransport]]],
+        baudrate: int = 115200,
+        deadline: float = 1.0,
+        processes: bool = False,
+        connect: bool = True,
+    ):
+        if not isinstance(ports, Mapping):
+            ports = {port: port for port in ports}
+        self.controllers = {
+            name: _PMDController(name, port, baudrate, deadline, processes) for name, port in ports.items()
+        }
+        if connect:
+            self.connect()
+
+    def __enter__(self) -> 'PMDControllerPool':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.controllers)
+
+    def connect(self) -> Dict[str, Exception]:
+        # (Re)connects every controller that is not connected, all at once; returns the errors by controller.
+        futures = {
+            name: controller.executor.submit(controller.connect) for name, controller in self.controllers.items()
+        }
+        errors = {}
+        for name, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                controller = self.controllers[name]
+                controller.last_error = e
+                errors[name] = e
+        return errors
+
+    def close(self) -> None:
+        for controller in self.controllers.values():
+            controller.close()
+
+    def submit(self, name: str, method: str, *arguments: Any) -> Future:
+        # Performs method(*arguments) on one controller; the Future resolves to its result.
+        _check_method(method)
+        controller = self.controllers[name]
+        future = Future()
+
+        def done(calls: Future) -> None:
+            error = calls.exception()
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(calls.result()[0])
+
+        controller.executor.submit(controller.invoke, method, [arguments]).add_done_callback(done)
+        return future
+
+    def call(
+        self, method: str, *arguments: Any, names: Optional[Iterable[str]] = None, timeout: Optional[float] = None
+    ) -> PMDPoolResult:
+        # Performs method(*arguments) on every controller (or those in names) at once.
+        results = self._gather(method, [arguments], names, timeout)
+        return PMDPoolResult({name: values[0] for name, values in results.values.items()}, results.errors)
+
+    def map(
+        self,
+        method: str,
+        arguments: Iterable[Any],
+        names: Optional[Iterable[str]] = None,
+        timeout: Optional[float] = None,
+    ) -> PMDPoolResult:
+        # Performs method once per element of arguments (a single argument or a tuple of them) on every controller
+        # (or those in names) at once. Each controller pipelines its calls in one batch if method is a command; its
+        # result is the list of return values in the order of arguments.
+        return self._gather(method, [_arguments(element) for element in arguments], names, timeout)
+
+    def _gather(
+        self, method: str, calls: List[Tuple[Any, ...]], names: Optional[Iterable[str]], timeout: Optional[float]
+    ) -> PMDPoolResult:
+        _check_method(method)
+        controllers = [self.controllers[name] for name in (self.controllers if names is None else names)]
+        futures = {
+            controller.name: controller.executor.submit(controller.invoke, method, calls)
+            for controller in controllers
+        }
+        deadline = None if timeout is None else time.monotonic() + timeout
+        values, errors = {}, {}
+        for name, future in futures.items():
+            try:
+                values[name] = future.result(None if deadline is None else max(deadline - time.monotonic(), 0))
+            except Exception as e:
+                errors[name] = e
+        return PMDPoolResult(values, errors)
+
+    def health(self) -> Dict[str, PMDControllerHealth]:
+        return {name: controller.health() for name, controller in self.controllers.items()}
@@ -0,0 +1,182 @@
+import heapq
+import itertools
+import threading
+import time
+from enum import IntEnum
+from typing import ContextManager, Dict, Optional
+from .commands import *
+from .instrumentation import _copy_stats, _histogram, _histogram_add, _histogram_quantile
+
+
+class PMDPriority(IntEnum):
+    SAFETY = 0
+    MOTION = 1
+    CONFIGURATION = 2
+    TELEMETRY = 3
+
+
+# Commands are CONFIGURATION unless listed here
+PMD_COMMAND_PRIORITIES = {
+    **{opcode: PMDPriority.TELEMETRY for opcode in PMD_READ_ONLY_COMMANDS},
+    **{command.opcode: PMDPriority.TELEMETRY for command in (
+        PMD_COMMAND_GETCAPTUREVALUE,
+        PMD_COMMAND_READBUFFER,
+    )},
+    **{command.opcode: PMDPriority.MOTION for command in (
+        PMD_COMMAND_UPDATE,
+        PMD_COMMAND_MULTIUPDATE,
+        PMD_COMMAND_SETPOSITION,
+        PMD_COMMAND_SETVELOCITY,
+        PMD_COMMAND_SETACCELERATION,
+        PMD_COMMAND_SETJERK,
+        PMD_COMMAND_SETPROFILEMODE,
+        PMD_COMMAND_SETBREAKPOINT,
+        PMD_COMMAND_SETBREAKPOINTVALUE,
+        PMD_COMMAND_SETACTUALPOSITION,
+        PMD_COMMAND_ADJUSTACTUALPOSITION,
+        PMD_COMMAND_CLEARPOSITIONERROR,
+    )},
+    **{command.opcode: PMDPriority.SAFETY for command in (
+        PMD_COMMAND_SETSTOPMODE,
+        PMD_COMMAND_SETOPERATINGMODE,
+        PMD_COMMAND_RESTOREOPERATINGMODE,
+        PMD_COMMAND_RESET,
+    )},
+}
+
+
+def command_priority(command: PMDCommand) -> PMDPriority:
+    return PMD_COMMAND_PRIORITIES.get(command.opcode, PMDPriority.CONFIGURATION)
+
+
+class PMDQueueWaitStats:
+    __slots__ = ('priority', 'slots', 'wait_sum', 'max_wait', 'wait_buckets', 'preemptions')
+
+    def __init__(self, priority: PMDPriority):
+        self.priority = priority
+        self.slots = 0
+        self.wait_sum = 0.0
+        self.max_wait = 0.0
+        self.wait_buckets = _histogram()  # over PMD_LATENCY_BUCKETS
+        self.preemptions = 0  # slots taken ahead of commands that had been waiting longer
+
+    @property
+    def mean_wait(self) -> float:
+        return self.wait_sum / self.slots if self.slots else 0.0
+
+    def wait_quantile(self, quantile: float) -> float:
+        return _histogram_quantile(self.wait_buckets, quantile)
+
+
+class PMDCommandScheduler:
+    # Reentrant lock that hands the line to the most urgent waiting command. Set it as the lock of an interface
+    # before the interface is shared:
+    #
+    #   pmd.lock = PMDCommandScheduler()
+    #
+    # Single commands, batches and register reads then queue for the line at the priority of their most urgent
+    # command, and when the exchange holding the line ends it passes straight to the first of the most urgent
+    # waiters; a stop therefore waits for at most one exchange however many status reads are queued. Send a stop
+    # as one batch, e.g. SetStopMode and Update, so that all of it goes out at SAFETY priority. Code that takes
+    # the lock directly, as in `with pmd.lock:`, queues at the default priority.
+    #
+    # statistics holds the time spent queueing for the line per priority.
+    def __init__(self, default: PMDPriority = PMDPriority.CONFIGURATION):
+        self.default = default
+        self.statistics = {priority: PMDQueueWaitStats(priority) for priority in PMDPriority}
+        self._lock = threading.Lock()
+        self._owner = None
+        self._depth = 0
+        self._waiting = []  # heap of [priority, ticket, queued at, event, thread]
+        self._tickets = itertools.count()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.release()
+
+    def slot(self, priority: PMDPriority) -> ContextManager:
+        return _PMDSlot(self, priority)
+
+    def waiting(self) -> Dict[PMDPriority, int]:
+        # Commands queued for the line, by priority.
+        with self._lock:
+            counts = dict.fromkeys(PMDPriority, 0)
+            for entry in self._waiting:
+                counts[entry[0]] += 1
+            return counts
+
+    def acquire(self, blocking: bool = True, timeout: float = -1, priority: Optional[PMDPriority] = None) -> bool:
+        thread = threading.get_ident()
+        priority = self.default if priority is None else priority
+        with self._lock:
+            if self._owner == thread:
+                self._depth += 1
+                return True
+            if self._owner is None and not self._waiting:
+                self._owner, self._depth = thread, 1
+                self._record(self.statistics[priority], 0.0, False)
+                return True
+            if not blocking:
+                return False
+            entry = [priority, next(self._tickets), time.perf_counter(), threading.Event(), thread]
+            heapq.heappush(self._waiting, entry)
+        if entry[3].wait(None if timeout < 0 else timeout):
+            return True
+        with self._lock:
+            if self._owner == thread:  # handed over while timing out
+                return True
+            self._waiting.remove(entry)
+            heapq.heapify(self._waiting)
+            return False
+
+    def release(self) -> None:
+        with self._lock:
+            if self._owner != threading.get_ident():
+                raise RuntimeError('cannot release un-acquired lock')
+            self._depth -= 1
+            if self._depth > 0:
+                return
+            self._owner = None
+            if not self._waiting:
+                return
+            priority, ticket, queued, event, thread = heapq.heappop(self._waiting)
+            preempted = any(entry[1] < ticket for entry in self._waiting)
+            self._record(self.statistics[priority], time.perf_counter() - queued, preempted)
+            self._owner, self._depth = thread, 1
+            event.set()
+
+    @staticmethod
+    def _record(stats: PMDQueueWaitStats, wait: float, preempted: bool) -> None:
+        stats.slots += 1
+        stats.wait_sum += wait
+        stats.max_wait = max(stats.max_wait, wait)
+        _histogram_add(stats.wait_buckets, wait)
+        stats.preemptions += preempted
+
+    def snapshot(self) -> Dict[PMDPriority, PMDQueueWaitStats]:
+        # Consistent copy of the queue wait statistics.
+        with self._lock:
+            return {
+                priority: _copy_stats(stats, PMDQueueWaitStats(priority)) for priority, stats in self.statistics.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.statistics = {priority: PMDQueueWaitStats(priority) for priority in PMDPriority}
+
+
+class _PMDSlot:
+    __slots__ = ('scheduler', 'priority')
+
+    def __init__(self, scheduler: PMDCommandScheduler, priority: PMDPriority):
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def __enter__(self) -> None:
+        self.scheduler.acquire(priority=self.priority)
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.scheduler.release()
+
@@ -0,0 +1,95 @@
+from typing import Optional, Union
+from .commands import *
+from .pmd_types import PMDAxis
+
+PMD_SHADOWED_GET_OPCODES = frozenset(command.opcode for command in PMD_SHADOWED_COMMANDS.values())
+
+
+class PMDShadowMismatchError(Exception):
+    def __init__(self, command: str, shadowed: bytes, actual: bytes):
+        self.command = command
+        self.shadowed = shadowed
+        self.actual = actual
+        self.message = f'shadowed value {shadowed.hex()} differs from motion controller value {actual.hex()}'
+
+
+class PMDRegisterShadow:
+    # Host-side copy of the configuration registers listed in PMD_SHADOWED_COMMANDS, keyed by axis, Get opcode and
+    # Get arguments. Successful Set commands write through to it and Get commands fill it, after which a Get is
+    # answered locally. Reset clears it and RestoreOperatingMode clears the registers of its axis.
+    #
+    # With elide_writes=True a Set listed in PMD_ELIDABLE_COMMANDS that would write the value the shadow already holds
+    # is acknowledged locally instead of being sent. Commands with side effects are never in that list.
+    #
+    # With verify=True every Get still goes to the motion controller and a PMDShadowMismatchError is raised when the
+    # shadow disagrees with it; this is meant for debugging code that changes registers behind the shadow's back.
+    def __init__(self, verify: bool = False, elide_writes: bool = False):
+        self.verify = verify
+        self.elide_writes = elide_writes
+        self.hits = 0
+        self.misses = 0
+        self.elided_writes = 0
+        self.elided_writes_by_command = {}
+        self._registers = {}
+
+    def __len__(self) -> int:
+        return len(self._registers)
+
+    @staticmethod
+    def _key(packet: bytes, get_command: PMDCommand) -> bytes:
+        return bytes((packet[2], get_command.opcode)) + bytes(packet[4:get_command.packet.size])
+
+    def lookup(self, command: PMDCommand, packet: bytes) -> Optional[bytes]:
+        # Returns the response the motion controller would send for the command in packet, or None if the command
+        # has to go to the motion controller.
+        if command.opcode not in PMD_SHADOWED_GET_OPCODES:
+            if self.elide_writes and not self.verify and command.opcode in PMD_ELIDABLE_COMMANDS:
+                get_command = PMD_SHADOWED_COMMANDS[command.opcode]
+                data = self._registers.get(self._key(packet, get_command))
+                if data is not None and data == packet[get_command.packet.size:command.packet.size]:
+                    self.elided_writes += 1
+                    self.elided_writes_by_command[command.name] = self.elided_writes_by_command.get(command.name, 0) + 1
+                    return bytes(2)
+            return None
+        data = None if self.verify else self._registers.get(self._key(packet, command))
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        response = bytearray(2) + data
+        response[1] = -sum(response) & 0xFF
+        return bytes(response)
+
+    def forget(self, command: PMDCommand, packet: bytes) -> None:
+        # Drops whatever the command in packet is about to change, for when its outcome is not known yet.
+        get_command = PMD_SHADOWED_COMMANDS.get(command.opcode)
+        if get_command is not None:
+            self._registers.pop(self._key(packet, get_command), None)
+        elif command.opcode == PMD_COMMAND_RESTOREOPERATINGMODE.opcode:
+            self.invalidate(packet[2])
+
+    def update(self, command: PMDCommand, packet: bytes, response: bytes) -> None:
+        # Records the effect of a command that the motion controller has acknowledged.
+        if response[0] != 0:
+            return
+        get_command = PMD_SHADOWED_COMMANDS.get(command.opcode)
+        if get_command is not None:
+            self._registers[self._key(packet, get_command)] = bytes(packet[get_command.packet.size:command.packet.size])
+        elif command.opcode in PMD_SHADOWED_GET_OPCODES:
+            key = self._key(packet, command)
+            shadowed = self._registers.get(key)
+            actual = self._registers[key] = bytes(response[2:command.response_length])
+            if self.verify and shadowed is not None and shadowed != actual:
+                raise PMDShadowMismatchError(command.name, shadowed, actual)
+        elif command.opcode == PMD_COMMAND_RESET.opcode:
+            self.invalidate()
+        elif command.opcode == PMD_COMMAND_RESTOREOPERATINGMODE.opcode:
+            self.invalidate(packet[2])
+
+    def invalidate(self, axis: Union[PMDAxis, int, None] = None) -> None:
+        if axis is None:
+            self._registers.clear()
+            return
+        axis = axis.value if isinstance(axis, PMDAxis) else axis
+        for key in [key for key in self._registers if key[0] == axis]:
+            del self._registers[key]
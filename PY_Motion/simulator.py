@@ -0,0 +1,762 @@
+import math
+import os
+import struct
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+from .commands import *
+from .pmd_types import *
+from .transport import PMDTransport
+
+# Velocity and acceleration registers are in 1/2^16 counts per cycle (squared), jerk in 1/2^32 counts per cycle cubed.
+_FRACTION = 1 << 16
+
+_RESPONSE_FORMATS = {1: '>H', 2: '>I'}  # data words in the response -> format of a single register value
+
+_MEMORY_SIZE = 0x10000  # 32-bit words of buffer memory
+_TRACE_BUFFER = 0
+_TRACE_VARIABLES = 4
+
+_MOTOR_OUTPUT = PMDOperatingMode.MOTOR_OUTPUT_ENABLED.value
+_CURRENT_LOOP = PMDOperatingMode.CURRENT_CONTROL_ENABLED.value
+_POSITION_LOOP = PMDOperatingMode.POSITION_LOOP_ENABLED.value
+_TRAJECTORY = PMDOperatingMode.TRAJECTORY_ENABLED.value
+
+
+class _CommandError(Exception):
+    def __init__(self, error_code: int):
+        self.error_code = error_code
+
+
+class _SimulatedAxis:
+    def __init__(self):
+        # buffered registers, copied into the profile generator by Update
+        self.position = 0
+        self.velocity = 0
+        self.acceleration = 0
+        self.jerk = 0
+        self.profile_mode = PMDProfileMode.TRAPEZOIDAL.value
+        self.stop_mode = PMDStopMode.NO_STOP.value
+        self.clear_position_error = False
+
+        # profile generator state
+        self.target = 0
+        self.max_velocity = 0
+        self.max_acceleration = 0
+        self.max_jerk = 0
+        self.mode = PMDProfileMode.TRAPEZOIDAL.value
+        self.commanded = 0  # 1/2^16 counts
+        self.commanded_velocity = 0  # 1/2^16 counts per cycle
+        self.commanded_acceleration = 0  # 1/2^16 counts per cycle squared
+        self.in_motion = False
+        self.at_max_velocity = False
+
+        self.actual = 0
+        self.actual_velocity = 0
+        self.capture = 0
+        self.event_status = 0
+        self.encoder_source = PMDEncoderSource.LOOPBACK.value
+        self.encoder_to_step_ratio = (1, 1)
+        self.actual_position_units = PMDPositionUnits.STEPS.value
+        self.signal_sense = PMDSignalSense.STEP_OUTPUT.value
+        self.position_error_limit = 0xFFFF
+        self.event_actions = {event.value: PMDAction.NONE.value for event in PMDEvent}
+        self.event_actions[PMDEvent.POSITIVE_LIMIT.value] = PMDAction.ABRUPT_STOP_POSITION_ERROR_CLEAR.value
+        self.event_actions[PMDEvent.NEGATIVE_LIMIT.value] = PMDAction.ABRUPT_STOP_POSITION_ERROR_CLEAR.value
+        self.capture_source = PMDCaptureSource.INDEX.value
+        self.breakpoints = [0, 0]
+        self.breakpoint_values = [0, 0]
+        self.operating_mode = 0x33
+        self.programmed_operating_mode = 0x33
+
+    @property
+    def commanded_position(self) -> int:
+        return (self.commanded + _FRACTION // 2) // _FRACTION  # rounded to the nearest count
+
+    @property
+    def position_error(self) -> int:
+        return self.commanded_position - self.actual
+
+    @property
+    def activity_status(self) -> int:
+        status = self.at_max_velocity << 1 | self.mode << 3 | (not self.in_motion) << 7
+        status |= bool(self.operating_mode & _MOTOR_OUTPUT) << 8
+        status |= self.in_motion << 10
+        return status
+
+    def stop(self) -> None:
+        self.target = self.commanded_position
+        self.commanded = self.target * _FRACTION
+        self.commanded_velocity = 0
+        self.commanded_acceleration = 0
+        self.at_max_velocity = False
+        if self.in_motion:
+            self.in_motion = False
+            self.event_status |= PMDEventStatus.MOTION_COMPLETE.value
+
+    def update(self) -> None:
+        if self.clear_position_error:
+            self.commanded = self.actual * _FRACTION
+            self.target = self.actual
+            self.clear_position_error = False
+        if self.stop_mode == PMDStopMode.ABRUPT_STOP.value:
+            self.stop_mode = PMDStopMode.NO_STOP.value
+            self.stop()
+            return
+        if self.stop_mode == PMDStopMode.SMOOTH_STOP.value:
+            self.stop_mode = PMDStopMode.NO_STOP.value
+            self.mode = PMDProfileMode.VELOCITY_CONTOURING.value
+            self.max_velocity = 0
+        else:
+            self.mode = self.profile_mode
+            self.target = self.position
+            self.max_velocity = self.velocity
+            self.max_acceleration = self.acceleration
+            self.max_jerk = self.jerk
+        if self.operating_mode & (_POSITION_LOOP | _TRAJECTORY) != _POSITION_LOOP | _TRAJECTORY:
+            return
+        self.in_motion = True
+
+    def step(self) -> Optional[PMDEvent]:
+        # Runs the profile generator for one cycle. Returns the event that the cycle raised, if any.
+        if self.in_motion:
+            if self.mode == PMDProfileMode.VELOCITY_CONTOURING.value:
+                self._step_velocity()
+            else:
+                self._step_position()
+        if self.encoder_source == PMDEncoderSource.LOOPBACK.value:
+            position = self.commanded_position
+            self.actual_velocity = position - self.actual
+            self.actual = position
+        if abs(self.position_error) > self.position_error_limit and \
+                not self.event_status & PMDEventStatus.MOTION_ERROR.value:
+            self.event_status |= PMDEventStatus.MOTION_ERROR.value
+            return PMDEvent.MOTION_ERROR
+        return None
+
+    def _step_velocity(self) -> None:
+        difference = self.max_velocity - self.commanded_velocity
+        change = max(min(difference, self.max_acceleration), -self.max_acceleration)
+        self.commanded_velocity += change
+        self.commanded += self.commanded_velocity
+        self.at_max_velocity = self.commanded_velocity == self.max_velocity
+        if self.max_velocity == 0 and self.commanded_velocity == 0:
+            self.stop()
+
+    def _step_position(self) -> None:
+        # Trapezoidal profile: accelerate up to the maximum velocity, limited at every cycle to the speed from which
+        # the axis can still stop at the target. The S-curve profile additionally ramps the acceleration up at the
+        # jerk rate; its deceleration phase is approximated by the trapezoidal one.
+        remaining = self.target * _FRACTION - self.commanded
+        if remaining == 0 and self.commanded_velocity == 0:
+            self.stop()
+            return
+        direction = 1 if remaining >= 0 else -1
+        speed = self.commanded_velocity * direction
+        acceleration = self.max_acceleration
+        if self.mode == PMDProfileMode.S_CURVE.value:
+            ramp = max(self.max_jerk // _FRACTION, 1)
+            acceleration = self.commanded_acceleration = min(self.commanded_acceleration + ramp, acceleration)
+        stopping_speed = math.isqrt(2 * self.max_acceleration * abs(remaining))
+        speed = min(speed + acceleration, self.max_velocity, stopping_speed)
+        if speed <= 0 < abs(remaining) and self.max_velocity > 0 and self.max_acceleration > 0:
+            speed = 1
+        if speed >= abs(remaining):
+            self.commanded = self.target * _FRACTION
+            self.commanded_velocity = 0
+            self.stop()
+            return
+        self.commanded += speed * direction
+        self.commanded_velocity = speed * direction
+        self.at_max_velocity = speed == self.max_velocity
+
+
+class MagellanSimulator:
+    # In-process model of a Magellan motion processor speaking the serial packet protocol. It keeps the registers
+    # PY-Motion reads and writes for every axis, runs trapezoidal, S-curve and velocity contouring profiles at the
+    # sample time rate and raises the activity and event status bits. Encoder feedback is simulated only in LOOPBACK
+    # mode, where the actual position follows the commanded position; other sources leave it where it was.
+    #
+    # Simulated time follows `clock` (time.monotonic by default); pass a different clock to step it manually.
+    def __init__(self, number_of_axes: int = 4, sample_time: int = 1024, clock: Callable[[], float] = time.monotonic):
+        self.number_of_axes = number_of_axes
+        self.sample_time = sample_time  # microseconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.axes = [_SimulatedAxis() for _ in range(self.number_of_axes)]
+        self.instruction_error = PMD_ERROR_RESET
+        self.io = {}
+        self.memory = {}  # address -> word
+        self.buffers = {}  # buffer id -> [start, length, read index, write index]
+        self.trace_mode = PMDTraceMode.ONE_TIME.value
+        self.trace_period = 1
+        self.trace_variables = [0] * _TRACE_VARIABLES  # variable << 8 | axis
+        self.trace_start = self.trace_stop = 0
+        self.trace_status = 0
+        self.trace_count = 0
+        self._trace_armed = False
+        self._trace_cycle = 0
+        self.cycles = 0
+        self._last_time = self.clock()
+        self._received = bytearray()
+
+    def advance(self, cycles: int) -> None:
+        for _ in range(cycles):
+            for axis in self.axes:
+                if axis.step() is PMDEvent.MOTION_ERROR:
+                    self._event_action(axis, PMDEvent.MOTION_ERROR)
+            self.cycles += 1
+            if self._trace_armed or self.trace_status & PMDTraceStatus.ACTIVE.value:
+                self._trace()
+
+    def _catch_up(self) -> None:
+        now = self.clock()
+        cycles = int((now - self._last_time) * 1e6 / self.sample_time)
+        if cycles <= 0:
+            return
+        self._last_time += cycles * self.sample_time / 1e6
+        if any(axis.in_motion for axis in self.axes) or self._trace_armed or \
+                self.trace_status & PMDTraceStatus.ACTIVE.value:
+            self.advance(cycles)
+        else:
+            self.cycles += cycles - 1
+            self.advance(1)  # nothing moves, but the loopback encoder and the error limit are still evaluated
+
+    def _trigger_met(self, trigger: int) -> bool:
+        axis = self.axes[trigger & 0x0F]
+        condition = trigger >> 4 & 0x0F
+        registers = {
+            PMDTraceCondition.EVENT_STATUS.value: axis.event_status,
+            PMDTraceCondition.ACTIVITY_STATUS.value: axis.activity_status,
+            PMDTraceCondition.SIGNAL_STATUS.value: self._GetSignalStatus(axis),
+        }
+        if condition not in registers:
+            return False
+        return (registers[condition] >> (trigger >> 8 & 0x0F) & 1) == trigger >> 12
+
+    def _start_trace(self) -> None:
+        self._trace_armed = False
+        self._trace_cycle = 0
+        self.trace_status |= PMDTraceStatus.ACTIVE.value
+
+    def _stop_trace(self) -> None:
+        self._trace_armed = False
+        self.trace_status &= ~PMDTraceStatus.ACTIVE.value
+
+    def _trace(self) -> None:
+        # Runs once per cycle while a trace is armed or running.
+        if self._trace_armed:
+            if not self._trigger_met(self.trace_start):
+                return
+            self._start_trace()
+        elif self.trace_stop >> 4 & 0x0F not in (PMDTraceCondition.IMMEDIATE.value, PMDTraceCondition.UPDATE.value) \
+                and self._trigger_met(self.trace_stop):
+            self._stop_trace()
+            return
+        self._trace_cycle += 1
+        if self._trace_cycle < self.trace_period:
+            return
+        self._trace_cycle = 0
+        buffer = self.buffers.get(_TRACE_BUFFER)
+        for selection in self.trace_variables:
+            variable = selection >> 8
+            if variable == PMDTraceVariable.NONE.value:
+                continue
+            start, length, read_index, write_index = buffer
+            self.memory[start + write_index] = self._trace_value(self.axes[selection & 0x0F], variable)
+            buffer[3] = (write_index + 1) % length
+            if self.trace_count == length:
+                buffer[2] = buffer[3]  # the oldest unread sample was overwritten
+            else:
+                self.trace_count += 1
+            if buffer[3] == 0:
+                if self.trace_mode == PMDTraceMode.ONE_TIME.value:
+                    self._stop_trace()
+                    return
+                self.trace_status |= PMDTraceStatus.WRAP.value
+
+    def _trace_value(self, axis: _SimulatedAxis, variable: int) -> int:
+        values = {
+            PMDTraceVariable.POSITION_ERROR.value: lambda: axis.position_error,
+            PMDTraceVariable.COMMANDED_POSITION.value: lambda: axis.commanded_position,
+            PMDTraceVariable.COMMANDED_VELOCITY.value: lambda: axis.commanded_velocity,
+            PMDTraceVariable.COMMANDED_ACCELERATION.value: lambda: axis.commanded_acceleration,
+            PMDTraceVariable.ACTUAL_POSITION.value: lambda: axis.actual,
+            PMDTraceVariable.ACTUAL_VELOCITY.value: lambda: axis.actual_velocity,
+            PMDTraceVariable.CHIP_TIME.value: lambda: self.cycles,
+            PMDTraceVariable.CAPTURE_VALUE.value: lambda: axis.capture,
+            PMDTraceVariable.EVENT_STATUS.value: lambda: axis.event_status,
+            PMDTraceVariable.ACTIVITY_STATUS.value: lambda: axis.activity_status,
+            PMDTraceVariable.SIGNAL_STATUS.value: lambda: self._GetSignalStatus(axis),
+        }
+        value = values[variable]() if variable in values else 0
+        return (value + 0x80000000) % 0x100000000 - 0x80000000
+
+    def _event_action(self, axis: _SimulatedAxis, event: PMDEvent) -> None:
+        action = axis.event_actions[event.value]
+        if action in (PMDAction.ABRUPT_STOP.value, PMDAction.ABRUPT_STOP_POSITION_ERROR_CLEAR.value):
+            axis.stop()
+        elif action == PMDAction.SMOOTH_STOP.value:
+            axis.mode = PMDProfileMode.VELOCITY_CONTOURING.value
+            axis.max_velocity = 0
+        elif action == PMDAction.DISABLE_POSITION_LOOP.value:
+            axis.operating_mode &= ~(_POSITION_LOOP | _TRAJECTORY)
+        elif action == PMDAction.DISABLE_CURRENT_LOOP.value:
+            axis.operating_mode &= ~(_CURRENT_LOOP | _POSITION_LOOP | _TRAJECTORY)
+        elif action == PMDAction.DISABLE_MOTOR_OUTPUT.value:
+            axis.operating_mode &= ~(_MOTOR_OUTPUT | _CURRENT_LOOP | _POSITION_LOOP | _TRAJECTORY)
+        if action != PMDAction.NONE.value and not axis.operating_mode & _POSITION_LOOP:
+            axis.stop()
+            axis.commanded = axis.actual * _FRACTION
+            axis.target = axis.actual
+
+    def receive(self, data: bytes) -> bytes:
+        # Feeds bytes sent by the host and returns the motion processor's response to every packet they complete.
+        with self.lock:
+            self._received += data
+            responses = bytearray()
+            while len(self._received) >= 4:
+                command = PMD_COMMANDS.get(self._received[3])
+                length = command.packet.size if command is not None else 4
+                if len(self._received) < length:
+                    break
+                packet = bytes(self._received[:length])
+                del self._received[:length]
+                responses += self._execute(command, packet)
+            return bytes(responses)
+
+    def _execute(self, command: Optional[PMDCommand], packet: bytes) -> bytes:
+        if sum(packet) & 0xFF != 0:
+            return self._response(PMD_ERROR_BADSERIALCHECKSUM)
+        if command is None:
+            return self._response(PMD_ERROR_INVALIDINSTRUCTION)
+        self._catch_up()
+        axis_number, _, *arguments = command.packet.unpack(packet)
+        if axis_number >= self.number_of_axes:
+            return self._response(PMD_ERROR_INVALIDAXIS)
+        handler = getattr(self, '_' + command.name, None)
+        if handler is None:
+            return self._response(PMD_ERROR_INVALIDINSTRUCTION)
+        try:
+            result = handler(self.axes[axis_number], *arguments)
+        except _CommandError as e:
+            return self._response(e.error_code)
+        except (ValueError, KeyError, IndexError, struct.error):
+            return self._response(PMD_ERROR_INVALIDPARAMETER)
+        if result is None:
+            return self._response(PMD_NOERROR)
+        words = (command.response_length - 2) // 2
+        if isinstance(result, bytes):
+            return self._response(PMD_NOERROR, result)
+        return self._response(PMD_NOERROR, struct.pack(_RESPONSE_FORMATS[words], result & (1 << 16 * words) - 1))
+
+    def _response(self, status: int, data: bytes = b'') -> bytes:
+        if status != PMD_NOERROR:
+            self.instruction_error = status
+        response = bytearray((status, 0)) + data
+        response[1] = -sum(response) & 0xFF
+        return bytes(response)
+
+    def _GetVersion(self, axis: _SimulatedAxis) -> bytes:
+        return bytes((
+            PMDProductFamily.MAGELLAN.value << 4 | PMDMotorType.PULSE_AND_DIRECTION.value,
+            self.number_of_axes << 4 | 1, 0, 0x10,
+        ))
+
+    def _NoOperation(self, axis: _SimulatedAxis) -> None:
+        pass
+
+    def _Reset(self, axis: _SimulatedAxis) -> None:
+        self.reset()
+
+    def _GetInstructionError(self, axis: _SimulatedAxis) -> int:
+        error, self.instruction_error = self.instruction_error, PMD_NOERROR
+        return error
+
+    def _GetSampleTime(self, axis: _SimulatedAxis) -> int:
+        return self.sample_time
+
+    def _GetEncoderSource(self, axis: _SimulatedAxis) -> int:
+        return axis.encoder_source
+
+    def _SetEncoderSource(self, axis: _SimulatedAxis, source: int) -> None:
+        axis.encoder_source = PMDEncoderSource(source).value
+
+    def _GetEncoderToStepRatio(self, axis: _SimulatedAxis) -> bytes:
+        return struct.pack('>HH', *axis.encoder_to_step_ratio)
+
+    def _SetEncoderToStepRatio(self, axis: _SimulatedAxis, counts: int, steps: int) -> None:
+        axis.encoder_to_step_ratio = (counts, steps)
+
+    def _GetActualPositionUnits(self, axis: _SimulatedAxis) -> int:
+        return axis.actual_position_units
+
+    def _SetActualPositionUnits(self, axis: _SimulatedAxis, units: int) -> None:
+        axis.actual_position_units = PMDPositionUnits(units).value
+
+    def _GetSignalSense(self, axis: _SimulatedAxis) -> int:
+        return axis.signal_sense
+
+    def _SetSignalSense(self, axis: _SimulatedAxis, sense: int) -> None:
+        axis.signal_sense = sense
+
+    def _GetPositionErrorLimit(self, axis: _SimulatedAxis) -> int:
+        return axis.position_error_limit
+
+    def _SetPositionErrorLimit(self, axis: _SimulatedAxis, limit: int) -> None:
+        axis.position_error_limit = limit
+
+    def _GetEventAction(self, axis: _SimulatedAxis, event: int) -> int:
+        return axis.event_actions[event]
+
+    def _SetEventAction(self, axis: _SimulatedAxis, event: int, action: int) -> None:
+        axis.event_actions[PMDEvent(event).value] = PMDAction(action).value
+
+    def _GetProfileMode(self, axis: _SimulatedAxis) -> int:
+        return axis.profile_mode
+
+    def _SetProfileMode(self, axis: _SimulatedAxis, mode: int) -> None:
+        axis.profile_mode = PMDProfileMode(mode).value
+
+    def _GetCaptureSource(self, axis: _SimulatedAxis) -> int:
+        return axis.capture_source
+
+    def _SetCaptureSource(self, axis: _SimulatedAxis, source: int) -> None:
+        axis.capture_source = PMDCaptureSource(source).value
+
+    def _GetStopMode(self, axis: _SimulatedAxis) -> int:
+        return axis.stop_mode
+
+    def _SetStopMode(self, axis: _SimulatedAxis, mode: int) -> None:
+        axis.stop_mode = PMDStopMode(mode).value
+
+    def _GetBreakpoint(self, axis: _SimulatedAxis, breakpt: int) -> int:
+        return axis.breakpoints[breakpt]
+
+    def _SetBreakpoint(self, axis: _SimulatedAxis, breakpt: int, trigger: int, action_source: int) -> None:
+        axis.breakpoints[breakpt] = PMDTrigger(trigger).value << 8 | action_source
+
+    def _GetBreakpointValue(self, axis: _SimulatedAxis, breakpt: int) -> int:
+        return axis.breakpoint_values[breakpt]
+
+    def _SetBreakpointValue(self, axis: _SimulatedAxis, breakpt: int, value: int) -> None:
+        axis.breakpoint_values[breakpt] = value
+
+    def _GetVelocity(self, axis: _SimulatedAxis) -> int:
+        return axis.velocity
+
+    def _SetVelocity(self, axis: _SimulatedAxis, velocity: int) -> None:
+        axis.velocity = velocity
+
+    def _GetAcceleration(self, axis: _SimulatedAxis) -> int:
+        return axis.acceleration
+
+    def _SetAcceleration(self, axis: _SimulatedAxis, acceleration: int) -> None:
+        axis.acceleration = acceleration
+
+    def _GetJerk(self, axis: _SimulatedAxis) -> int:
+        return axis.jerk
+
+    def _SetJerk(self, axis: _SimulatedAxis, jerk: int) -> None:
+        axis.jerk = jerk
+
+    def _GetActualPosition(self, axis: _SimulatedAxis) -> int:
+        return axis.actual
+
+    def _AdjustActualPosition(self, axis: _SimulatedAxis, offset: int) -> None:
+        axis.actual += offset
+        axis.commanded += offset * _FRACTION
+        axis.target += offset
+
+    def _SetActualPosition(self, axis: _SimulatedAxis, position: int) -> None:
+        self._AdjustActualPosition(axis, position - axis.actual)
+
+    def _GetPosition(self, axis: _SimulatedAxis) -> int:
+        return axis.position
+
+    def _SetPosition(self, axis: _SimulatedAxis, position: int) -> None:
+        axis.position = position
+
+    def _GetPositionError(self, axis: _SimulatedAxis) -> int:
+        return axis.position_error
+
+    def _ClearPositionError(self, axis: _SimulatedAxis) -> None:
+        axis.clear_position_error = True
+
+    def _GetCommandedPosition(self, axis: _SimulatedAxis) -> int:
+        return axis.commanded_position
+
+    def _GetCommandedVelocity(self, axis: _SimulatedAxis) -> int:
+        return axis.commanded_velocity
+
+    def _Update(self, axis: _SimulatedAxis) -> None:
+        axis.update()
+        self._trace_update(self.axes.index(axis))
+
+    def _MultiUpdate(self, axis: _SimulatedAxis, mask: int) -> None:
+        for number, updated in enumerate(self.axes):
+            if mask & 1 << number:
+                updated.update()
+                self._trace_update(number)
+
+    def _trace_update(self, number: int) -> None:
+        # trace start and stop triggers on the update of an axis
+        if self._trace_armed and self.trace_start & 0xFF == PMDTraceCondition.UPDATE.value << 4 | number:
+            self._start_trace()
+        elif self.trace_status & PMDTraceStatus.ACTIVE.value and \
+                self.trace_stop & 0xFF == PMDTraceCondition.UPDATE.value << 4 | number:
+            self._stop_trace()
+
+    def _GetActivityStatus(self, axis: _SimulatedAxis) -> int:
+        return axis.activity_status
+
+    def _GetSignalStatus(self, axis: _SimulatedAxis) -> int:
+        return axis.signal_sense & 0x07FF  # every input is inactive, so only the sense inversion shows
+
+    def _GetEventStatus(self, axis: _SimulatedAxis) -> int:
+        return axis.event_status
+
+    def _ResetEventStatus(self, axis: _SimulatedAxis, mask: int) -> None:
+        axis.event_status &= mask
+
+    def _GetCaptureValue(self, axis: _SimulatedAxis) -> int:
+        return axis.capture
+
+    def _GetOperatingMode(self, axis: _SimulatedAxis) -> int:
+        return axis.operating_mode
+
+    def _SetOperatingMode(self, axis: _SimulatedAxis, mode: int) -> None:
+        axis.operating_mode = axis.programmed_operating_mode = mode
+
+    def _RestoreOperatingMode(self, axis: _SimulatedAxis) -> None:
+        axis.operating_mode = axis.programmed_operating_mode
+
+    def _ReadIO(self, axis: _SimulatedAxis, address: int) -> int:
+        return self.io.get(address, 0)
+
+    def _WriteIO(self, axis: _SimulatedAxis, address: int, data: int) -> None:
+        self.io[address] = data
+
+    def _buffer(self, buffer_id: int, changing: bool = False) -> list:
+        if buffer_id == _TRACE_BUFFER and changing and self.trace_status & PMDTraceStatus.ACTIVE.value:
+            raise _CommandError(PMD_ERROR_TRACERUNNING)
+        return self.buffers.setdefault(buffer_id, [0, 0, 0, 0])
+
+    def _SetBufferStart(self, axis: _SimulatedAxis, buffer_id: int, address: int) -> None:
+        buffer = self._buffer(buffer_id, changing=True)
+        if address + buffer[1] > _MEMORY_SIZE:
+            raise _CommandError(PMD_ERROR_BLOCKOUTOFBOUNDS)
+        buffer[:] = [address, buffer[1], 0, 0]
+        if buffer_id == _TRACE_BUFFER:
+            self.trace_count = 0
+
+    def _GetBufferStart(self, axis: _SimulatedAxis, buffer_id: int) -> int:
+        return self._buffer(buffer_id)[0]
+
+    def _SetBufferLength(self, axis: _SimulatedAxis, buffer_id: int, length: int) -> None:
+        buffer = self._buffer(buffer_id, changing=True)
+        if buffer[0] + length > _MEMORY_SIZE:
+            raise _CommandError(PMD_ERROR_BLOCKOUTOFBOUNDS)
+        buffer[:] = [buffer[0], length, 0, 0]
+        if buffer_id == _TRACE_BUFFER:
+            self.trace_count = 0
+
+    def _GetBufferLength(self, axis: _SimulatedAxis, buffer_id: int) -> int:
+        return self._buffer(buffer_id)[1]
+
+    def _SetBufferReadIndex(self, axis: _SimulatedAxis, buffer_id: int, index: int) -> None:
+        buffer = self._buffer(buffer_id)
+        if index >= buffer[1]:
+            raise ValueError(index)
+        buffer[2] = index
+
+    def _GetBufferReadIndex(self, axis: _SimulatedAxis, buffer_id: int) -> int:
+        return self._buffer(buffer_id)[2]
+
+    def _SetBufferWriteIndex(self, axis: _SimulatedAxis, buffer_id: int, index: int) -> None:
+        buffer = self._buffer(buffer_id, changing=True)
+        if index >= buffer[1]:
+            raise ValueError(index)
+        buffer[3] = index
+
+    def _GetBufferWriteIndex(self, axis: _SimulatedAxis, buffer_id: int) -> int:
+        return self._buffer(buffer_id)[3]
+
+    def _WriteBuffer(self, axis: _SimulatedAxis, buffer_id: int, data: int) -> None:
+        buffer = self._buffer(buffer_id, changing=True)
+        start, length, _, write_index = buffer
+        if length == 0:
+            raise _CommandError(PMD_ERROR_BLOCKOUTOFBOUNDS)
+        self.memory[start + write_index] = data
+        buffer[3] = (write_index + 1) % length
+
+    def _ReadBuffer(self, axis: _SimulatedAxis, buffer_id: int) -> int:
+        buffer = self._buffer(buffer_id)
+        start, length, read_index, _ = buffer
+        if length == 0:
+            raise _CommandError(PMD_ERROR_BLOCKOUTOFBOUNDS)
+        buffer[2] = (read_index + 1) % length
+        if buffer_id == _TRACE_BUFFER:
+            self.trace_count = max(self.trace_count - 1, 0)
+        return self.memory.get(start + read_index, 0)
+
+    def _SetTraceMode(self, axis: _SimulatedAxis, mode: int) -> None:
+        if self.trace_status & PMDTraceStatus.ACTIVE.value:
+            raise _CommandError(PMD_ERROR_TRACERUNNING)
+        self.trace_mode = PMDTraceMode(mode).value
+        self.trace_status = self.trace_status & ~PMDTraceStatus.MODE.value | self.trace_mode
+
+    def _GetTraceMode(self, axis: _SimulatedAxis) -> int:
+        return self.trace_mode
+
+    def _SetTraceStart(self, axis: _SimulatedAxis, trigger: int) -> None:
+        if self._buffer(_TRACE_BUFFER)[1] == 0:
+            raise _CommandError(PMD_ERROR_TRACEBUFFERZERO)
+        self.axes[trigger & 0x0F]
+        PMDTraceCondition(trigger >> 4 & 0x0F)
+        self.trace_start = trigger
+        self.trace_status &= ~PMDTraceStatus.WRAP.value
+        if trigger >> 4 & 0x0F == PMDTraceCondition.IMMEDIATE.value:
+            self._start_trace()
+        else:
+            self._trace_armed = True
+
+    def _GetTraceStart(self, axis: _SimulatedAxis) -> int:
+        return self.trace_start
+
+    def _SetTraceStop(self, axis: _SimulatedAxis, trigger: int) -> None:
+        self.axes[trigger & 0x0F]
+        PMDTraceCondition(trigger >> 4 & 0x0F)
+        self.trace_stop = trigger
+        if trigger >> 4 & 0x0F == PMDTraceCondition.IMMEDIATE.value:
+            self._stop_trace()
+
+    def _GetTraceStop(self, axis: _SimulatedAxis) -> int:
+        return self.trace_stop
+
+    def _SetTraceVariable(self, axis: _SimulatedAxis, variable_number: int, selection: int) -> None:
+        if self.trace_status & PMDTraceStatus.ACTIVE.value:
+            raise _CommandError(PMD_ERROR_TRACERUNNING)
+        self.axes[selection & 0x0F]
+        PMDTraceVariable(selection >> 8)
+        self.trace_variables[variable_number] = selection
+
+    def _GetTraceVariable(self, axis: _SimulatedAxis, variable_number: int) -> int:
+        return self.trace_variables[variable_number]
+
+    def _SetTracePeriod(self, axis: _SimulatedAxis, period: int) -> None:
+        if period == 0:
+            raise ValueError(period)
+        self.trace_period = period
+
+    def _GetTracePeriod(self, axis: _SimulatedAxis) -> int:
+        return self.trace_period
+
+    def _GetTraceStatus(self, axis: _SimulatedAxis) -> int:
+        return self.trace_status
+
+    def _GetTraceCount(self, axis: _SimulatedAxis) -> int:
+        return self.trace_count
+
+
+class PMDSimulatorTransport(PMDTransport):
+    # Connects a PMDAxisInterface to a MagellanSimulator in the same process:
+    #
+    #   pmd.SetupAxisInterface(PMDSimulatorTransport())
+    #
+    # With a baudrate every byte takes 10 bit times on the simulated line in each direction, and latency adds a fixed
+    # processing delay before each response, so that throughput measured against the simulator is realistic.
+    def __init__(
+        self, simulator: Optional[MagellanSimulator] = None, baudrate: Optional[int] = None, latency: float = 0.0
+    ):
+        self.simulator = simulator if simulator is not None else MagellanSimulator()
+        self.baudrate = baudrate
+        self.latency = latency
+        self.timeout = 0.1
+        self._pending = deque()  # (time the byte arrives at the host, byte)
+        self._line_free = 0.0
+
+    def _byte_time(self) -> float:
+        return 10.0 / self.baudrate if self.baudrate else 0.0
+
+    def write(self, data: bytes) -> int:
+        data = bytes(data)
+        now = time.monotonic()
+        byte_time = self._byte_time()
+        arrival = max(now, self._line_free) + len(data) * byte_time
+        self._line_free = arrival
+        response = self.simulator.receive(data)
+        if response:
+            ready = arrival + self.latency
+            for byte in response:
+                ready += byte_time
+                self._pending.append((ready, byte))
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        deadline = time.monotonic() + (self.timeout or 0.0)
+        data = bytearray()
+        while len(data) < size:
+            if not self._pending:
+                break
+            ready, byte = self._pending[0]
+            now = time.monotonic()
+            if ready > now:
+                if ready > deadline:
+                    break
+                time.sleep(ready - now)
+            self._pending.popleft()
+            data.append(byte)
+        return bytes(data)
+
+    def reset_input_buffer(self) -> None:
+        self._pending.clear()
+
+    def close(self) -> None:
+        self._pending.clear()
+
+
+class MagellanPtySimulator:
+    # Runs a MagellanSimulator on the master side of a pseudo terminal, so that an interface talks to it through
+    # pyserial and the kernel tty layer exactly as it would to a serial port (POSIX only):
+    #
+    #   with MagellanPtySimulator() as pty:
+    #       pmd.SetupAxisInterface_Serial(pty.port, 115200)
+    def __init__(self, simulator: Optional[MagellanSimulator] = None):
+        import pty, tty
+        self.simulator = simulator if simulator is not None else MagellanSimulator()
+        self._master, slave = pty.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self._slave = slave
+        self._thread = threading.Thread(target=self._run, name='MagellanPtySimulator', daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'MagellanPtySimulator':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            response = self.simulator.receive(data)
+            if response:
+                try:
+                    os.write(self._master, response)
+                except OSError:
+                    return
+
+    def close(self) -> None:
+        # Closing the slave side ends the thread's read once no port is left open on it
+        os.close(self._slave)
+        self._thread.join(1.0)
+        os.close(self._master)
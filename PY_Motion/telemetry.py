@@ -0,0 +1,244 @@
+import mmap
+import struct
+import sys
+import threading
+import time
+from array import array
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from .main import *
+
+try:
+    import numpy
+except ImportError:  # optional; numpy_view and latest need it
+    numpy = None
+
+# A telemetry ring file is a header, a channel table and `capacity` fixed-size records, all little-endian:
+#
+#   header   magic, version, channel count, record size, capacity, number of records written so far
+#   channels (axis, Get opcode) byte pair per channel
+#   records  starting at _data_offset(channel count); each is a float64 time.time() taken just before the sample was
+#            requested, followed by one int32 raw register value per channel
+#
+# Record n lives in slot n % capacity. The writer fills the slot first and then publishes it by storing n + 1 as the
+# record count, so a reader knows that every record below the count is complete. Once the count reaches n + capacity
+# the writer may be overwriting record n, so a record n that has been read is intact only if the count is still
+# below n + capacity afterwards, and a reader only ever looks at the last capacity - 1 records.
+PMD_TELEMETRY_MAGIC = b'PMDRING\x00'
+PMD_TELEMETRY_VERSION = 1
+_HEADER = struct.Struct('<8sIIII')
+_COUNT = struct.Struct('<Q')
+_COUNT_OFFSET = _HEADER.size
+_CHANNELS_OFFSET = _COUNT_OFFSET + _COUNT.size
+_TIMESTAMP = struct.Struct('<d')
+
+PMD_DEFAULT_TELEMETRY_COMMANDS = (
+    PMD_COMMAND_GETACTUALPOSITION,
+    PMD_COMMAND_GETCOMMANDEDPOSITION,
+    PMD_COMMAND_GETPOSITIONERROR,
+)
+
+
+def _data_offset(channel_count: int) -> int:
+    return (_CHANNELS_OFFSET + 2 * channel_count + 63) // 64 * 64
+
+
+class PMDTelemetrySample(NamedTuple):
+    index: int  # number of the record since the ring was created
+    timestamp: float
+    values: Tuple[int, ...]
+
+
+class PMDTelemetryRing:
+    # Memory-mapped ring of telemetry records. Given channels, the file at path is created (or replaced) for writing;
+    # without, an existing file is opened read-only, which any number of other processes can do while it is written.
+    def __init__(
+        self, path: str, channels: Optional[Sequence[Tuple[PMDAxis, PMDCommand]]] = None, capacity: int = 65536
+    ):
+        self.path = path
+        self.writable = channels is not None
+        if self.writable:
+            if capacity < 2:
+                raise ValueError('a telemetry ring needs a capacity of at least 2 records')
+            channels = list(channels)
+            record_size = (_TIMESTAMP.size + 4 * len(channels) + 7) // 8 * 8
+            size = _data_offset(len(channels)) + capacity * record_size
+            self._file = open(path, 'w+b')
+            self._file.truncate(size)
+            self._mmap = mmap.mmap(self._file.fileno(), size)
+            _HEADER.pack_into(
+                self._mmap, 0, PMD_TELEMETRY_MAGIC, PMD_TELEMETRY_VERSION, len(channels), record_size, capacity
+            )
+            for number, (axis, command) in enumerate(channels):
+                self._mmap[_CHANNELS_OFFSET + 2 * number:_CHANNELS_OFFSET + 2 * number + 2] = bytes(
+                    (axis.value, command.opcode)
+                )
+        else:
+            self._file = open(path, 'rb')
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, channel_count, self.record_size, self.capacity = _HEADER.unpack_from(self._mmap, 0)
+        if magic != PMD_TELEMETRY_MAGIC or version != PMD_TELEMETRY_VERSION:
+            self.close()
+            raise ValueError(f'{path} is not a version {PMD_TELEMETRY_VERSION} PY-Motion telemetry ring')
+        table = self._mmap[_CHANNELS_OFFSET:_CHANNELS_OFFSET + 2 * channel_count]
+        self.channels = [(PMDAxis(table[i]), PMD_COMMANDS[table[i + 1]]) for i in range(0, len(table), 2)]
+        self.data_offset = _data_offset(channel_count)
+        self._values = struct.Struct(f'<{channel_count}i')
+
+    def __enter__(self) -> 'PMDTelemetryRing':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._mmap.close()
+        self._file.close()
+
+    @property
+    def channel_names(self) -> List[str]:
+        return [f'{axis.name}.{command.name[3:]}' for axis, command in self.channels]
+
+    @property
+    def count(self) -> int:
+        # records written since the ring was created; the last capacity - 1 of them can be read
+        return _COUNT.unpack_from(self._mmap, _COUNT_OFFSET)[0]
+
+    def append(self, timestamp: float, values: Sequence[int]) -> None:
+        # values is a buffer of native int32, one raw register value per channel, as returned by get_registers
+        count = self.count
+        offset = self.data_offset + count % self.capacity * self.record_size
+        _TIMESTAMP.pack_into(self._mmap, offset, timestamp)
+        data = memoryview(values).cast('B')
+        if sys.byteorder == 'big':
+            swapped = array('i')
+            swapped.frombytes(data)
+            swapped.byteswap()
+            data = memoryview(swapped).cast('B')
+        self._mmap[offset + _TIMESTAMP.size:offset + _TIMESTAMP.size + self._values.size] = data
+        _COUNT.pack_into(self._mmap, _COUNT_OFFSET, count + 1)
+
+    def samples(
+        self, start: Optional[int] = None, follow: bool = False, poll_interval: float = 0.001
+    ) -> Iterator[PMDTelemetrySample]:
+        # Yields the records from index start (the oldest one held if None) onwards. Records overwritten before they
+        # could be read are skipped. With follow=True the generator waits for new records instead of returning.
+        index = start
+        while True:
+            count = self.count
+            oldest = max(count - self.capacity + 1, 0)
+            if index is None or index < oldest:
+                index = oldest
+            while index < count:
+                offset = self.data_offset + index % self.capacity * self.record_size
+                timestamp, = _TIMESTAMP.unpack_from(self._mmap, offset)
+                values = self._values.unpack_from(self._mmap, offset + _TIMESTAMP.size)
+                if self.count - self.capacity >= index:
+                    break  # the writer reached this record's slot while it was being read
+                yield PMDTelemetrySample(index, timestamp, values)
+                index += 1
+            else:
+                if not follow:
+                    return
+                time.sleep(poll_interval)
+
+    def numpy_view(self) -> 'numpy.ndarray':
+        # Zero-copy structured array over every slot, in slot order rather than time order; slots that have not been
+        # written yet are zero. The view is live: while a writer runs, slot count % capacity may be half rewritten,
+        # so use latest() for records that are known to be intact.
+        if numpy is None:
+            raise RuntimeError('numpy is required for numpy_view')
+        dtype = numpy.dtype({
+            'names': ['timestamp', 'values'],
+            'formats': ['<f8', ('<i4', (len(self.channels),))],
+            'offsets': [0, _TIMESTAMP.size],
+            'itemsize': self.record_size,
+        })
+        return numpy.frombuffer(self._mmap, dtype, self.capacity, self.data_offset)
+
+    def latest(self, count: Optional[int] = None) -> 'numpy.ndarray':
+        # Copy of the last count records held (all of them if None) in time order. Records the writer reached while
+        # they were being copied are left out.
+        view = self.numpy_view()
+        written = self.count
+        held = min(written, self.capacity - 1)
+        count = held if count is None else min(count, held)
+        records = view[numpy.arange(written - count, written) % self.capacity]
+        torn = self.count - self.capacity + 1 - (written - count)
+        return records[max(torn, 0):]
+
+
+class PMDTelemetryRecorder:
+    # Samples raw register values of several axes as fast as the line allows (or every `interval` seconds) from a
+    # background thread, one pipelined register read per sample, into a PMDTelemetryRing:
+    #
+    #   with PMDTelemetryRecorder(pmd, '/dev/shm/mount.ring', [AXIS1, AXIS2]) as recorder:
+    #       ...
+    #   ring = PMDTelemetryRing('/dev/shm/mount.ring')  # in any process
+    #   for sample in ring.samples(follow=True):
+    #       ...
+    def __init__(
+        self,
+        interface: PMDAxisInterface,
+        path: str,
+        axes: Iterable[PMDAxis] = PMDAxis,
+        commands: Iterable[PMDCommand] = PMD_DEFAULT_TELEMETRY_COMMANDS,
+        capacity: int = 65536,
+        interval: float = 0.0,
+        error_backoff: float = 0.1,
+    ):
+        self.interface = interface
+        self.axes = tuple(axes)
+        self.commands = tuple(commands)
+        self.ring = PMDTelemetryRing(
+            path, [(axis, command) for axis in self.axes for command in self.commands], capacity
+        )
+        self.interval = interval
+        self.error_backoff = error_backoff
+        self.errors = 0
+        self.last_error = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def __enter__(self) -> 'PMDTelemetryRecorder':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='PMDTelemetryRecorder', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self) -> None:
+        self.stop()
+        self.ring.close()
+
+    def sample(self) -> None:
+        timestamp = time.time()
+        self.ring.append(timestamp, self.interface.get_registers(self.axes, self.commands))
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.sample()
+            except (PMDCommunicationError, PMDCommandError) as e:
+                self.errors += 1
+                self.last_error = e
+                self._stopping.wait(self.error_backoff)
+                continue
+            if self.interval:
+                self._stopping.wait(self.interval)
@@ -0,0 +1,108 @@
+import time
+from array import array
+from typing import NamedTuple, Optional, Sequence, Tuple
+from .main import *
+
+try:
+    import numpy
+except ImportError:  # optional; trace data is returned as array('i') without it
+    numpy = None
+
+PMD_TRACE_BUFFER = 0  # the chip records traces into buffer 0
+PMD_TRACE_VARIABLES = 4  # variables traced at once
+
+
+class PMDTraceData(NamedTuple):
+    variables: Tuple[Tuple[PMDAxis, PMDTraceVariable], ...]
+    period: int  # cycles between samples
+    values: Tuple[Sequence[int], ...]  # per variable, array('i') or numpy array of the samples in time order
+
+    def get(self, axis: PMDAxis, variable: PMDTraceVariable) -> Sequence[int]:
+        return self.values[self.variables.index((axis, variable))]
+
+
+class PMDTraceCapture:
+    # Records up to four variables every `period` cycles into the chip's trace buffer, at the servo rate and without
+    # any traffic on the line, and reads them back afterwards:
+    #
+    #   capture = PMDTraceCapture(pmd, [(AXIS1, PMDTraceVariable.ACTUAL_POSITION)], samples=1000)
+    #   capture.configure()
+    #   capture.start(AXIS1, PMDTraceCondition.UPDATE)
+    #   pmd.Update(AXIS1)
+    #   capture.wait()
+    #   positions = capture.download().get(AXIS1, PMDTraceVariable.ACTUAL_POSITION)
+    def __init__(
+        self,
+        interface: PMDAxisInterface,
+        variables: Sequence[Tuple[PMDAxis, PMDTraceVariable]],
+        samples: int,
+        period: int = 1,
+        mode: PMDTraceMode = PMDTraceMode.ONE_TIME,
+        buffer_start: int = 0,
+    ):
+        if not 0 < len(variables) <= PMD_TRACE_VARIABLES:
+            raise ValueError(f'between 1 and {PMD_TRACE_VARIABLES} trace variables are supported')
+        self.interface = interface
+        self.variables = tuple(variables)
+        self.samples = samples
+        self.period = period
+        self.mode = mode
+        self.buffer_start = buffer_start
+
+    def configure(self) -> None:
+        # Stops any running trace and sets up the buffer and the variables, in a single batch.
+        with self.interface.batch() as batch:
+            batch.SetTraceStop(PMDAxis.AXIS1, PMDTraceCondition.IMMEDIATE)
+            batch.SetBufferStart(PMD_TRACE_BUFFER, self.buffer_start)
+            batch.SetBufferLength(PMD_TRACE_BUFFER, self.samples * len(self.variables))
+            batch.SetTracePeriod(self.period)
+            batch.SetTraceMode(self.mode)
+            for number in range(PMD_TRACE_VARIABLES):
+                if number < len(self.variables):
+                    batch.SetTraceVariable(number, *self.variables[number])
+                else:
+                    batch.SetTraceVariable(number, PMDAxis.AXIS1, PMDTraceVariable.NONE)
+
+    def start(
+        self,
+        axis: PMDAxis = PMDAxis.AXIS1,
+        condition: PMDTraceCondition = PMDTraceCondition.IMMEDIATE,
+        bit: int = 0,
+        state: PMDTraceState = PMDTraceState.LOW,
+    ) -> None:
+        self.interface.SetTraceStart(axis, condition, bit, state)
+
+    def stop(
+        self,
+        axis: PMDAxis = PMDAxis.AXIS1,
+        condition: PMDTraceCondition = PMDTraceCondition.IMMEDIATE,
+        bit: int = 0,
+        state: PMDTraceState = PMDTraceState.LOW,
+    ) -> None:
+        self.interface.SetTraceStop(axis, condition, bit, state)
+
+    @property
+    def running(self) -> bool:
+        return PMDTraceStatus.ACTIVE in self.interface.GetTraceStatus()
+
+    def wait(self, timeout: Optional[float] = None, poll_interval: float = 0.01) -> bool:
+        # Waits for the trace to stop by itself; False if it is still running after timeout seconds.
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.running:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def download(self) -> PMDTraceData:
+        # Reads back the samples held in the buffer, oldest first. Stop a rolling trace first so that the chip does not
+        # overwrite samples while they are read.
+        count = self.interface.GetTraceCount()
+        count -= count % len(self.variables)
+        words = self.interface.read_buffer(PMD_TRACE_BUFFER, count)
+        n = len(self.variables)
+        if numpy is not None:
+            values = tuple(words[number::n].copy() for number in range(n))
+        else:
+            values = tuple(words[number::n] for number in range(n))
+        return PMDTraceData(self.variables, self.period, values)
@@ -0,0 +1,22 @@
+from typing import Optional
+
+
+class PMDTransport:
+    # The byte stream that PMDAxisInterface talks to the motion processor over. serial.Serial already provides this
+    # interface; other transports (such as the simulator) implement it by subclassing.
+    #
+    # read() returns once `size` bytes are available or `timeout` seconds have passed, whichever comes first, and may
+    # therefore return fewer bytes than requested.
+    timeout: Optional[float] = None
+
+    def write(self, data: bytes) -> Optional[int]:
+        raise NotImplementedError
+
+    def read(self, size: int = 1) -> bytes:
+        raise NotImplementedError
+
+    def reset_input_buffer(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
@@ -0,0 +1,388 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from PY_Motion.main import *
+from PY_Motion.main import _int32, _uint16
+from PY_Motion.poller import *
+from PY_Motion.simulator import *
+
+# Benchmarks the PY-Motion stack against a Magellan, the in-process simulator or the simulator behind a pty:
+#
+#   python -m benchmarks.pmd_benchmark --backend sim --baudrate 115200 --output results.json
+#   python -m benchmarks.pmd_benchmark --backend pty --compare baseline.json
+#   python -m benchmarks.pmd_benchmark --backend serial --port /dev/ttyAMA0 --baudrate 115200
+#
+# Run it from the top of the repository, or anywhere once PY-Motion is installed. Against a real motion processor
+# only commands that leave its registers alone are sent, unless --allow-motion is given; the commands that change
+# registers and the stop benchmark then run as they do on the simulated backends.
+#
+# Every result is written to a JSON file. With --compare, latencies that grew (or rates that fell) by more than
+# --tolerance against an earlier results file are reported and the script exits with status 1.
+
+# (name, arguments) of the commands whose latency is measured; none of them changes a register
+LATENCY_COMMANDS = (
+    ('NoOperation', ()),
+    ('GetVersion', ()),
+    ('GetActivityStatus', (PMDAxis.AXIS1,)),
+    ('GetEventStatus', (PMDAxis.AXIS1,)),
+    ('GetSignalStatus', (PMDAxis.AXIS1,)),
+    ('GetActualPosition', (PMDAxis.AXIS1,)),
+    ('GetPositionError', (PMDAxis.AXIS1,)),
+    ('GetBreakpointValue', (PMDAxis.AXIS1, PMDBreakpoint.BREAKPOINT1)),
+    ('ReadIO', (0,)),
+)
+
+# Commands that change a register, measured as well where motion is allowed (see _motion_allowed); reading the
+# instruction error clears it, which would wipe the diagnostics of a real motion processor
+MOTION_LATENCY_COMMANDS = (
+    ('GetInstructionError', ()),
+    ('SetVelocity', (PMDAxis.AXIS1, 6711)),
+    ('SetBreakpointValue', (PMDAxis.AXIS1, PMDBreakpoint.BREAKPOINT1, 1000)),
+)
+
+
+class _ReplayTransport(PMDTransport):
+    # Answers every write with a canned response, so that the host side of an exchange can be timed on its own.
+    def __init__(self, response: bytes):
+        self.response = response
+        self.timeout = 0.1
+        self._pending = b''
+
+    def write(self, data: bytes) -> int:
+        self._pending += self.response
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def reset_input_buffer(self) -> None:
+        self._pending = b''
+
+    def close(self) -> None:
+        pass
+
+
+def _distribution(samples: List[int]) -> Dict[str, float]:
+    # samples in nanoseconds, summary in microseconds
+    samples = sorted(samples)
+    count = len(samples)
+    percentile = lambda p: samples[min(count - 1, int(p * count))] / 1000
+    return {
+        'count': count,
+        'mean_us': statistics.mean(samples) / 1000,
+        'min_us': samples[0] / 1000,
+        'p50_us': percentile(0.50),
+        'p90_us': percentile(0.90),
+        'p99_us': percentile(0.99),
+        'max_us': samples[-1] / 1000,
+    }
+
+
+def _time_calls(function: Callable[[], object], iterations: int) -> List[int]:
+    samples = []
+    clock = time.perf_counter_ns
+    for _ in range(iterations):
+        start = clock()
+        function()
+        samples.append(clock() - start)
+    return samples
+
+
+class Backend:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self._pty = None
+
+    def open(self) -> PMDAxisInterface:
+        args = self.args
+        pmd = PMDAxisInterface()
+        if args.backend == 'sim':
+            pmd.SetupAxisInterface(PMDSimulatorTransport(baudrate=args.baudrate, latency=args.latency))
+        elif args.backend == 'pty':
+            if self._pty is None:
+                self._pty = MagellanPtySimulator()
+            pmd.SetupAxisInterface_Serial(self._pty.port, args.baudrate or 115200)
+        else:
+            pmd.SetupAxisInterface_Serial(args.port, args.baudrate or 115200)
+        return pmd
+
+    def close(self) -> None:
+        if self._pty is not None:
+            self._pty.close()
+
+
+def _motion_allowed(args: argparse.Namespace) -> bool:
+    return args.backend != 'serial' or args.allow_motion
+
+
+def bench_command_latency(pmd: PMDAxisInterface, args: argparse.Namespace) -> dict:
+    results = {}
+    commands = LATENCY_COMMANDS + (MOTION_LATENCY_COMMANDS if _motion_allowed(args) else ())
+    for name, arguments in commands:
+        command = getattr(pmd, name)
+        _time_calls(lambda: command(*arguments), 10)
+        results[name] = _distribution(_time_calls(lambda: command(*arguments), args.iterations))
+    return results
+
+
+def bench_batch_throughput(pmd: PMDAxisInterface, args: argparse.Namespace) -> dict:
+    # GetActualPosition on every axis, one round trip per command against one round trip per batch
+    count = args.iterations * len(PMDAxis)
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for axis in PMDAxis:
+            pmd.GetActualPosition(axis)
+    results = {'unbatched_commands_per_s': count / (time.perf_counter() - start)}
+    for size in (4, 16, 64):
+        batches = max(1, count // size)
+        start = time.perf_counter()
+        for _ in range(batches):
+            with pmd.batch() as batch:
+                for index in range(size):
+                    batch.GetActualPosition(PMDAxis(index % len(PMDAxis)))
+        results[f'batch{size}_commands_per_s'] = batches * size / (time.perf_counter() - start)
+    return results
+
+
+def bench_codec(args: argparse.Namespace) -> dict:
+    # Host-side cost of an exchange with no wire involved: packing, checksums, response framing and decoding.
+    iterations = args.iterations * 20
+    packet = bytearray(PMD_MAX_PACKET_LENGTH)
+    command = PMD_COMMAND_SETBREAKPOINTVALUE
+    response = bytearray(b'\x00\x00\x00\x01\x86\xa0')
+    response[1] = -sum(response) & 0xFF
+    response = bytes(response)
+
+    def per_call(function: Callable[[], object]) -> float:
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            function()
+        return (time.perf_counter_ns() - start) / iterations / 1000
+
+    pmd = PMDAxisInterface()
+    pmd._mc = _ReplayTransport(response)  # the canned response cannot answer the synchronization handshake
+    batch_lengths = [6] * 16
+
+    def read_batch() -> None:
+        for _ in range(16):
+            pmd._mc.write(b'')
+        for _ in pmd._read_responses(batch_lengths):
+            pass
+
+    return {
+        'encode_us': per_call(lambda: command.pack_into(packet, 0, 0, 1, 100000)),
+        'encode_cached_us': per_call(lambda: PMD_COMMAND_GETACTIVITYSTATUS.build(0)),
+        'verify_response_us': per_call(lambda: PMDAxisInterface._verify_response(response)),
+        'decode_int32_us': per_call(lambda: _int32(response)),
+        'decode_activity_status_us': per_call(lambda: PMDActivityStatus(_uint16(response)).in_motion),
+        'read_responses_single_us': per_call(lambda: (pmd._mc.write(b''), list(pmd._read_responses([6])))),
+        'read_responses_batch16_us': per_call(read_batch) / 16,
+        'transact_get_us': per_call(lambda: pmd.GetActualPosition(PMDAxis.AXIS1)),
+    }
+
+
+def bench_contention(pmd: PMDAxisInterface, args: argparse.Namespace) -> dict:
+    results = {}
+    for threads in (1, 2, 4, 8):
+        samples = [[] for _ in range(threads)]
+        barrier = threading.Barrier(threads + 1)
+
+        def worker(index: int) -> None:
+            axis = PMDAxis(index % len(PMDAxis))
+            barrier.wait()
+            samples[index] = _time_calls(lambda: pmd.GetActualPosition(axis), args.iterations)
+
+        workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+        for thread in workers:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        results[f'threads{threads}'] = {
+            'commands_per_s': threads * args.iterations / elapsed,
+            'latency': _distribution([sample for thread_samples in samples for sample in thread_samples]),
+        }
+    results['coalesced'] = bench_coalesced_reads(pmd, args)
+    if _motion_allowed(args):
+        results['stop_under_polling'] = bench_stop_under_polling(pmd, args)
+    return results
+
+
+def bench_coalesced_reads(pmd: PMDAxisInterface, args: argparse.Namespace, threads: int = 8) -> dict:
+    # Every thread polls the same register, as status consumers do; identical reads share exchanges
+    pmd.coalescer = PMDReadCoalescer()
+    try:
+        workers = [
+            threading.Thread(target=_time_calls, args=(lambda: pmd.GetActivityStatus(PMDAxis.AXIS1), args.iterations))
+            for _ in range(threads)
+        ]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return {
+            'commands_per_s': threads * args.iterations / elapsed,
+            'transactions_per_s': pmd.coalescer.transactions / elapsed,
+            'hit_rate': pmd.coalescer.hit_rate,
+        }
+    finally:
+        pmd.coalescer = None
+
+
+def bench_stop_under_polling(pmd: PMDAxisInterface, args: argparse.Namespace, threads: int = 8) -> dict:
+    # Time for a stop to go out while every other thread polls as fast as it can, with the priority scheduler. The
+    # stop is real: only run this where motion is allowed.
+    lock, pmd.lock = pmd.lock, PMDCommandScheduler()
+    polling = threading.Event()
+
+    def poll(axis: PMDAxis) -> None:
+        while not polling.is_set():
+            pmd.GetActivityStatus(axis)
+
+    workers = [threading.Thread(target=poll, args=(PMDAxis(index % len(PMDAxis)),)) for index in range(threads)]
+    for thread in workers:
+        thread.start()
+    try:
+        def stop() -> None:
+            with pmd.batch() as batch:
+                batch.SetStopMode(PMDAxis.AXIS1, PMDStopMode.ABRUPT_STOP)
+                batch.Update(PMDAxis.AXIS1)
+
+        latency = _distribution(_time_calls(stop, max(args.iterations // 10, 10)))
+    finally:
+        polling.set()
+        for thread in workers:
+            thread.join()
+        waits, pmd.lock = pmd.lock.snapshot(), lock
+    return {
+        'latency': latency,
+        'safety_max_wait_s': waits[PMDPriority.SAFETY].max_wait,
+        'telemetry_mean_wait_s': waits[PMDPriority.TELEMETRY].mean_wait,
+    }
+
+
+def bench_status_poller_cpu(pmd: PMDAxisInterface, args: argparse.Namespace) -> dict:
+    # CPU time spent by a PMDStatusPoller sampling the default registers of every axis at its fast interval
+    poller = PMDStatusPoller(pmd, idle_interval=0.02)
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    with poller:
+        time.sleep(args.duration)
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+    return {'cpu_fraction': cpu / wall, 'cpu_ms_per_s': 1000 * cpu / wall}
+
+
+def bench_startup(backend: Backend, args: argparse.Namespace) -> dict:
+    samples = []
+    for _ in range(max(3, args.iterations // 100)):
+        start = time.perf_counter_ns()
+        pmd = backend.open()
+        samples.append(time.perf_counter_ns() - start)
+        pmd.CloseAxisInterface()
+    return {'setup': _distribution(samples)}
+
+
+def _flatten(results: dict, prefix: str = '') -> Dict[str, float]:
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            values.update(_flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[prefix + key] = value
+    return values
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[Tuple[str, float, float]]:
+    # Returns (metric, baseline, current) for every latency that grew or rate that fell by more than tolerance.
+    current, previous = _flatten(results['results']), _flatten(baseline['results'])
+    regressions = []
+    for key, value in current.items():
+        old = previous.get(key)
+        if not old or key.endswith('count'):
+            continue
+        higher_is_better = key.endswith('_per_s')
+        ratio = old / value if higher_is_better else value / old
+        if ratio > 1 + tolerance:
+            regressions.append((key, old, value))
+    return regressions
+
+
+def run(args: argparse.Namespace) -> dict:
+    backend = Backend(args)
+    benchmarks = set(args.only or ('latency', 'batch', 'codec', 'contention', 'poller', 'startup'))
+    results = {}
+    try:
+        if 'startup' in benchmarks:
+            results['startup'] = bench_startup(backend, args)
+        if 'codec' in benchmarks:
+            results['codec'] = bench_codec(args)
+        pmd = backend.open()
+        try:
+            if 'latency' in benchmarks:
+                results['command_latency'] = bench_command_latency(pmd, args)
+            if 'batch' in benchmarks:
+                results['batch_throughput'] = bench_batch_throughput(pmd, args)
+            if 'contention' in benchmarks:
+                results['contention'] = bench_contention(pmd, args)
+            if 'poller' in benchmarks:
+                results['status_poller'] = bench_status_poller_cpu(pmd, args)
+        finally:
+            pmd.CloseAxisInterface()
+    finally:
+        backend.close()
+    return {
+        'pymotion_version': '.'.join(str(part) for part in PMDAxisInterface.GetPYMotionVersion()),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'backend': args.backend,
+        'baudrate': args.baudrate,
+        'latency': args.latency,
+        'iterations': args.iterations,
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='PY-Motion benchmarks')
+    parser.add_argument('--backend', choices=('sim', 'pty', 'serial'), default='sim')
+    parser.add_argument('--port', help='serial port of a real motion processor (--backend serial)')
+    parser.add_argument(
+        '--allow-motion', action='store_true',
+        help='with --backend serial, also send commands that change registers, stops included',
+    )
+    parser.add_argument('--baudrate', type=int, help='simulated line rate for --backend sim, port rate otherwise')
+    parser.add_argument('--latency', type=float, default=0.0, help='simulated response delay in seconds')
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=2.0, help='seconds to run the status poller')
+    parser.add_argument('--only', nargs='+', choices=('latency', 'batch', 'codec', 'contention', 'poller', 'startup'))
+    parser.add_argument('--output', default='pmd_benchmark.json')
+    parser.add_argument('--compare', help='earlier results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+    if args.backend == 'serial' and args.port is None:
+        parser.error('--backend serial needs --port')
+
+    output = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    for key, value in _flatten(output['results']).items():
+        print(f'{key:60} {value:14.3f}')
+    print(f'\nresults written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(output, json.load(f), args.tolerance)
+        for key, old, new in regressions:
+            print(f'REGRESSION {key}: {old:.3f} -> {new:.3f}')
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,40 @@
+import pytest
+from PY_Motion.main import *
+from PY_Motion.simulator import *
+
+
+class ManualClock:
+    # Simulated time that only moves when a test advances it, so that profiles run instantly and deterministically
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock() -> ManualClock:
+    return ManualClock()
+
+
+@pytest.fixture
+def simulator(clock: ManualClock) -> MagellanSimulator:
+    return MagellanSimulator(clock=clock)
+
+
+@pytest.fixture
+def pmd(simulator: MagellanSimulator) -> PMDAxisInterface:
+    interface = PMDAxisInterface()
+    interface.SetupAxisInterface(PMDSimulatorTransport(simulator))
+    yield interface
+    if interface._mc is not None:
+        interface.CloseAxisInterface()
+
+
+def checksummed(data: bytes) -> bytes:
+    packet = bytearray(data)
+    packet[1] = -sum(packet) & 0xFF
+    return bytes(packet)
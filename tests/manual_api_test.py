@@ -2,6 +2,7 @@ import sys, os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from PY_Motion.main import *
+from PY_Motion.planner import *
 
 if __name__ == '__main__':
     pmd = PMDAxisInterface()
@@ -245,7 +246,7 @@ if __name__ == '__main__':
 
     print('testing Update()...', end='', flush=True)
     steps_per_second = 100.0
-    velocity = int(round((steps_per_second * sample_time / 1000000.0) * 65536.0))
+    velocity = PMDProfilePlanner(pmd).velocity(steps_per_second)
     for axis in PMDAxis:
         pmd.SetVelocity(axis, velocity)
         pmd.SetAcceleration(axis, velocity)
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import time
+import pytest
+from PY_Motion.aio import *
+from PY_Motion.simulator import *
+
+
+@pytest.fixture
+def pty():
+    with MagellanPtySimulator() as pty:
+        yield pty
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 10.0))
+
+
+def delay_responses(simulator: MagellanSimulator, command: PMDCommand, delay: float, times: int = 1) -> None:
+    # The next times responses to command arrive delay seconds late
+    receive = simulator.receive
+    remaining = [times]
+
+    def delayed(data: bytes) -> bytes:
+        response = receive(data)
+        if remaining[0] and len(data) >= 4 and data[3] == command.opcode:
+            remaining[0] -= 1
+            time.sleep(delay)
+        return response
+
+    simulator.receive = delayed
+
+
+def test_setup_and_commands(pty):
+    async def main():
+        pmd = AsyncPMDAxisInterface()
+        await pmd.SetupAxisInterface_Serial(pty.port, 115200)
+        try:
+            await pmd.SetPosition(PMDAxis.AXIS1, 1234)
+            positions = await asyncio.gather(*(pmd.GetPosition(PMDAxis.AXIS1) for _ in range(8)))
+            assert positions == [1234] * 8
+            with pytest.raises(PMDCommandError):
+                await pmd.SetBufferStart(0, 10 ** 6)
+            assert (await pmd.GetVersion()).family is not None
+        finally:
+            await pmd.CloseAxisInterface()
+
+    run(main())
+
+
+def test_setup_syncs_on_a_stale_partial_packet(pty):
+    os.write(pty._slave, bytes(3))  # the chip holds part of a packet from an earlier session
+
+    async def main():
+        pmd = AsyncPMDAxisInterface()
+        await pmd.SetupAxisInterface_Serial(pty.port, 115200)
+        assert await pmd.GetActualPosition(PMDAxis.AXIS1) == 0
+        await pmd.CloseAxisInterface()
+
+    run(main())
+
+
+def test_setup_fails_within_deadline():
+    simulator = MagellanSimulator()
+    simulator.receive = lambda data: b''
+    with MagellanPtySimulator(simulator) as pty:
+        async def main():
+            pmd = AsyncPMDAxisInterface()
+            start = time.monotonic()
+            with pytest.raises(PMDCommunicationError):
+                await pmd.SetupAxisInterface_Serial(pty.port, 115200, deadline=0.3)
+            assert time.monotonic() - start < 1.0
+
+        run(main())
+
+
+def test_late_response_does_not_shift_the_next_one(pty):
+    async def main():
+        pmd = AsyncPMDAxisInterface(timeout=0.05)
+        await pmd.SetupAxisInterface_Serial(pty.port, 115200)
+        try:
+            await pmd.SetActualPosition(PMDAxis.AXIS2, 77)
+            delay_responses(pty.simulator, PMD_COMMAND_GETACTUALPOSITION, 0.15)
+            with pytest.raises(PMDTimeoutError):
+                await pmd.GetActualPosition(PMDAxis.AXIS2)
+            assert await pmd.GetPosition(PMDAxis.AXIS2) == 0
+            assert await pmd.GetActualPosition(PMDAxis.AXIS2) == 77
+        finally:
+            await pmd.CloseAxisInterface()
+
+    run(main())
+
+
+def test_close_fails_pending_commands(pty):
+    async def main():
+        pmd = AsyncPMDAxisInterface(timeout=5.0)
+        await pmd.SetupAxisInterface_Serial(pty.port, 115200)
+        delay_responses(pty.simulator, PMD_COMMAND_GETACTUALPOSITION, 0.5)
+        in_flight = asyncio.ensure_future(pmd.GetActualPosition(PMDAxis.AXIS1))
+        queued = asyncio.ensure_future(pmd.GetVersion())
+        await asyncio.sleep(0.05)
+        await pmd.CloseAxisInterface()
+        for request in (in_flight, queued):
+            with pytest.raises(PMDCommunicationError):
+                await request
+        with pytest.raises(PMDCommunicationError):
+            await pmd.GetVersion()
+
+    run(main())
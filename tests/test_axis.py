@@ -0,0 +1,91 @@
+import pytest
+from PY_Motion.axis import *
+from PY_Motion.instrumentation import *
+
+
+@pytest.fixture
+def handle(pmd):
+    return PMDAxisHandle(pmd, PMDAxis.AXIS2)
+
+
+def test_refresh(pmd, handle):
+    pmd.SetVelocity(PMDAxis.AXIS2, 123)
+    pmd.SetActualPosition(PMDAxis.AXIS2, 45)
+    assert handle.in_motion is None
+    assert handle.refresh() is handle
+    assert (handle.velocity, handle.actual_position, handle.profile_mode) == (123, 45, PMDProfileMode.TRAPEZOIDAL)
+    assert handle.in_motion is False
+    assert handle.refreshed is not None
+    pmd.SetVelocity(PMDAxis.AXIS2, 456)
+    handle.refresh(profile=False)
+    assert handle.velocity == 123
+
+
+def test_move_to_is_one_batch(pmd, handle, clock):
+    records = []
+    pmd.instrumentation = PMDCallbackSink(records.append)
+    handle.move_to(1000, 10 << 16, 1 << 16)
+    assert {record.batch_size for record in records} == {5}
+    assert (handle.position, handle.velocity, handle.acceleration) == (1000, 10 << 16, 1 << 16)
+    assert pmd.GetActivityStatus(PMDAxis.AXIS2).in_motion
+    clock.advance(1.0)
+    assert handle.wait(timeout=1.0).actual_position == 1000
+    assert handle.in_motion is False
+
+
+def test_move_by_and_s_curve(pmd, handle, clock):
+    handle.move_to(1000, 10 << 16, 1 << 16)
+    clock.advance(1.0)
+    handle.move_by(-500, jerk=1 << 30)
+    assert handle.position == 500
+    assert handle.profile_mode is PMDProfileMode.S_CURVE
+    assert pmd.GetJerk(PMDAxis.AXIS2) == 1 << 30
+    clock.advance(1.0)
+    assert handle.wait().actual_position == 500
+
+
+def test_move_by_reads_unknown_target(pmd, handle):
+    pmd.SetPosition(PMDAxis.AXIS2, 300)
+    handle.move_by(100, 10 << 16, 1 << 16)
+    assert handle.position == pmd.GetPosition(PMDAxis.AXIS2) == 400
+
+
+def test_jog_and_stop(pmd, handle, clock):
+    handle.jog(-(5 << 16), 1 << 16)
+    assert handle.profile_mode is PMDProfileMode.VELOCITY_CONTOURING
+    clock.advance(0.5)
+    handle.wait(timeout=0.0) if False else None
+    with pytest.raises(TimeoutError):
+        handle.wait(timeout=0.01)
+    assert handle.actual_position < 0
+    handle.stop(abrupt=True)
+    handle.wait(timeout=1.0)
+    stopped = handle.actual_position
+    clock.advance(0.5)
+    assert handle.wait().actual_position == stopped
+
+
+def test_smooth_stop(pmd, handle, clock):
+    handle.jog(5 << 16, 1 << 16)
+    clock.advance(0.5)
+    handle.stop()
+    assert pmd.GetActivityStatus(PMDAxis.AXIS2).in_motion
+    clock.advance(0.5)
+    assert not handle.wait().in_motion
+
+
+def test_home(pmd, handle):
+    handle.home(250)
+    assert (handle.position, handle.actual_position) == (250, 250)
+    assert pmd.GetActualPosition(PMDAxis.AXIS2) == pmd.GetPosition(PMDAxis.AXIS2) == 250
+    assert not pmd.GetActivityStatus(PMDAxis.AXIS2).in_motion
+
+
+def test_elided_profile_writes(pmd, handle, clock):
+    pmd.shadow = PMDRegisterShadow(elide_writes=True)
+    records = []
+    handle.move_to(1000, 10 << 16, 1 << 16)
+    clock.advance(1.0)
+    pmd.instrumentation = PMDCallbackSink(records.append)
+    handle.move_to(0, 10 << 16, 1 << 16)
+    assert [record.name for record in records] == ['SetPosition', 'Update']
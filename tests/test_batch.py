@@ -0,0 +1,87 @@
+import pytest
+from PY_Motion.main import *
+from PY_Motion.instrumentation import *
+
+
+@pytest.fixture
+def writes(pmd, monkeypatch):
+    writes = []
+    write = pmd._mc.write
+    monkeypatch.setattr(pmd._mc, 'write', lambda data: writes.append(bytes(data)) or write(data))
+    return writes
+
+
+def test_batch_is_one_write(pmd, writes):
+    with pmd.batch() as batch:
+        batch.SetPosition(PMDAxis.AXIS1, 1000)
+        batch.SetVelocity(PMDAxis.AXIS1, 1 << 16)
+        position = batch.GetPosition(PMDAxis.AXIS1)
+        version = batch.GetVersion()
+        assert len(batch) == 4
+        assert not position.done()
+    assert len(writes) == 1
+    assert position.result() == 1000
+    assert version.result() == pmd.GetVersion()
+
+
+def test_batch_results_are_decoded(pmd):
+    pmd.SetStopMode(PMDAxis.AXIS2, PMDStopMode.SMOOTH_STOP)
+    with pmd.batch() as batch:
+        activity = batch.GetActivityStatus(PMDAxis.AXIS2)
+        mode = batch.GetProfileMode(PMDAxis.AXIS2)
+        update = batch.Update(PMDAxis.AXIS2)
+    assert isinstance(activity.result(), PMDActivityStatus)
+    assert mode.result() is PMDProfileMode.TRAPEZOIDAL
+    assert update.result() is None
+
+
+def test_empty_batch(pmd, writes):
+    with pmd.batch():
+        pass
+    assert writes == []
+
+
+def test_exception_in_block_discards_batch(pmd, writes):
+    with pytest.raises(KeyError):
+        with pmd.batch() as batch:
+            batch.SetPosition(PMDAxis.AXIS1, 1000)
+            raise KeyError
+    assert writes == []
+    assert pmd.GetPosition(PMDAxis.AXIS1) == 0
+
+
+def test_command_error_fails_only_its_future(pmd):
+    batch = pmd.batch()
+    before = batch.SetPosition(PMDAxis.AXIS1, 1000)
+    failed = batch.SetBufferStart(0, 10 ** 6)
+    after = batch.GetPosition(PMDAxis.AXIS1)
+    with pytest.raises(PMDCommandError) as error:
+        batch.execute()
+    assert error.value.error_code == PMD_ERROR_BLOCKOUTOFBOUNDS
+    assert failed.exception() is error.value
+    assert before.result() is None
+    assert after.result() == 1000
+
+
+def test_batch_can_be_reused(pmd, writes):
+    batch = pmd.batch()
+    first = batch.GetActualPosition(PMDAxis.AXIS1)
+    batch.execute()
+    second = batch.GetActualPosition(PMDAxis.AXIS2)
+    batch.execute()
+    batch.execute()
+    assert len(writes) == 2
+    assert (first.result(), second.result()) == (0, 0)
+
+
+def test_batch_records(pmd):
+    records = []
+    pmd.instrumentation = PMDCallbackSink(records.append)
+    with pmd.batch() as batch:
+        batch.GetActualPosition(PMDAxis.AXIS1)
+        batch.GetActualPosition(PMDAxis.AXIS3)
+        batch.NoOperation()
+    assert [(record.name, record.axis, record.batch_size) for record in records] == [
+        ('GetActualPosition', 0, 3), ('GetActualPosition', 2, 3), ('NoOperation', 0, 3),
+    ]
+    assert records[0].latency == records[1].latency
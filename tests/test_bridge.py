@@ -0,0 +1,113 @@
+import socket
+import pytest
+from PY_Motion.bridge import *
+from PY_Motion.bridge import _REPLY, _REQUEST, _COMMUNICATION_ERROR, _RESPONSE, _receive
+
+
+@pytest.fixture
+def server(pmd, tmp_path):
+    with PMDBridgeServer(pmd, str(tmp_path / 'bridge.sock')) as server:
+        yield server
+
+
+@pytest.fixture
+def client(server):
+    with PMDBridgeClient(server.address, timeout=2.0) as client:
+        yield client
+
+
+class Recorder:
+    # Stands in for a client connection of the server
+    def __init__(self):
+        self.replies = []
+
+    def send(self, data: bytes) -> None:
+        while data:
+            request_id, kind, length = _REPLY.unpack_from(data)
+            self.replies.append((request_id, kind, data[_REPLY.size:_REPLY.size + length]))
+            data = data[_REPLY.size + length:]
+
+
+def test_commands(client, pmd):
+    client.SetPosition(PMDAxis.AXIS2, 1234)
+    assert pmd.GetPosition(PMDAxis.AXIS2) == 1234
+    assert client.GetPosition(PMDAxis.AXIS2) == 1234
+    assert client.GetVersion() == pmd.GetVersion()
+    assert client.GetActivityStatus(PMDAxis.AXIS1) == pmd.GetActivityStatus(PMDAxis.AXIS1)
+
+
+def test_command_error(client):
+    with pytest.raises(PMDCommandError) as error:
+        client.SetBufferStart(0, 10 ** 6)
+    assert error.value.error_code == PMD_ERROR_BLOCKOUTOFBOUNDS
+
+
+def test_batch(client):
+    with client.batch() as batch:
+        batch.SetActualPosition(PMDAxis.AXIS3, -9)
+        position = batch.GetActualPosition(PMDAxis.AXIS3)
+        assert len(batch) == 2
+    assert position.result() == -9
+    batch = client.batch()
+    failed = batch.SetBufferStart(0, 10 ** 6)
+    version = batch.GetVersion()
+    with pytest.raises(PMDCommandError):
+        batch.execute()
+    assert failed.exception().error_code == PMD_ERROR_BLOCKOUTOFBOUNDS
+    assert version.result() == client.GetVersion()
+
+
+def test_register_helpers(client):
+    client.set_positions({PMDAxis.AXIS1: 3, PMDAxis.AXIS4: 4})
+    values = client.get_positions()
+    assert [int(value) for value in values] == [3, 0, 0, 4]
+
+
+def test_reset(client, pmd):
+    client.SetPosition(PMDAxis.AXIS1, 99)
+    client.Reset()
+    assert pmd.GetPosition(PMDAxis.AXIS1) == 0
+
+
+def test_tcp(pmd):
+    with PMDBridgeServer(pmd, ('127.0.0.1', 0)) as server:
+        with PMDBridgeClient(server.address) as client:
+            assert client.GetVersion() == pmd.GetVersion()
+
+
+def test_malformed_request(server):
+    with socket.socket(socket.AF_UNIX) as connection:
+        connection.connect(server.address)
+        connection.sendall(_REQUEST.pack(7, 4) + bytes((0, 1, 0, 0)))
+        request_id, kind, length = _REPLY.unpack(_receive(connection, _REPLY.size))
+        assert (request_id, kind) == (7, _COMMUNICATION_ERROR)
+        assert _receive(connection, length) == b'malformed request'
+
+
+def test_identical_reads_are_merged(server):
+    first, second = Recorder(), Recorder()
+    read = PMD_COMMAND_GETACTUALPOSITION.build(PMDAxis.AXIS1.value)
+    write = PMD_COMMAND_SETACTUALPOSITION.build(PMDAxis.AXIS1.value, 5)
+    server._execute([
+        (first, 1, PMD_COMMAND_GETACTUALPOSITION, read),
+        (second, 2, PMD_COMMAND_GETACTUALPOSITION, read),
+        (first, 3, PMD_COMMAND_SETACTUALPOSITION, write),
+        (second, 4, PMD_COMMAND_GETACTUALPOSITION, read),
+    ])
+    assert server.merged == 1
+    assert [(request_id, kind) for request_id, kind, _ in first.replies] == [(1, _RESPONSE), (3, _RESPONSE)]
+    assert [(request_id, kind) for request_id, kind, _ in second.replies] == [(2, _RESPONSE), (4, _RESPONSE)]
+    assert first.replies[0][2] == second.replies[0][2] != second.replies[1][2]
+
+
+def test_server_gone(pmd, tmp_path):
+    server = PMDBridgeServer(pmd, str(tmp_path / 'bridge.sock'))
+    server.start()
+    client = PMDBridgeClient(server.address)
+    try:
+        assert client.GetVersion() == pmd.GetVersion()
+        server.stop()
+        with pytest.raises(PMDCommunicationError):
+            client.GetVersion()
+    finally:
+        client.CloseAxisInterface()
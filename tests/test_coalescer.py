@@ -0,0 +1,118 @@
+import threading
+import time
+from PY_Motion.coalescer import *
+from PY_Motion.main import *
+
+
+def wait_until(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not met'
+        time.sleep(0.001)
+
+
+class Reads:
+    # Runs coalescer.perform for one packet on a thread of its own
+    def __init__(self, coalescer: PMDReadCoalescer, line: threading.Lock, exchange):
+        self.coalescer = coalescer
+        self.line = line
+        self.exchange = exchange
+        self.results = []
+        self.threads = []
+
+    def start(self, packet: bytes) -> None:
+        def read() -> None:
+            try:
+                self.results.append(self.coalescer.perform('GetActualPosition', packet, self.line, self.exchange))
+            except Exception as e:
+                self.results.append(e)
+
+        thread = threading.Thread(target=read)
+        self.threads.append(thread)
+        thread.start()
+
+    def join(self) -> None:
+        for thread in self.threads:
+            thread.join()
+
+
+def test_single_read():
+    coalescer = PMDReadCoalescer()
+    assert coalescer.perform('GetVersion', b'p', threading.Lock(), lambda: b'r') == b'r'
+    assert (coalescer.requests, coalescer.coalesced, coalescer.transactions) == (1, 0, 1)
+    assert coalescer.hit_rate == 0.0
+
+
+def test_waiting_reads_share_an_exchange():
+    coalescer = PMDReadCoalescer()
+    line = threading.Lock()
+    exchanges = []
+    reads = Reads(coalescer, line, lambda: exchanges.append(None) or b'response')
+    with line:
+        for _ in range(4):
+            reads.start(b'read')
+        reads.start(b'other')
+        wait_until(lambda: coalescer.requests == 5)
+    reads.join()
+    assert reads.results == [b'response'] * 5
+    assert len(exchanges) == 2
+    assert (coalescer.coalesced, coalescer.transactions) == (3, 2)
+    assert coalescer.coalesced_by_command == {'GetActualPosition': 3}
+
+
+def test_read_after_exchange_started_is_not_joined():
+    coalescer = PMDReadCoalescer()
+    line = threading.RLock()
+    sent, release = threading.Event(), threading.Event()
+    responses = iter((b'first', b'second'))
+
+    def exchange() -> bytes:
+        sent.set()
+        release.wait()
+        return next(responses)
+
+    reads = Reads(coalescer, line, exchange)
+    reads.start(b'read')
+    sent.wait()
+    reads.start(b'read')
+    wait_until(lambda: coalescer.requests == 2)
+    release.set()
+    reads.join()
+    assert sorted(reads.results) == [b'first', b'second']
+    assert coalescer.coalesced == 0
+
+
+def test_error_reaches_every_waiting_read():
+    coalescer = PMDReadCoalescer()
+    line = threading.Lock()
+
+    def exchange() -> bytes:
+        raise PMDTimeoutError('timeout')
+
+    reads = Reads(coalescer, line, exchange)
+    with line:
+        for _ in range(3):
+            reads.start(b'read')
+        wait_until(lambda: coalescer.requests == 3)
+    reads.join()
+    assert len(reads.results) == 3
+    assert all(isinstance(result, PMDTimeoutError) for result in reads.results)
+    assert coalescer.perform('GetVersion', b'read', line, lambda: b'r') == b'r'
+
+
+def test_interface_reads(pmd):
+    pmd.coalescer = PMDReadCoalescer()
+    pmd.SetActualPosition(PMDAxis.AXIS1, 77)
+    pmd.SetPosition(PMDAxis.AXIS1, 10)
+    assert pmd.coalescer.requests == 0  # writes bypass the coalescer
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.extend(pmd.GetActualPosition(PMDAxis.AXIS1) for _ in range(50)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [77] * 200
+    assert pmd.coalescer.requests == 200
@@ -0,0 +1,155 @@
+import os
+import pytest
+from PY_Motion.instrumentation import *
+from PY_Motion.main import *
+
+
+def records() -> list:
+    return [
+        PMDCommandRecord('GetActualPosition', PMD_COMMAND_GETACTUALPOSITION.opcode, 0, 4, 6, 0.0003),
+        PMDCommandRecord('GetActualPosition', PMD_COMMAND_GETACTUALPOSITION.opcode, 1, 4, 6, 0.0015),
+        PMDCommandRecord(
+            'GetActualPosition', PMD_COMMAND_GETACTUALPOSITION.opcode, 1, 4, 0, 0.25, communication_error='checksum'
+        ),
+        PMDCommandRecord(
+            'SetBufferStart', PMD_COMMAND_SETBUFFERSTART.opcode, 0, 8, 2, 0.001, error_code=PMD_ERROR_BLOCKOUTOFBOUNDS
+        ),
+        PMDCommandRecord(
+            'SetBufferStart', PMD_COMMAND_SETBUFFERSTART.opcode, 0, 8, 0, 0.1, communication_error='timeout'
+        ),
+    ]
+
+
+PROMETHEUS_TEXT = (
+    '# HELP pymotion_commands_total Commands exchanged with the motion controller.\n'
+    '# TYPE pymotion_commands_total counter\n'
+    'pymotion_commands_total{port="ttyAMA0",command="GetActualPosition"} 3\n'
+    'pymotion_commands_total{port="ttyAMA0",command="SetBufferStart"} 2\n'
+    '# HELP pymotion_bytes_sent_total Bytes written to the motion controller.\n'
+    '# TYPE pymotion_bytes_sent_total counter\n'
+    'pymotion_bytes_sent_total{port="ttyAMA0",command="GetActualPosition"} 12\n'
+    'pymotion_bytes_sent_total{port="ttyAMA0",command="SetBufferStart"} 16\n'
+    '# HELP pymotion_bytes_received_total Bytes read from the motion controller.\n'
+    '# TYPE pymotion_bytes_received_total counter\n'
+    'pymotion_bytes_received_total{port="ttyAMA0",command="GetActualPosition"} 12\n'
+    'pymotion_bytes_received_total{port="ttyAMA0",command="SetBufferStart"} 2\n'
+    '# HELP pymotion_timeouts_total Commands whose response did not arrive in time.\n'
+    '# TYPE pymotion_timeouts_total counter\n'
+    'pymotion_timeouts_total{port="ttyAMA0",command="GetActualPosition"} 0\n'
+    'pymotion_timeouts_total{port="ttyAMA0",command="SetBufferStart"} 1\n'
+    '# HELP pymotion_checksum_failures_total Responses that failed the checksum.\n'
+    '# TYPE pymotion_checksum_failures_total counter\n'
+    'pymotion_checksum_failures_total{port="ttyAMA0",command="GetActualPosition"} 1\n'
+    'pymotion_checksum_failures_total{port="ttyAMA0",command="SetBufferStart"} 0\n'
+    '# HELP pymotion_command_errors_total Commands rejected by the motion controller, by error code.\n'
+    '# TYPE pymotion_command_errors_total counter\n'
+    'pymotion_command_errors_total{port="ttyAMA0",command="SetBufferStart",code="7",error="Block out of bounds"} 1\n'
+    '# HELP pymotion_command_latency_seconds Round trip time of commands.\n'
+    '# TYPE pymotion_command_latency_seconds histogram\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="GetActualPosition",le="0.0005"} 1\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="GetActualPosition",le="0.001"} 1\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="GetActualPosition",le="0.002"} 2\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="GetActualPosition",le="0.005"} 2\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="GetActualPosition",le="0.01"} 2\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="GetActualPosition",le="0.02"} 2\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="GetActualPosition",le="0.05"} 2\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="GetActualPosition",le="0.1"} 2\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="GetActualPosition",le="0.2"} 2\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="GetActualPosition",le="0.5"} 3\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="GetActualPosition",le="+Inf"} 3\n'
+    'pymotion_command_latency_seconds_sum{port="ttyAMA0",command="GetActualPosition"} 0.2518\n'
+    'pymotion_command_latency_seconds_count{port="ttyAMA0",command="GetActualPosition"} 3\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="SetBufferStart",le="0.0005"} 0\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="SetBufferStart",le="0.001"} 1\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="SetBufferStart",le="0.002"} 1\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="SetBufferStart",le="0.005"} 1\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="SetBufferStart",le="0.01"} 1\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="SetBufferStart",le="0.02"} 1\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="SetBufferStart",le="0.05"} 1\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="SetBufferStart",le="0.1"} 2\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="SetBufferStart",le="0.2"} 2\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="SetBufferStart",le="0.5"} 2\n'
+    'pymotion_command_latency_seconds_bucket{port="ttyAMA0",command="SetBufferStart",le="+Inf"} 2\n'
+    'pymotion_command_latency_seconds_sum{port="ttyAMA0",command="SetBufferStart"} 0.101\n'
+    'pymotion_command_latency_seconds_count{port="ttyAMA0",command="SetBufferStart"} 2\n'
+)
+
+
+def test_counts():
+    stats = PMDCommandStats()
+    for record in records():
+        stats.record(record)
+    get = stats.opcodes[PMD_COMMAND_GETACTUALPOSITION.opcode]
+    assert (get.name, get.calls, get.bytes_sent, get.bytes_received) == ('GetActualPosition', 3, 12, 12)
+    assert (get.timeouts, get.checksum_failures, get.error_codes) == (0, 1, {})
+    assert get.mean_latency == pytest.approx(0.2518 / 3)
+    assert get.latency_buckets == [1, 0, 1, 0, 0, 0, 0, 0, 0, 1, 0]
+    put = stats.opcodes[PMD_COMMAND_SETBUFFERSTART.opcode]
+    assert (put.calls, put.timeouts, put.error_codes) == (2, 1, {PMD_ERROR_BLOCKOUTOFBOUNDS: 1})
+
+
+def test_latency_quantile():
+    stats = PMDCommandStats()
+    for record in records():
+        stats.record(record)
+    get = stats.opcodes[PMD_COMMAND_GETACTUALPOSITION.opcode]
+    assert get.latency_quantile(0.0) == 0.0005
+    assert get.latency_quantile(0.5) == 0.002
+    assert get.latency_quantile(0.99) == 0.5
+    assert PMDOpcodeStats('NoOperation').latency_quantile(0.5) == 0.0
+    slow = PMDOpcodeStats('Reset')
+    slow.calls, slow.latency_buckets[-1] = 1, 1
+    assert slow.latency_quantile(0.5) == float('inf')
+
+
+def test_snapshot_and_reset():
+    stats = PMDCommandStats()
+    stats.record(records()[3])
+    snapshot = stats.snapshot()
+    stats.record(records()[3])
+    copy = snapshot[PMD_COMMAND_SETBUFFERSTART.opcode]
+    assert (copy.calls, copy.error_codes, sum(copy.latency_buckets)) == (1, {PMD_ERROR_BLOCKOUTOFBOUNDS: 1}, 1)
+    stats.reset()
+    assert stats.snapshot() == {}
+
+
+def test_interface_records(pmd):
+    stats = PMDCommandStats()
+    calls = []
+    pmd.instrumentation = PMDInstrumentation(stats, PMDCallbackSink(calls.append))
+    pmd.GetActualPosition(PMDAxis.AXIS1)
+    pmd.GetActualPosition(PMDAxis.AXIS2)
+    with pytest.raises(PMDCommandError):
+        pmd.SetBufferStart(0, 10 ** 6)
+    get = stats.opcodes[PMD_COMMAND_GETACTUALPOSITION.opcode]
+    assert (get.calls, get.bytes_sent, get.bytes_received) == (2, 8, 12)
+    assert stats.opcodes[PMD_COMMAND_SETBUFFERSTART.opcode].error_codes == {PMD_ERROR_BLOCKOUTOFBOUNDS: 1}
+    assert [record.axis for record in calls] == [0, 1, 0]
+
+
+def test_prometheus_text():
+    sink = PMDPrometheusSink(labels={'port': 'ttyAMA0'})
+    for record in records():
+        sink.record(record)
+    assert sink.render() == PROMETHEUS_TEXT
+
+
+def test_prometheus_without_labels():
+    sink = PMDPrometheusSink(prefix='mount')
+    assert sink.render().splitlines()[:2] == [
+        '# HELP mount_commands_total Commands exchanged with the motion controller.',
+        '# TYPE mount_commands_total counter',
+    ]
+    sink.record(records()[0])
+    assert 'mount_commands_total{command="GetActualPosition"} 1' in sink.render().splitlines()
+
+
+def test_write_textfile(tmp_path):
+    sink = PMDPrometheusSink(labels={'port': 'ttyAMA0'})
+    for record in records():
+        sink.record(record)
+    path = tmp_path / 'pymotion.prom'
+    path.write_text('stale')
+    sink.write_textfile(str(path))
+    assert path.read_text() == PROMETHEUS_TEXT
+    assert os.listdir(tmp_path) == ['pymotion.prom']
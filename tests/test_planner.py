@@ -0,0 +1,64 @@
+import pytest
+from PY_Motion.planner import *
+
+
+def test_synchronized_arrival(pmd):
+    planner = PMDProfilePlanner(pmd)
+    move = PMDCoordinatedMove(
+        planner, {PMDAxis.AXIS1: 20000, PMDAxis.AXIS2: -5000}, 4000.0, 16000.0, synchronize=True,
+        starts={PMDAxis.AXIS1: 0, PMDAxis.AXIS2: 0},
+    )
+    first, second = move.profiles
+    assert first.velocity > second.velocity
+    assert first.duration == pytest.approx(second.duration, rel=0.01)
+
+
+def test_synchronized_s_curve(pmd):
+    planner = PMDProfilePlanner(pmd)
+    move = PMDCoordinatedMove(
+        planner, {PMDAxis.AXIS1: 20000, PMDAxis.AXIS2: -5000}, 4000.0, 16000.0, jerk=1e6, synchronize=True,
+        starts={PMDAxis.AXIS1: 0, PMDAxis.AXIS2: 0},
+    )
+    first, second = move.profiles
+    assert first.mode is second.mode is PMDProfileMode.S_CURVE
+    assert first.jerk > second.jerk > 1
+    assert first.duration == pytest.approx(second.duration, rel=0.01)
+
+
+def test_synchronized_mixed_jerk(pmd):
+    planner = PMDProfilePlanner(pmd)
+    with pytest.raises(ValueError):
+        PMDCoordinatedMove(
+            planner, {PMDAxis.AXIS1: 20000, PMDAxis.AXIS2: -5000}, 4000.0, 16000.0,
+            jerk={PMDAxis.AXIS1: 0.0, PMDAxis.AXIS2: 1e6}, synchronize=True,
+            starts={PMDAxis.AXIS1: 0, PMDAxis.AXIS2: 0},
+        )
+
+
+def test_mixed_jerk_without_synchronize(pmd):
+    planner = PMDProfilePlanner(pmd)
+    move = PMDCoordinatedMove(
+        planner, {PMDAxis.AXIS1: 20000, PMDAxis.AXIS2: -5000}, 4000.0, 16000.0,
+        jerk={PMDAxis.AXIS1: 0.0, PMDAxis.AXIS2: 1e6}, starts={PMDAxis.AXIS1: 0, PMDAxis.AXIS2: 0},
+    )
+    assert [profile.mode for profile in move.profiles] == [PMDProfileMode.TRAPEZOIDAL, PMDProfileMode.S_CURVE]
+
+
+def test_stationary_axis_is_ignored(pmd):
+    planner = PMDProfilePlanner(pmd)
+    move = PMDCoordinatedMove(
+        planner, {PMDAxis.AXIS1: 20000, PMDAxis.AXIS2: 0}, 4000.0, 16000.0,
+        jerk={PMDAxis.AXIS1: 1e6, PMDAxis.AXIS2: 0.0}, synchronize=True,
+        starts={PMDAxis.AXIS1: 0, PMDAxis.AXIS2: 0},
+    )
+    assert move.profiles[1].duration == 0.0
+
+
+def test_coordinated_move_runs(pmd, clock):
+    planner = PMDProfilePlanner(pmd)
+    move = PMDCoordinatedMove(planner, {PMDAxis.AXIS1: 2000, PMDAxis.AXIS2: 1000}, 4000.0, 16000.0, synchronize=True)
+    handle = move.start()
+    assert not handle.done()
+    clock.advance(move.duration + 0.05)
+    assert handle.done()
+    assert list(pmd.get_actual_positions((PMDAxis.AXIS1, PMDAxis.AXIS2))) == [2000, 1000]
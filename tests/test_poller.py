@@ -0,0 +1,137 @@
+import asyncio
+import pytest
+from PY_Motion.main import *
+from PY_Motion.poller import *
+
+
+def test_snapshot_without_thread(pmd):
+    poller = PMDStatusPoller(pmd, axes=[PMDAxis.AXIS1])
+    snapshot = poller.snapshot()
+    assert snapshot.get(PMDAxis.AXIS1, PMDStatusRegister.ACTUAL_POSITION) == 0
+    assert not snapshot.in_motion
+
+
+def test_wait_for_motion_complete(pmd, clock):
+    pmd.SetPosition(PMDAxis.AXIS2, 1000)
+    pmd.SetVelocity(PMDAxis.AXIS2, 10 << 16)
+    pmd.SetAcceleration(PMDAxis.AXIS2, 1 << 16)
+    pmd.Update(PMDAxis.AXIS2)
+    with PMDStatusPoller(pmd, interval=0.001) as poller:
+        assert poller.get(PMDAxis.AXIS2, PMDStatusRegister.ACTIVITY_STATUS, max_age=0.5).in_motion
+        clock.advance(1.0)
+        snapshot = poller.wait_for_motion_complete(PMDAxis.AXIS2, timeout=2.0)
+        assert snapshot.get(PMDAxis.AXIS2, PMDStatusRegister.ACTUAL_POSITION) == 1000
+        poller.wait_for_event(PMDAxis.AXIS2, PMDEventStatus.MOTION_COMPLETE, timeout=2.0)
+
+
+def test_wait_for_times_out(pmd):
+    with PMDStatusPoller(pmd, interval=0.001) as poller:
+        with pytest.raises(TimeoutError):
+            poller.wait_for_event(PMDAxis.AXIS1, PMDEventStatus.CAPTURE_RECEIVED, timeout=0.05)
+
+
+def test_unexpected_error_reaches_waiters(pmd):
+    poller = PMDStatusPoller(pmd, interval=0.001)
+    polled = poller.poll
+
+    def poll():
+        polled()
+        raise ValueError('unknown enum value')
+
+    poller.poll = poll
+    poller.start()
+    try:
+        with pytest.raises(ValueError):
+            poller.wait_for_motion_complete(PMDAxis.AXIS1, timeout=5.0)
+        assert not poller.running
+        assert isinstance(poller.failure, ValueError)
+        with pytest.raises(ValueError):
+            poller.snapshot()
+        with pytest.raises(ValueError):
+            poller.get(PMDAxis.AXIS1, PMDStatusRegister.ACTIVITY_STATUS)
+    finally:
+        poller.stop()
+    poller.poll = polled
+    with poller:
+        assert poller.failure is None
+        assert poller.wait_for_motion_complete(PMDAxis.AXIS1, timeout=2.0) is not None
+
+
+def test_communication_errors_are_retried(pmd):
+    poller = PMDStatusPoller(pmd, interval=0.001, idle_interval=0.001, max_backoff=0.005)
+    polled = poller.poll
+    failures = [PMDTimeoutError('timeout'), PMDChecksumError('checksum')]
+
+    def poll():
+        if failures:
+            raise failures.pop(0)
+        return polled()
+
+    poller.poll = poll
+    with poller:
+        assert poller.wait_for_motion_complete(PMDAxis.AXIS1, timeout=2.0) is not None
+        assert poller.failure is None
+
+
+def test_unexpected_error_reaches_async_waiters(pmd):
+    poller = PMDStatusPoller(pmd, interval=0.001)
+    poller.poll = lambda: (_ for _ in ()).throw(KeyError('register'))
+    poller.start()
+    try:
+        with pytest.raises(KeyError):
+            asyncio.run(poller.wait_for_motion_complete_async(PMDAxis.AXIS1, timeout=5.0))
+    finally:
+        poller.stop()
+
+
+def count_polls(poller: PMDStatusPoller) -> list:
+    polls = []
+    polled = poller.poll
+    poller.poll = lambda: polls.append(None) or polled()
+    return polls
+
+
+def test_async_wait_keeps_the_poll_rate(pmd):
+    poller = PMDStatusPoller(pmd, interval=0.05, idle_interval=0.05)
+    polls = count_polls(poller)
+    with poller:
+        with pytest.raises(TimeoutError):
+            asyncio.run(poller.wait_for_event_async(PMDAxis.AXIS1, PMDEventStatus.CAPTURE_RECEIVED, timeout=0.3))
+    assert len(polls) <= 10
+
+
+def test_async_wait_uses_the_fast_interval(pmd):
+    poller = PMDStatusPoller(pmd, interval=0.01, idle_interval=10.0)
+    polls = count_polls(poller)
+    with poller:
+        with pytest.raises(TimeoutError):
+            asyncio.run(poller.wait_for_event_async(PMDAxis.AXIS1, PMDEventStatus.CAPTURE_RECEIVED, timeout=0.2))
+    assert len(polls) >= 5
+
+
+def test_closed_event_loop_does_not_stop_the_poller(pmd):
+    with PMDStatusPoller(pmd, interval=0.001) as poller:
+        with pytest.raises(TimeoutError):
+            asyncio.run(poller.wait_for_event_async(PMDAxis.AXIS1, PMDEventStatus.CAPTURE_RECEIVED, timeout=0.02))
+        assert poller._async_waiters == []
+        # a waiter left behind by a loop that has since been closed
+        loop = asyncio.new_event_loop()
+        poller._async_waiters.append((loop, loop.create_future()))
+        loop.close()
+        poller.wait_for_motion_complete(PMDAxis.AXIS1, timeout=2.0)
+        assert poller.running
+        assert poller.failure is None
+
+
+def test_cancelled_async_wait_is_removed(pmd):
+    async def cancel() -> None:
+        task = asyncio.ensure_future(poller.wait_for_event_async(PMDAxis.AXIS1, PMDEventStatus.CAPTURE_RECEIVED))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    with PMDStatusPoller(pmd, interval=0.001) as poller:
+        asyncio.run(cancel())
+        assert poller._async_waiters == []
+        assert poller._waiters == 0
@@ -0,0 +1,75 @@
+import pytest
+from PY_Motion.pool import *
+from PY_Motion.simulator import *
+
+
+@pytest.fixture
+def simulators():
+    return {name: MagellanSimulator() for name in ('a', 'b')}
+
+
+@pytest.fixture
+def pool(simulators):
+    with PMDControllerPool({name: PMDSimulatorTransport(simulator) for name, simulator in simulators.items()}) as pool:
+        yield pool
+
+
+def test_call(pool):
+    pool.call('SetActualPosition', PMDAxis.AXIS1, 12, names=['b'])
+    result = pool.call('GetActualPosition', PMDAxis.AXIS1)
+    assert result.ok
+    assert result.values == {'a': 0, 'b': 12}
+
+
+def test_map_is_batched(pool, simulators):
+    pool.map('SetActualPosition', [(axis, axis.value + 1) for axis in PMDAxis])
+    result = pool.map('GetActualPosition', PMDAxis)
+    assert result.values == {'a': [1, 2, 3, 4], 'b': [1, 2, 3, 4]}
+
+
+def test_map_helper_methods(pool):
+    # helpers that PMDCommandBatch does not have are called one by one
+    result = pool.map('get_registers', [((PMDAxis.AXIS1,),), ((PMDAxis.AXIS1, PMDAxis.AXIS2),)])
+    assert result.ok
+    assert [len(list(values)) for values in result.values['a']] == [1, 2]
+
+
+def test_unknown_method(pool):
+    with pytest.raises(ValueError):
+        pool.call('GetNothing')
+    with pytest.raises(ValueError):
+        pool.map('_transact', [()])
+    with pytest.raises(ValueError):
+        pool.submit('a', 'lock')
+
+
+def test_submit(pool):
+    assert pool.submit('a', 'GetVersion').result() == pool.call('GetVersion').values['b']
+
+
+def test_command_error(pool):
+    result = pool.call('SetBufferStart', 0, 10 ** 6)
+    assert set(result.errors) == {'a', 'b'}
+    assert all(isinstance(error, PMDCommandError) for error in result.errors.values())
+    assert all(health.healthy for health in pool.health().values())
+
+
+def test_communication_failure(pool, simulators, monkeypatch):
+    monkeypatch.setattr(simulators['b'], 'receive', lambda data: b'')
+    result = pool.call('GetActualPosition', PMDAxis.AXIS1)
+    assert list(result.values) == ['a']
+    assert isinstance(result.errors['b'], PMDCommunicationError)
+    health = pool.health()
+    assert health['a'].healthy
+    assert not health['b'].healthy
+    assert health['b'].failures == health['b'].consecutive_failures == 1
+
+
+def test_connect_failure():
+    simulator = MagellanSimulator()
+    simulator.receive = lambda data: b''
+    with PMDControllerPool({'dead': PMDSimulatorTransport(simulator)}, deadline=0.2, connect=False) as pool:
+        errors = pool.connect()
+        assert isinstance(errors['dead'], PMDCommunicationError)
+        assert not pool.health()['dead'].connected
+        assert pool.call('GetVersion').errors['dead'] is not None
@@ -0,0 +1,63 @@
+import pytest
+from PY_Motion.main import *
+from PY_Motion.simulator import *
+
+
+def flat(values) -> list:
+    # get_registers returns a 2-D numpy array when numpy is installed, a flat array('i') otherwise
+    return [int(value) for value in (values.reshape(-1) if hasattr(values, 'reshape') else values)]
+
+
+def test_get_registers_is_axis_major(pmd):
+    for axis in PMDAxis:
+        pmd.SetActualPosition(axis, -axis.value)
+        pmd.SetPosition(axis, 10 * axis.value)
+    values = pmd.get_registers(
+        (PMDAxis.AXIS2, PMDAxis.AXIS4), (PMD_COMMAND_GETACTUALPOSITION, PMD_COMMAND_GETPOSITION)
+    )
+    assert flat(values) == [-1, 10, -3, 30]
+
+
+def test_single_register_helpers(pmd):
+    pmd.set_positions({PMDAxis.AXIS1: 5, PMDAxis.AXIS3: -5})
+    pmd.set_velocities({axis: 1000 + axis.value for axis in PMDAxis})
+    assert flat(pmd.get_positions()) == [5, 0, -5, 0]
+    assert flat(pmd.get_velocities((PMDAxis.AXIS4,))) == [1003]
+    assert flat(pmd.get_activity_statuses((PMDAxis.AXIS1,))) == [pmd.GetActivityStatus(PMDAxis.AXIS1).value]
+
+
+def test_plans_are_reused(pmd):
+    pmd.get_actual_positions()
+    plans = dict(pmd._register_plans)
+    pmd.get_actual_positions()
+    assert pmd._register_plans == plans
+
+
+def test_command_that_is_not_a_register(pmd):
+    with pytest.raises(ValueError):
+        pmd.get_registers((PMDAxis.AXIS1,), (PMD_COMMAND_GETPROFILEMODE,))
+
+
+def test_command_error(clock):
+    pmd = PMDAxisInterface()
+    pmd.SetupAxisInterface(PMDSimulatorTransport(MagellanSimulator(number_of_axes=2, clock=clock)))
+    with pytest.raises(PMDCommandError):
+        pmd.get_actual_positions()
+    assert flat(pmd.get_actual_positions((PMDAxis.AXIS1, PMDAxis.AXIS2))) == [0, 0]
+    pmd.CloseAxisInterface()
+
+
+def test_reads_refresh_the_shadow(pmd):
+    pmd.shadow = PMDRegisterShadow()
+    pmd.SetPosition(PMDAxis.AXIS1, 100)
+    assert flat(pmd.get_positions((PMDAxis.AXIS1,))) == [100]
+    pmd.set_positions({PMDAxis.AXIS1: 200})
+    assert pmd.GetPosition(PMDAxis.AXIS1) == 200
+
+
+def test_buffer_round_trip(pmd):
+    pmd.SetBufferStart(0, 0)
+    pmd.SetBufferLength(0, 100)
+    values = [value * value - 50 for value in range(100)]
+    pmd.write_buffer(0, values, index=0)
+    assert flat(pmd.read_buffer(0, 100, index=0)) == values
@@ -0,0 +1,125 @@
+import pytest
+from PY_Motion.main import *
+from PY_Motion.instrumentation import *
+
+
+class LineFaults:
+    # Damages the simulator's responses to the next writes that start with a packet of the given command
+    def __init__(self, simulator):
+        self.faults = []
+        self.sent = []  # opcode of the first packet of every write
+        self._receive = simulator.receive
+        simulator.receive = self.receive
+
+    def corrupt(self, command: PMDCommand, times: int = 1) -> None:
+        self.faults += [(command.opcode, 'corrupt')] * times
+
+    def drop(self, command: PMDCommand, times: int = 1) -> None:
+        self.faults += [(command.opcode, 'drop')] * times
+
+    def receive(self, data: bytes) -> bytes:
+        response = self._receive(data)
+        if len(data) < 4:
+            return response
+        self.sent.append(data[3])
+        if self.faults and self.faults[0][0] == data[3]:
+            _, kind = self.faults.pop(0)
+            if kind == 'drop':
+                return b''
+            response = bytearray(response)
+            response[-1] ^= 0x01
+        return bytes(response)
+
+
+@pytest.fixture
+def faults(pmd, simulator):
+    pmd._mc.timeout = 0.01
+    return LineFaults(simulator)
+
+
+def test_errors_without_policy(pmd, faults):
+    faults.corrupt(PMD_COMMAND_GETACTUALPOSITION)
+    with pytest.raises(PMDChecksumError):
+        pmd.GetActualPosition(PMDAxis.AXIS1)
+    faults.drop(PMD_COMMAND_GETACTUALPOSITION)
+    with pytest.raises(PMDTimeoutError):
+        pmd.GetActualPosition(PMDAxis.AXIS1)
+
+
+@pytest.mark.parametrize('fault', ['corrupt', 'drop'])
+def test_idempotent_command_is_retried(pmd, faults, fault):
+    pmd.retry_policy = PMDRetryPolicy(backoff=0.0)
+    pmd.SetActualPosition(PMDAxis.AXIS1, 42)
+    getattr(faults, fault)(PMD_COMMAND_GETACTUALPOSITION, 2)
+    assert pmd.GetActualPosition(PMDAxis.AXIS1) == 42
+    assert faults.sent.count(PMD_COMMAND_GETACTUALPOSITION.opcode) == 3
+
+
+def test_retries_are_bounded(pmd, faults):
+    pmd.retry_policy = PMDRetryPolicy(attempts=2, backoff=0.0)
+    faults.corrupt(PMD_COMMAND_GETACTUALPOSITION, 3)
+    with pytest.raises(PMDChecksumError):
+        pmd.GetActualPosition(PMDAxis.AXIS1)
+    assert faults.sent.count(PMD_COMMAND_GETACTUALPOSITION.opcode) == 3
+    assert pmd.GetActualPosition(PMDAxis.AXIS1) == 0
+
+
+def test_other_commands_are_not_sent_twice(pmd, faults):
+    pmd.retry_policy = PMDRetryPolicy(backoff=0.0)
+    pmd.SetPosition(PMDAxis.AXIS1, 100)
+    faults.drop(PMD_COMMAND_UPDATE)
+    with pytest.raises(PMDTimeoutError):
+        pmd.Update(PMDAxis.AXIS1)
+    assert faults.sent.count(PMD_COMMAND_UPDATE.opcode) == 1
+    assert pmd.GetActivityStatus(PMDAxis.AXIS1).in_motion
+
+
+def test_retry_records(pmd, faults):
+    records = []
+    pmd.instrumentation = PMDCallbackSink(records.append)
+    pmd.retry_policy = PMDRetryPolicy(backoff=0.0)
+    faults.corrupt(PMD_COMMAND_GETVERSION)
+    pmd.GetVersion()
+    assert [(record.name, record.communication_error) for record in records] == [
+        ('GetVersion', 'checksum'), ('GetVersion', None),
+    ]
+
+
+def test_batch_is_retried_from_the_failure(pmd, faults):
+    pmd.retry_policy = PMDRetryPolicy(backoff=0.0)
+    pmd.SetActualPosition(PMDAxis.AXIS2, 7)
+    faults.corrupt(PMD_COMMAND_GETACTUALPOSITION)
+    with pmd.batch() as batch:
+        first = batch.GetActualPosition(PMDAxis.AXIS1)
+        second = batch.GetActualPosition(PMDAxis.AXIS2)
+    assert (first.result(), second.result()) == (0, 7)
+
+
+def test_batch_with_other_commands_is_not_retried(pmd, faults):
+    pmd.retry_policy = PMDRetryPolicy(backoff=0.0)
+    pmd.SetPosition(PMDAxis.AXIS1, 100)
+    faults.drop(PMD_COMMAND_UPDATE)
+    batch = pmd.batch()
+    update = batch.Update(PMDAxis.AXIS1)
+    status = batch.GetActivityStatus(PMDAxis.AXIS1)
+    with pytest.raises(PMDTimeoutError):
+        batch.execute()
+    assert isinstance(update.exception(), PMDTimeoutError)
+    assert isinstance(status.exception(), PMDTimeoutError)
+    assert faults.sent.count(PMD_COMMAND_UPDATE.opcode) == 1
+    assert pmd.GetActivityStatus(PMDAxis.AXIS1).in_motion
+
+
+def test_set_register_is_retried(pmd, faults):
+    pmd.retry_policy = PMDRetryPolicy(backoff=0.0)
+    faults.drop(PMD_COMMAND_SETPOSITION)
+    pmd.SetPosition(PMDAxis.AXIS1, 100)
+    assert faults.sent.count(PMD_COMMAND_SETPOSITION.opcode) == 2
+    assert pmd.GetPosition(PMDAxis.AXIS1) == 100
+
+
+def test_register_read_is_retried(pmd, faults):
+    pmd.retry_policy = PMDRetryPolicy(backoff=0.0)
+    pmd.SetActualPosition(PMDAxis.AXIS3, -3)
+    faults.corrupt(PMD_COMMAND_GETACTUALPOSITION)
+    assert list(pmd.get_actual_positions((PMDAxis.AXIS1, PMDAxis.AXIS3))) == [0, -3]
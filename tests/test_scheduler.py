@@ -0,0 +1,142 @@
+import threading
+import time
+import pytest
+from PY_Motion.main import *
+from PY_Motion.scheduler import *
+
+
+def wait_until(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not met'
+        time.sleep(0.001)
+
+
+def queue_waiters(scheduler: PMDCommandScheduler, priorities, order: list) -> list:
+    # Starts one thread per priority that takes the line and notes its priority, each only once the previous one is
+    # queued; the caller must hold the line.
+    def waiter(priority: PMDPriority) -> None:
+        with scheduler.slot(priority):
+            order.append(priority)
+
+    threads = []
+    for count, priority in enumerate(priorities, 1):
+        thread = threading.Thread(target=waiter, args=(priority,))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: sum(scheduler.waiting().values()) == count)
+    return threads
+
+
+def test_command_priorities():
+    assert command_priority(PMD_COMMAND_SETSTOPMODE) is PMDPriority.SAFETY
+    assert command_priority(PMD_COMMAND_UPDATE) is PMDPriority.MOTION
+    assert command_priority(PMD_COMMAND_SETPOSITIONERRORLIMIT) is PMDPriority.CONFIGURATION
+    assert command_priority(PMD_COMMAND_GETACTIVITYSTATUS) is PMDPriority.TELEMETRY
+    assert command_priority(PMD_COMMAND_READBUFFER) is PMDPriority.TELEMETRY
+
+
+def test_reentrant():
+    scheduler = PMDCommandScheduler()
+    with scheduler:
+        with scheduler.slot(PMDPriority.SAFETY):
+            assert scheduler.acquire(blocking=False)
+            scheduler.release()
+    with pytest.raises(RuntimeError):
+        scheduler.release()
+
+
+def test_most_urgent_waiter_goes_first():
+    scheduler = PMDCommandScheduler()
+    order = []
+    priorities = [PMDPriority.TELEMETRY, PMDPriority.CONFIGURATION, PMDPriority.TELEMETRY, PMDPriority.SAFETY]
+    with scheduler.slot(PMDPriority.TELEMETRY):
+        threads = queue_waiters(scheduler, priorities, order)
+        assert scheduler.waiting()[PMDPriority.TELEMETRY] == 2
+    for thread in threads:
+        thread.join()
+    assert order == [PMDPriority.SAFETY, PMDPriority.CONFIGURATION, PMDPriority.TELEMETRY, PMDPriority.TELEMETRY]
+    statistics = scheduler.snapshot()
+    assert statistics[PMDPriority.SAFETY].preemptions == 1
+    assert statistics[PMDPriority.TELEMETRY].slots == 3
+    assert statistics[PMDPriority.SAFETY].max_wait > 0
+    assert statistics[PMDPriority.SAFETY].wait_quantile(0.5) >= statistics[PMDPriority.SAFETY].max_wait
+
+
+def test_same_priority_is_first_come_first_served():
+    scheduler = PMDCommandScheduler()
+    order = []
+    with scheduler:
+        threads = []
+        for index in range(3):
+            def waiter(index: int = index) -> None:
+                with scheduler.slot(PMDPriority.MOTION):
+                    order.append(index)
+
+            threads.append(threading.Thread(target=waiter))
+            threads[-1].start()
+            wait_until(lambda: scheduler.waiting()[PMDPriority.MOTION] == index + 1)
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2]
+    assert scheduler.snapshot()[PMDPriority.MOTION].preemptions == 0
+
+
+def test_timeout_and_non_blocking():
+    scheduler = PMDCommandScheduler()
+    held, done = threading.Event(), threading.Event()
+
+    def holder() -> None:
+        with scheduler:
+            held.set()
+            done.wait()
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    held.wait()
+    try:
+        assert not scheduler.acquire(blocking=False)
+        assert not scheduler.acquire(timeout=0.01, priority=PMDPriority.SAFETY)
+        assert scheduler.waiting()[PMDPriority.SAFETY] == 0
+    finally:
+        done.set()
+        thread.join()
+    assert scheduler.acquire(timeout=0.01)
+    scheduler.release()
+
+
+def test_reset_statistics():
+    scheduler = PMDCommandScheduler()
+    with scheduler:
+        pass
+    assert scheduler.snapshot()[PMDPriority.CONFIGURATION].slots == 1
+    scheduler.reset()
+    assert scheduler.snapshot()[PMDPriority.CONFIGURATION].slots == 0
+
+
+def test_wait_statistics():
+    scheduler = PMDCommandScheduler()
+    for wait in (0.0003, 0.0015, 0.004, 0.3, 2.0):
+        scheduler._record(scheduler.statistics[PMDPriority.MOTION], wait, False)
+    stats = scheduler.snapshot()[PMDPriority.MOTION]
+    assert stats.wait_buckets == [1, 0, 1, 1, 0, 0, 0, 0, 0, 1, 1]
+    assert [stats.wait_quantile(q) for q in (0.2, 0.6, 0.8, 1.0)] == [0.0005, 0.005, 0.5, float('inf')]
+    assert PMDQueueWaitStats(PMDPriority.SAFETY).wait_quantile(0.5) == 0.0
+    scheduler._record(scheduler.statistics[PMDPriority.MOTION], 0.001, True)
+    assert (stats.slots, sum(stats.wait_buckets), stats.preemptions) == (5, 5, 0)  # the snapshot is a copy
+
+
+def test_interface_uses_command_priorities(pmd):
+    pmd.lock = scheduler = PMDCommandScheduler()
+    pmd.GetActualPosition(PMDAxis.AXIS1)
+    with pmd.batch() as batch:
+        batch.GetActivityStatus(PMDAxis.AXIS1)
+        batch.SetStopMode(PMDAxis.AXIS1, PMDStopMode.ABRUPT_STOP)
+        batch.Update(PMDAxis.AXIS1)
+    pmd.get_actual_positions()
+    with pmd.lock:
+        pass
+    slots = {priority: stats.slots for priority, stats in scheduler.snapshot().items()}
+    assert slots == {
+        PMDPriority.SAFETY: 1, PMDPriority.MOTION: 0, PMDPriority.CONFIGURATION: 1, PMDPriority.TELEMETRY: 2,
+    }
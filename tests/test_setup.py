@@ -0,0 +1,102 @@
+import os
+import random
+import time
+import pytest
+from PY_Motion.main import *
+from PY_Motion.simulator import *
+from PY_Motion.transport import PMDTransport
+
+
+class GarbageTransport(PMDTransport):
+    # A line that never carries a valid response: every write is answered with random bytes, and with noise set there
+    # is always something to read
+    def __init__(self, noise: bool = False):
+        self.noise = noise
+        self.closed = False
+        self._random = random.Random(1)
+        self._pending = bytearray()
+
+    def write(self, data: bytes) -> int:
+        self._pending += bytes(self._random.randrange(1, 256) for _ in range(len(data) + 2))
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        if self.noise:
+            self._pending += bytes(self._random.randrange(1, 256) for _ in range(size))
+        data, self._pending = bytes(self._pending[:size]), self._pending[size:]
+        return data
+
+    def reset_input_buffer(self) -> None:
+        self._pending.clear()
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def assert_setup_fails(transport: PMDTransport, deadline: float) -> None:
+    pmd = PMDAxisInterface()
+    start = time.monotonic()
+    with pytest.raises(PMDCommunicationError):
+        pmd.SetupAxisInterface(transport, deadline)
+    assert time.monotonic() - start < deadline + 0.2
+    assert pmd._mc is None
+
+
+def test_dead_transport_fails_within_deadline():
+    simulator = MagellanSimulator()
+    simulator.receive = lambda data: b''
+    transport = PMDSimulatorTransport(simulator)
+    closed = []
+    transport.close = lambda: closed.append(True)
+    assert_setup_fails(transport, 0.3)
+    assert closed
+
+
+@pytest.mark.parametrize('noise', [False, True])
+def test_garbage_transport_fails_within_deadline(noise):
+    transport = GarbageTransport(noise)
+    assert_setup_fails(transport, 0.3)
+    assert transport.closed
+
+
+def test_setup_syncs_on_a_stale_partial_packet(simulator):
+    simulator.receive(bytes(3))  # the chip holds part of a packet from an earlier session
+    pmd = PMDAxisInterface()
+    pmd.SetupAxisInterface(PMDSimulatorTransport(simulator))
+    assert pmd.GetActualPosition(PMDAxis.AXIS1) == 0
+    assert pmd._mc.timeout == 0.1
+
+
+def test_setup_serial_interfaces():
+    with MagellanPtySimulator() as first, MagellanPtySimulator() as second:
+        os.write(second._slave, bytes(2))  # stale bytes on one of the lines
+        missing = '/dev/pymotion-missing'
+        start = time.monotonic()
+        interfaces, errors = setup_serial_interfaces([first.port, second.port, missing], 115200, deadline=0.5)
+        assert time.monotonic() - start < 1.0
+        try:
+            assert sorted(interfaces) == sorted([first.port, second.port])
+            assert list(errors) == [missing]
+            assert isinstance(errors[missing], serial.SerialException)
+            for interface in interfaces.values():
+                interface.SetPosition(PMDAxis.AXIS1, 1234)
+                assert interface.GetPosition(PMDAxis.AXIS1) == 1234
+        finally:
+            for interface in interfaces.values():
+                interface.CloseAxisInterface()
+
+
+def test_setup_serial_interfaces_reports_a_dead_controller():
+    simulator = MagellanSimulator()
+    simulator.receive = lambda data: b''
+    with MagellanPtySimulator() as alive, MagellanPtySimulator(simulator) as dead:
+        start = time.monotonic()
+        interfaces, errors = setup_serial_interfaces([alive.port, dead.port], 115200, deadline=0.3)
+        assert time.monotonic() - start < 1.0
+        assert list(interfaces) == [alive.port]
+        assert isinstance(errors[dead.port], PMDCommunicationError)
+        interfaces[alive.port].CloseAxisInterface()
+
+
+def test_setup_serial_interfaces_without_ports():
+    assert setup_serial_interfaces([], 115200) == ({}, {})
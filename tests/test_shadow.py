@@ -0,0 +1,146 @@
+import pytest
+from PY_Motion.main import *
+from PY_Motion.instrumentation import *
+
+
+@pytest.fixture
+def records(pmd):
+    records = []
+    pmd.instrumentation = PMDCallbackSink(records.append)
+    return records
+
+
+def test_get_is_answered_from_shadow_after_set(pmd, records):
+    pmd.shadow = PMDRegisterShadow()
+    pmd.SetVelocity(PMDAxis.AXIS1, 12345)
+    records.clear()
+    assert pmd.GetVelocity(PMDAxis.AXIS1) == 12345
+    assert records == []
+    assert pmd.shadow.hits == 1
+
+
+def test_get_fills_shadow(pmd, records):
+    pmd.shadow = PMDRegisterShadow()
+    assert pmd.GetProfileMode(PMDAxis.AXIS2) == PMDProfileMode.TRAPEZOIDAL
+    records.clear()
+    assert pmd.GetProfileMode(PMDAxis.AXIS2) == PMDProfileMode.TRAPEZOIDAL
+    assert records == []
+    assert (pmd.shadow.misses, pmd.shadow.hits) == (1, 1)
+
+
+def test_shadow_is_per_axis_and_argument(pmd):
+    pmd.shadow = PMDRegisterShadow()
+    pmd.SetEventAction(PMDAxis.AXIS1, PMDEvent.MOTION_ERROR, PMDAction.ABRUPT_STOP)
+    pmd.SetEventAction(PMDAxis.AXIS1, PMDEvent.POSITIVE_LIMIT, PMDAction.NONE)
+    assert pmd.GetEventAction(PMDAxis.AXIS1, PMDEvent.MOTION_ERROR) == PMDAction.ABRUPT_STOP
+    assert pmd.GetEventAction(PMDAxis.AXIS1, PMDEvent.POSITIVE_LIMIT) == PMDAction.NONE
+    assert pmd.GetEventAction(PMDAxis.AXIS2, PMDEvent.MOTION_ERROR) == PMDAction.NONE
+
+
+def test_failed_set_leaves_shadow_alone(pmd):
+    pmd.shadow = PMDRegisterShadow()
+    pmd.SetPositionErrorLimit(PMDAxis.AXIS1, 100)
+    pmd._mc.simulator.number_of_axes = 0  # every command is now rejected
+    with pytest.raises(PMDCommandError):
+        pmd.SetPositionErrorLimit(PMDAxis.AXIS1, 200)
+    assert pmd.GetPositionErrorLimit(PMDAxis.AXIS1) == 100
+
+
+def test_reset_clears_shadow(pmd):
+    pmd.shadow = PMDRegisterShadow()
+    pmd.SetVelocity(PMDAxis.AXIS1, 5)
+    pmd.Reset()
+    assert len(pmd.shadow) == 0
+    assert pmd.GetVelocity(PMDAxis.AXIS1) == 0
+
+
+def test_batch_uses_shadow(pmd, records):
+    pmd.shadow = PMDRegisterShadow()
+    pmd.SetJerk(PMDAxis.AXIS1, 77)
+    records.clear()
+    with pmd.batch() as batch:
+        jerk = batch.GetJerk(PMDAxis.AXIS1)
+        position = batch.GetActualPosition(PMDAxis.AXIS1)
+    assert (jerk.result(), position.result()) == (77, 0)
+    assert [record.name for record in records] == ['GetActualPosition']
+
+
+def test_verify_detects_changes_behind_the_shadow(pmd, simulator):
+    pmd.shadow = PMDRegisterShadow(verify=True)
+    pmd.SetVelocity(PMDAxis.AXIS1, 5)
+    simulator.axes[0].velocity = 6
+    with pytest.raises(PMDShadowMismatchError):
+        pmd.GetVelocity(PMDAxis.AXIS1)
+
+
+@pytest.mark.parametrize('mode', [PMDStopMode.ABRUPT_STOP, PMDStopMode.SMOOTH_STOP])
+@pytest.mark.parametrize('update', ['Update', 'MultiUpdate'])
+def test_stop_mode_reads_back_after_stop(pmd, clock, mode, update):
+    # Update carries out the stop and the motion controller resets the stop mode
+    pmd.shadow = PMDRegisterShadow(verify=True)
+    pmd.SetVelocity(PMDAxis.AXIS1, 1 << 16)
+    pmd.SetAcceleration(PMDAxis.AXIS1, 1 << 16)
+    pmd.SetPosition(PMDAxis.AXIS1, 100000)
+    pmd.Update(PMDAxis.AXIS1)
+    clock.advance(0.1)
+    pmd.SetStopMode(PMDAxis.AXIS1, mode)
+    if update == 'Update':
+        pmd.Update(PMDAxis.AXIS1)
+    else:
+        pmd.MultiUpdate(PMDAxisMask.AXIS1)
+    assert pmd.GetStopMode(PMDAxis.AXIS1) == PMDStopMode.NO_STOP
+    clock.advance(1.0)
+    assert not pmd.GetActivityStatus(PMDAxis.AXIS1).in_motion
+
+
+def test_refresh_shadow(pmd, simulator, records):
+    pmd.shadow = PMDRegisterShadow()
+    simulator.axes[1].velocity = 99
+    pmd.refresh_shadow([PMDAxis.AXIS2])
+    records.clear()
+    assert pmd.GetVelocity(PMDAxis.AXIS2) == 99
+    assert pmd.GetCaptureSource(PMDAxis.AXIS2) == PMDCaptureSource.INDEX
+    assert records == []
+
+
+def test_redundant_set_is_elided(pmd, records):
+    pmd.shadow = PMDRegisterShadow(elide_writes=True)
+    pmd.SetVelocity(PMDAxis.AXIS1, 500)
+    records.clear()
+    pmd.SetVelocity(PMDAxis.AXIS1, 500)
+    assert records == []
+    pmd.SetVelocity(PMDAxis.AXIS1, 501)
+    assert [record.name for record in records] == ['SetVelocity']
+    assert pmd.shadow.elided_writes == 1
+    assert pmd.shadow.elided_writes_by_command == {'SetVelocity': 1}
+
+
+def test_unknown_register_is_written(pmd, records):
+    pmd.shadow = PMDRegisterShadow(elide_writes=True)
+    pmd.SetAcceleration(PMDAxis.AXIS1, 0)
+    assert [record.name for record in records] == ['SetAcceleration']
+
+
+def test_elision_in_batch(pmd, records):
+    pmd.shadow = PMDRegisterShadow(elide_writes=True)
+    pmd.SetPosition(PMDAxis.AXIS1, 10)
+    records.clear()
+    with pmd.batch() as batch:
+        batch.SetPosition(PMDAxis.AXIS1, 10)
+        batch.Update(PMDAxis.AXIS1)
+    assert [record.name for record in records] == ['Update']
+
+
+def test_stop_mode_is_never_elided(pmd, records):
+    pmd.shadow = PMDRegisterShadow(elide_writes=True)
+    for _ in range(2):
+        pmd.SetStopMode(PMDAxis.AXIS1, PMDStopMode.ABRUPT_STOP)
+        pmd.Update(PMDAxis.AXIS1)
+    assert [record.name for record in records] == ['SetStopMode', 'Update'] * 2
+
+
+def test_verify_disables_elision(pmd, records):
+    pmd.shadow = PMDRegisterShadow(verify=True, elide_writes=True)
+    pmd.SetJerk(PMDAxis.AXIS1, 3)
+    pmd.SetJerk(PMDAxis.AXIS1, 3)
+    assert [record.name for record in records] == ['SetJerk', 'SetJerk']
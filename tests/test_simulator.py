@@ -0,0 +1,173 @@
+import pytest
+from PY_Motion.main import *
+from PY_Motion.simulator import *
+from conftest import checksummed
+
+
+@pytest.mark.parametrize('command, arguments', [
+    (PMD_COMMAND_NOOPERATION, ()),
+    (PMD_COMMAND_SETPOSITION, (-123456,)),
+    (PMD_COMMAND_SETVELOCITY, (0x7FFFFFFF,)),
+    (PMD_COMMAND_SETBREAKPOINTVALUE, (1, 100000)),
+    (PMD_COMMAND_MULTIUPDATE, (0x000F,)),
+])
+def test_packets_sum_to_zero(command, arguments):
+    packet = command.build(PMDAxis.AXIS2.value, *arguments)
+    assert len(packet) == command.packet.size
+    assert packet[2:4] == bytes((PMDAxis.AXIS2.value, command.opcode))
+    assert sum(packet) & 0xFF == 0
+
+
+def test_pack_into_matches_build():
+    packet = bytearray(PMD_COMMAND_SETPOSITION.packet.size)
+    PMD_COMMAND_SETPOSITION.pack_into(packet, 0, PMDAxis.AXIS3.value, -5)
+    assert bytes(packet) == PMD_COMMAND_SETPOSITION.build(PMDAxis.AXIS3.value, -5)
+
+
+def test_responses_are_checksummed(simulator):
+    response = simulator.receive(PMD_COMMAND_GETVERSION.build(0))
+    assert len(response) == PMD_COMMAND_GETVERSION.response_length
+    assert response[0] == PMD_NOERROR
+    assert sum(response) & 0xFF == 0
+
+
+def test_bad_checksum_is_rejected(simulator):
+    packet = bytearray(PMD_COMMAND_SETPOSITION.build(0, 1000))
+    packet[-1] ^= 0x01
+    response = simulator.receive(bytes(packet))
+    assert response == checksummed(bytes((PMD_ERROR_BADSERIALCHECKSUM, 0)))
+    assert simulator.axes[0].position == 0
+
+
+def test_unknown_opcode_is_rejected(simulator):
+    assert simulator.receive(checksummed(bytes((0, 0, 0, 0xFE))))[0] == PMD_ERROR_INVALIDINSTRUCTION
+
+
+def test_packets_split_across_writes(simulator):
+    packet = PMD_COMMAND_SETPOSITION.build(0, 1000)
+    assert simulator.receive(packet[:3]) == b''
+    assert simulator.receive(packet[3:]) == checksummed(bytes(2))
+    assert simulator.axes[0].position == 1000
+
+
+def test_command_error_raises(pmd):
+    with pytest.raises(PMDCommandError) as error:
+        pmd.SetBufferStart(0, 10 ** 6)
+    assert error.value.error_code == PMD_ERROR_BLOCKOUTOFBOUNDS
+    assert pmd.GetInstructionError() == PMD_ERROR_BLOCKOUTOFBOUNDS
+
+
+def test_invalid_axis(clock):
+    pmd = PMDAxisInterface()
+    pmd.SetupAxisInterface(PMDSimulatorTransport(MagellanSimulator(number_of_axes=2, clock=clock)))
+    with pytest.raises(PMDCommandError) as error:
+        pmd.GetActualPosition(PMDAxis.AXIS3)
+    assert error.value.error_code == PMD_ERROR_INVALIDAXIS
+    pmd.CloseAxisInterface()
+
+
+def test_timeout_without_response(pmd, simulator, monkeypatch):
+    monkeypatch.setattr(simulator, 'receive', lambda data: b'')
+    pmd._mc.timeout = 0.01
+    with pytest.raises(PMDTimeoutError):
+        pmd.GetVersion()
+
+
+def test_version_and_sample_time(pmd):
+    version = pmd.GetVersion()
+    assert version.number_of_axes == 4
+    assert pmd.GetSampleTime() == 1024
+
+
+def _start_move(pmd, axis, position, mode=PMDProfileMode.TRAPEZOIDAL):
+    pmd.SetProfileMode(axis, mode)
+    pmd.SetPosition(axis, position)
+    pmd.SetVelocity(axis, 10 << 16)
+    pmd.SetAcceleration(axis, 1 << 16)
+    pmd.SetJerk(axis, 1 << 30)
+    pmd.Update(axis)
+
+
+@pytest.mark.parametrize('mode', [PMDProfileMode.TRAPEZOIDAL, PMDProfileMode.S_CURVE])
+def test_move_runs_to_target(pmd, clock, mode):
+    _start_move(pmd, PMDAxis.AXIS1, 5000, mode)
+    clock.advance(0.05)
+    assert pmd.GetActivityStatus(PMDAxis.AXIS1).in_motion
+    assert 0 < pmd.GetCommandedPosition(PMDAxis.AXIS1) < 5000
+    clock.advance(5.0)
+    status = pmd.GetActivityStatus(PMDAxis.AXIS1)
+    assert not status.in_motion and status.axis_settled
+    assert pmd.GetActualPosition(PMDAxis.AXIS1) == 5000
+    assert PMDEventStatus.MOTION_COMPLETE in pmd.GetEventStatus(PMDAxis.AXIS1)
+
+
+def test_trapezoidal_move_duration(pmd, clock, simulator):
+    # 5000 counts at 10 counts/cycle with 1 count/cycle^2: 10 cycles each way and 490 at full speed
+    _start_move(pmd, PMDAxis.AXIS1, 5000)
+    start = simulator.cycles
+    while pmd.GetActivityStatus(PMDAxis.AXIS1).in_motion:
+        clock.advance(simulator.sample_time / 1e6)
+    assert abs(simulator.cycles - start - 510) <= 2
+
+
+def test_reset_event_status(pmd, clock):
+    _start_move(pmd, PMDAxis.AXIS2, 100)
+    clock.advance(1.0)
+    assert PMDEventStatus.MOTION_COMPLETE in pmd.GetEventStatus(PMDAxis.AXIS2)
+    pmd.ResetEventStatus(PMDAxis.AXIS2, ~PMDEventStatus.MOTION_COMPLETE)
+    assert PMDEventStatus.MOTION_COMPLETE not in pmd.GetEventStatus(PMDAxis.AXIS2)
+
+
+def test_velocity_contouring_and_smooth_stop(pmd, clock):
+    pmd.SetProfileMode(PMDAxis.AXIS1, PMDProfileMode.VELOCITY_CONTOURING)
+    pmd.SetVelocity(PMDAxis.AXIS1, -(4 << 16))
+    pmd.SetAcceleration(PMDAxis.AXIS1, 1 << 16)
+    pmd.Update(PMDAxis.AXIS1)
+    clock.advance(0.5)
+    assert pmd.GetCommandedVelocity(PMDAxis.AXIS1) == -(4 << 16)
+    assert pmd.GetActualPosition(PMDAxis.AXIS1) < 0
+    pmd.SetStopMode(PMDAxis.AXIS1, PMDStopMode.SMOOTH_STOP)
+    pmd.Update(PMDAxis.AXIS1)
+    clock.advance(0.5)
+    assert not pmd.GetActivityStatus(PMDAxis.AXIS1).in_motion
+    assert pmd.GetCommandedVelocity(PMDAxis.AXIS1) == 0
+
+
+def test_abrupt_stop(pmd, clock):
+    _start_move(pmd, PMDAxis.AXIS1, 100000)
+    clock.advance(0.1)
+    pmd.SetStopMode(PMDAxis.AXIS1, PMDStopMode.ABRUPT_STOP)
+    pmd.Update(PMDAxis.AXIS1)
+    stopped = pmd.GetActualPosition(PMDAxis.AXIS1)
+    clock.advance(0.5)
+    assert not pmd.GetActivityStatus(PMDAxis.AXIS1).in_motion
+    assert pmd.GetActualPosition(PMDAxis.AXIS1) == stopped < 100000
+
+
+def test_motion_error_event_and_action(pmd, clock):
+    # without loopback the actual position stays behind, so the position error passes the limit
+    pmd.SetEncoderSource(PMDAxis.AXIS1, PMDEncoderSource.INCREMENTAL)
+    pmd.SetPositionErrorLimit(PMDAxis.AXIS1, 100)
+    pmd.SetEventAction(PMDAxis.AXIS1, PMDEvent.MOTION_ERROR, PMDAction.ABRUPT_STOP)
+    _start_move(pmd, PMDAxis.AXIS1, 100000)
+    clock.advance(1.0)
+    assert PMDEventStatus.MOTION_ERROR in pmd.GetEventStatus(PMDAxis.AXIS1)
+    assert not pmd.GetActivityStatus(PMDAxis.AXIS1).in_motion
+    assert pmd.GetCommandedPosition(PMDAxis.AXIS1) < 100000
+
+
+def test_multi_update_starts_axes_together(pmd, clock):
+    with pmd.batch() as batch:
+        for axis, position in ((PMDAxis.AXIS1, 300), (PMDAxis.AXIS3, -300)):
+            batch.SetPosition(axis, position)
+            batch.SetVelocity(axis, 5 << 16)
+            batch.SetAcceleration(axis, 1 << 16)
+        batch.MultiUpdate(PMDAxisMask.AXIS1 | PMDAxisMask.AXIS3)
+    clock.advance(2.0)
+    assert list(pmd.get_actual_positions([PMDAxis.AXIS1, PMDAxis.AXIS2, PMDAxis.AXIS3])) == [300, 0, -300]
+
+
+def test_reset_restores_defaults(pmd, clock):
+    pmd.SetPosition(PMDAxis.AXIS1, 42)
+    pmd.Reset()
+    assert pmd.GetPosition(PMDAxis.AXIS1) == 0
@@ -0,0 +1,51 @@
+import pytest
+from PY_Motion.telemetry import *
+
+
+def test_recorder_sample(pmd, tmp_path):
+    pmd.SetActualPosition(PMDAxis.AXIS2, -7)
+    pmd.SetPosition(PMDAxis.AXIS2, 30)
+    pmd.Update(PMDAxis.AXIS2)
+    axes = (PMDAxis.AXIS1, PMDAxis.AXIS2)
+    recorder = PMDTelemetryRecorder(pmd, str(tmp_path / 'ring'), axes, capacity=4)
+    try:
+        recorder.sample()
+        expected = [
+            value for axis in axes
+            for value in (pmd.GetActualPosition(axis), pmd.GetCommandedPosition(axis), pmd.GetPositionError(axis))
+        ]
+        with PMDTelemetryRing(str(tmp_path / 'ring')) as ring:
+            samples = list(ring.samples())
+            assert ring.channel_names[3] == 'AXIS2.ActualPosition'
+    finally:
+        recorder.close()
+    assert len(samples) == 1
+    assert list(samples[0].values) == expected
+    assert samples[0].values[3] == -7
+
+
+def test_ring_wraps(tmp_path):
+    with PMDTelemetryRing(str(tmp_path / 'ring'), [(PMDAxis.AXIS1, PMD_COMMAND_GETACTUALPOSITION)], 3) as ring:
+        for value in range(5):
+            ring.append(float(value), array('i', [value]))
+        assert ring.count == 5
+        # the slot of the oldest record is the one the writer fills next
+        assert [sample.values for sample in ring.samples()] == [(3,), (4,)]
+        assert [sample.index for sample in ring.samples(start=0)] == [3, 4]
+
+
+def test_reader_skips_the_slot_being_written(tmp_path):
+    with PMDTelemetryRing(str(tmp_path / 'ring'), [(PMDAxis.AXIS1, PMD_COMMAND_GETACTUALPOSITION)], 4) as ring:
+        for value in range(3):
+            ring.append(float(value), array('i', [value]))
+        samples = ring.samples()
+        assert next(samples).index == 0
+        for value in range(3, 5):
+            ring.append(float(value), array('i', [value]))
+        # record 1 shares its slot with record 5, which the writer may already be writing
+        assert [sample.index for sample in samples] == [2, 3, 4]
+
+
+def test_capacity(tmp_path):
+    with pytest.raises(ValueError):
+        PMDTelemetryRing(str(tmp_path / 'ring'), [(PMDAxis.AXIS1, PMD_COMMAND_GETACTUALPOSITION)], 1)
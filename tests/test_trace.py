@@ -0,0 +1,122 @@
+import pytest
+from PY_Motion.main import *
+from PY_Motion.trace import *
+
+CYCLE = 1024e-6  # the simulator's default sample time
+
+
+def elapse(clock, cycles: int) -> None:
+    clock.advance(cycles * CYCLE + 1e-9)
+
+
+def chip_time(capture: PMDTraceCapture) -> list:
+    return list(capture.download().get(PMDAxis.AXIS1, PMDTraceVariable.CHIP_TIME))
+
+
+def test_configure(pmd):
+    variables = [(PMDAxis.AXIS2, PMDTraceVariable.ACTUAL_POSITION), (PMDAxis.AXIS1, PMDTraceVariable.CHIP_TIME)]
+    capture = PMDTraceCapture(pmd, variables, samples=100, period=4, mode=PMDTraceMode.ROLLING_BUFFER)
+    capture.configure()
+    assert pmd.GetBufferLength(PMD_TRACE_BUFFER) == 200
+    assert pmd.GetTracePeriod() == 4
+    assert pmd.GetTraceMode() == PMDTraceMode.ROLLING_BUFFER
+    assert pmd.GetTraceVariable(0) == (PMDAxis.AXIS2, PMDTraceVariable.ACTUAL_POSITION)
+    assert pmd.GetTraceVariable(1) == (PMDAxis.AXIS1, PMDTraceVariable.CHIP_TIME)
+    assert pmd.GetTraceVariable(2)[1] == PMDTraceVariable.NONE
+    assert pmd.GetTraceCount() == 0
+    assert not capture.running
+
+
+def test_variable_count():
+    with pytest.raises(ValueError):
+        PMDTraceCapture(None, [], samples=10)
+    with pytest.raises(ValueError):
+        PMDTraceCapture(None, [(PMDAxis.AXIS1, PMDTraceVariable.CHIP_TIME)] * 5, samples=10)
+
+
+def test_start_on_update(pmd, clock):
+    capture = PMDTraceCapture(pmd, [(PMDAxis.AXIS1, PMDTraceVariable.CHIP_TIME)], samples=1000)
+    capture.configure()
+    capture.start(PMDAxis.AXIS2, PMDTraceCondition.UPDATE)
+    elapse(clock, 10)
+    assert not capture.running
+    assert pmd.GetTraceCount() == 0
+    pmd.Update(PMDAxis.AXIS1)  # another axis does not trigger
+    elapse(clock, 10)
+    assert pmd.GetTraceCount() == 0
+    pmd.Update(PMDAxis.AXIS2)
+    assert capture.running
+    elapse(clock, 10)
+    assert pmd.GetTraceCount() == 10
+
+
+def test_one_time_buffer_stops_when_full(pmd, clock):
+    capture = PMDTraceCapture(pmd, [(PMDAxis.AXIS1, PMDTraceVariable.CHIP_TIME)], samples=8)
+    capture.configure()
+    capture.start()
+    elapse(clock, 20)
+    assert capture.wait(timeout=0)
+    assert PMDTraceStatus.WRAP not in pmd.GetTraceStatus()
+    samples = chip_time(capture)
+    assert len(samples) == 8
+    assert samples == list(range(samples[0], samples[0] + 8))
+    assert pmd.GetTraceCount() == 0
+
+
+def test_rolling_buffer_keeps_the_latest_samples(pmd, simulator, clock):
+    capture = PMDTraceCapture(
+        pmd, [(PMDAxis.AXIS1, PMDTraceVariable.CHIP_TIME)], samples=8, mode=PMDTraceMode.ROLLING_BUFFER
+    )
+    capture.configure()
+    capture.start()
+    started = simulator.cycles
+    elapse(clock, 20)
+    assert not capture.wait(timeout=0)
+    assert PMDTraceStatus.WRAP in pmd.GetTraceStatus()
+    capture.stop()
+    samples = chip_time(capture)
+    assert len(samples) == 8
+    assert samples == list(range(samples[0], samples[0] + 8))  # oldest first across the wraparound
+    assert samples[0] > started + 8  # the first samples were overwritten
+    assert samples[-1] == simulator.cycles
+
+
+def test_period_and_interleaved_variables(pmd, clock):
+    variables = [(PMDAxis.AXIS1, PMDTraceVariable.CHIP_TIME), (PMDAxis.AXIS2, PMDTraceVariable.ACTUAL_POSITION)]
+    capture = PMDTraceCapture(pmd, variables, samples=6, period=3)
+    capture.configure()
+    pmd.SetActualPosition(PMDAxis.AXIS2, 1234)
+    capture.start()
+    elapse(clock, 30)
+    capture.wait(timeout=0)
+    data = capture.download()
+    times = list(data.get(PMDAxis.AXIS1, PMDTraceVariable.CHIP_TIME))
+    assert data.period == 3
+    assert len(times) == 6
+    assert [later - earlier for earlier, later in zip(times, times[1:])] == [3] * 5
+    assert list(data.get(PMDAxis.AXIS2, PMDTraceVariable.ACTUAL_POSITION)) == [1234] * 6
+
+
+def test_trace_running(pmd):
+    capture = PMDTraceCapture(
+        pmd, [(PMDAxis.AXIS1, PMDTraceVariable.CHIP_TIME)], samples=8, mode=PMDTraceMode.ROLLING_BUFFER
+    )
+    capture.configure()
+    capture.start()
+    for change in (
+        lambda: pmd.SetTraceMode(PMDTraceMode.ONE_TIME),
+        lambda: pmd.SetTraceVariable(1, PMDAxis.AXIS1, PMDTraceVariable.CHIP_TIME),
+        lambda: pmd.SetBufferLength(PMD_TRACE_BUFFER, 16),
+    ):
+        with pytest.raises(PMDCommandError) as error:
+            change()
+        assert error.value.error_code == PMD_ERROR_TRACERUNNING
+    capture.configure()  # stops the trace first
+    assert pmd.GetBufferLength(PMD_TRACE_BUFFER) == 8
+
+
+def test_trace_buffer_zero(pmd):
+    with pytest.raises(PMDCommandError) as error:
+        pmd.SetTraceStart(PMDAxis.AXIS1, PMDTraceCondition.IMMEDIATE, 0, PMDTraceState.LOW)
+    assert error.value.error_code == PMD_ERROR_TRACEBUFFERZERO
+    assert PMDTraceStatus.ACTIVE not in pmd.GetTraceStatus()